@@ -0,0 +1,63 @@
+"""
+Автомат-предохранитель для зависимостей, которые могут лечь целиком.
+
+После failure_threshold ошибок подряд предохранитель размыкается и
+reset_timeout секунд отказывает сразу, не трогая зависимость. Затем
+пропускает одну пробную попытку: успех замыкает его, ошибка снова размыкает.
+"""
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+        # Начало пробной попытки; зависшая проба не держит предохранитель разомкнутым дольше reset_timeout
+        self._probe_started: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        now = time.monotonic()
+        if now - self._opened_at < self.reset_timeout:
+            return OPEN
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Можно ли обратиться к зависимости; в полуоткрытом состоянии - одна пробная попытка"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN:
+            self._probe_started = time.monotonic()
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def failure(self):
+        self.failures += 1
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._probe_started = None
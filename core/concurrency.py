@@ -0,0 +1,72 @@
+"""
+Адаптивный лимит одновременных запросов воркера (AIMD).
+
+Когда Postgres замедляется, запросы копятся в ожидании соединения пула и
+задержка растет без предела. Лимит подстраивается под задержку ответов:
+ответ медленнее CONCURRENCY_LATENCY_TARGET уменьшает лимит в
+CONCURRENCY_BACKOFF раз, но не чаще раза за целевую задержку, а быстрый
+ответ при загрузке хотя бы наполовину увеличивает его примерно на единицу за
+limit ответов. Задержка - время до начала ответа, для потоковых ручек это
+время до первой строки.
+
+Классы маршрутов делят один лимит с разной долей: запрос класса принимается,
+пока запросов в работе меньше limit * доля класса. При перегрузке первыми
+отбрасываются админские ручки, затем пользовательские, проверка токенов и
+вход - последними.
+"""
+import time
+from collections import defaultdict
+
+from core.config import settings
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, initial: float, minimum: float, maximum: float, latency_target: float,
+                 backoff: float, shares: dict[str, float]):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.shares = shares
+        self.in_flight = 0
+        self.shed = defaultdict(int)
+        self._decreased_at = 0.0
+
+    def try_acquire(self, route_class: str) -> bool:
+        if self.in_flight >= self.limit * self.shares.get(route_class, 1.0):
+            self.shed[route_class] += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def sample(self, latency: float):
+        """Учесть задержку ответа, принятого лимитером"""
+        now = time.monotonic()
+        if latency > self.latency_target:
+            if now - self._decreased_at >= self.latency_target:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._decreased_at = now
+        elif self.in_flight * 2 >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+concurrency_limiter = AdaptiveConcurrencyLimiter(
+    initial=settings.CONCURRENCY_LIMIT_INITIAL,
+    minimum=settings.CONCURRENCY_LIMIT_MIN,
+    maximum=settings.CONCURRENCY_LIMIT_MAX,
+    latency_target=settings.CONCURRENCY_LATENCY_TARGET,
+    backoff=settings.CONCURRENCY_BACKOFF,
+    shares=settings.CONCURRENCY_CLASS_SHARES,
+)
+
+
+def route_class(path: str) -> str | None:
+    """Класс маршрута по пути; None - запрос не ограничивается"""
+    for pattern, name in settings.CONCURRENCY_ROUTE_CLASSES:
+        if path == pattern or (pattern.endswith("/") and path.startswith(pattern)):
+            return name or None
+    return settings.CONCURRENCY_DEFAULT_CLASS
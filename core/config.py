@@ -6,6 +6,89 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_EXPIRE_MINUTES: int = 15
     REFRESH_EXPIRE_DAYS: int = 7
+    FAST_PATH_ENABLED: bool = True
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 500
+    EXPORT_CHUNK_SIZE: int = 1000
+    IMPORT_BATCH_SIZE: int = 2000
+    IMPORT_HASH_WORKERS: int = 0
+    IMPORT_MAX_ERRORS: int = 1000
+    RBAC_CATALOG_TTL: float = 1.0
+    EVENTS_ENABLED: bool = True
+    EVENTS_CHANNEL: str = "auth_events"
+    EVENTS_PING_INTERVAL: float = 30.0
+    EVENTS_RECONNECT_DELAY: float = 0.5
+    EVENTS_RECONNECT_DELAY_MAX: float = 30.0
+    LOADERS_ENABLED: bool = True
+    LOADER_BATCH_DELAY: float = 0.002
+    LOADER_MAX_BATCH: int = 500
+    ARCHIVE_RETENTION_DAYS: int = 30
+    ARCHIVE_BATCH_SIZE: int = 1000
+    ARCHIVE_INTERVAL_SECONDS: float = 0
+    STATS_SHARDS: int = 8
+    STATS_RECONCILE_INTERVAL_SECONDS: float = 3600
+    CHANGES_PAGE_SIZE_MAX: int = 1000
+    CHANGES_POLL_INTERVAL: float = 5.0
+    CHANGES_RETENTION_DAYS: int = 7
+    PROFILE_BATCH_MAX: int = 500
+    PROFILE_CACHE_TTL: float = 60.0
+    PROFILE_CACHE_MAX_SIZE: int = 100_000
+    GRPC_ENABLED: bool = False
+    GRPC_ADDRESS: str = "0.0.0.0:50051"
+    GRPC_STREAM_CONCURRENCY: int = 16
+    FORWARD_AUTH_CACHE_TTL: float = 2.0
+    FORWARD_AUTH_CACHE_MAX_SIZE: int = 50_000
+    USER_ROLES_CACHE_TTL: float = 60.0
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PATH: str = "/dev/shm/auth_rate_limit"
+    RATE_LIMIT_SLOTS: int = 65536
+    RATE_LIMIT_WINDOW_SECONDS: float = 60.0
+    RATE_LIMIT_USER: int = 600
+    RATE_LIMIT_SESSION: int = 300
+    # Через сколько секунд снова пробовать открыть таблицу лимитов после ошибки
+    RATE_LIMIT_RETRY_SECONDS: float = 30.0
+    # Лимит пользователя по ролям, берется наибольший из его ролей
+    RATE_LIMIT_ROLE_LIMITS: dict[str, int] = {}
+    # Стоимость запроса по "МЕТОД /путь" маршрута, по умолчанию 1
+    RATE_LIMIT_ROUTE_COSTS: dict[str, int] = {
+        "GET /user/export": 20,
+        "POST /user/import": 20,
+        "POST /user/bulk-delete": 10,
+        "GET /user/search": 5,
+        "POST /user/batch": 5,
+    }
+    CONCURRENCY_LIMIT_ENABLED: bool = True
+    CONCURRENCY_LIMIT_INITIAL: float = 50
+    CONCURRENCY_LIMIT_MIN: float = 4
+    CONCURRENCY_LIMIT_MAX: float = 500
+    CONCURRENCY_LATENCY_TARGET: float = 0.5
+    CONCURRENCY_BACKOFF: float = 0.9
+    CONCURRENCY_RETRY_AFTER: int = 1
+    # Путь или префикс на "/" -> класс; пустой класс - без ограничения
+    CONCURRENCY_ROUTE_CLASSES: list[tuple[str, str]] = [
+        ("/changes/stream", ""),
+        ("/auth/", "auth"),
+        ("/user/me", "user"),
+        ("/user/role", "user"),
+        ("/user/batch", "user"),
+    ]
+    CONCURRENCY_DEFAULT_CLASS: str = "admin"
+    # Доля общего лимита, до которой принимаются запросы класса
+    CONCURRENCY_CLASS_SHARES: dict[str, float] = {"auth": 1.0, "user": 0.8, "admin": 0.5}
+    DB_CONNECT_TIMEOUT: float = 5.0
+    DB_BREAKER_FAILURES: int = 3
+    DB_BREAKER_RESET_TIMEOUT: float = 5.0
+    DEGRADED_MODE_ENABLED: bool = True
+    DEGRADED_SNAPSHOT_INTERVAL: float = 30.0
+    # Сколько секунд после последнего обновления снимок годится для проверки токенов
+    DEGRADED_MAX_STALENESS: float = 600.0
+    LATENCY_BUDGETS_ENABLED: bool = True
+    # Бюджеты времени ответа маршрутов, секунды
+    LATENCY_BUDGET_AUTH: float = 2.0
+    LATENCY_BUDGET_USER: float = 0.5
+    LATENCY_BUDGET_ADMIN: float = 5.0
+    # Запас asyncio-таймаута сверх бюджета: одиночный медленный запрос отменяет statement_timeout
+    LATENCY_BUDGET_GRACE: float = 0.1
 
     class Config:
         env_file = ".env"
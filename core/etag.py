@@ -0,0 +1,38 @@
+"""
+Условные GET по ETag.
+
+ETag строится не из тела ответа, а из того, от чего тело зависит: версии каталога
+RBAC, updated_at и id ролей пользователя, параметров запроса. Поэтому совпадение с
+If-None-Match проверяется до запросов в базу и сериализации, и 304 стоит только
+проверки токена.
+"""
+import hashlib
+
+from fastapi import Request, Response
+
+# Ответы зависят от токена: общие кеши их не хранят, клиент обязан перепроверять ETag
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из значений, от которых зависит ответ"""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match сравнивает слабо: W/"x" совпадает с "x"
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def cache_headers(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+
+
+def not_modified(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
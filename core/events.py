@@ -0,0 +1,137 @@
+"""
+Шина событий между воркерами поверх Postgres LISTEN/NOTIFY.
+
+Репозитории публикуют события через publish в своей транзакции, поэтому NOTIFY
+доставляется только после коммита и пропадает вместе с откатом. Каждый воркер
+держит одно отдельное соединение с LISTEN и раздает события подписчикам.
+Пока соединения нет, события теряются, поэтому после каждого (пере)подключения
+подписчики получают RESYNC и должны сбросить все, что держат в памяти.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from enum import Enum
+from typing import Callable, Iterable
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY ограничивает payload 8000 байтами, длинные списки id заменяются на "все"
+MAX_EVENT_IDS = 100
+
+
+class EventType(str, Enum):
+    SESSION_REVOKED = "session.revoked"
+    USER_UPDATED = "user.updated"
+    USER_DELETED = "user.deleted"
+    RBAC_CHANGED = "rbac.changed"
+    CHANGES = "changes"
+    RESYNC = "resync"
+
+
+class Event:
+    __slots__ = ("type", "ids", "origin")
+
+    def __init__(self, type: EventType, ids: list[str] | None = None, origin: str | None = None):
+        self.type = type
+        # None значит "все объекты этого типа"
+        self.ids = ids
+        self.origin = origin
+
+    def concerns(self, object_id) -> bool:
+        return self.ids is None or str(object_id) in self.ids
+
+
+async def publish(db: AsyncSession, event_type: EventType, ids: Iterable | None = None):
+    """Отправить событие в транзакции сессии, подписчики получат его после коммита"""
+    if not settings.EVENTS_ENABLED:
+        return
+    ids = [str(object_id) for object_id in ids] if ids is not None else None
+    if ids is not None and len(ids) > MAX_EVENT_IDS:
+        ids = None
+    payload = json.dumps({"type": event_type.value, "ids": ids, "origin": event_bus.origin},
+                         separators=(",", ":"))
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                     {"channel": settings.EVENTS_CHANNEL, "payload": payload})
+
+
+class EventBus:
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._handlers: dict[EventType, list[Callable]] = {}
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, event_type: EventType, handler: Callable[[Event], None]):
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    async def start(self):
+        if self._task is None and settings.EVENTS_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def dispatch(self, event: Event):
+        for handler in self._handlers.get(event.type, ()):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Ошибка обработчика события %s", event.type.value)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+            event = Event(type=EventType(data["type"]), ids=data.get("ids"), origin=data.get("origin"))
+        except (ValueError, KeyError):
+            logger.warning("Некорректное событие: %s", payload)
+            return
+        self.dispatch(event)
+
+    async def _run(self):
+        dsn = make_url(settings.POSTGRES_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        delay = settings.EVENTS_RECONNECT_DELAY
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, self._on_notify)
+
+                # Пока слушателя не было, события могли пропасть
+                self.dispatch(Event(type=EventType.RESYNC, origin=self.origin))
+                delay = settings.EVENTS_RECONNECT_DELAY
+
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=settings.EVENTS_PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(connection.execute("SELECT 1"),
+                                               timeout=settings.EVENTS_PING_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning("Соединение шины событий потеряно: %s", e)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.EVENTS_RECONNECT_DELAY_MAX)
+
+
+event_bus = EventBus(channel=settings.EVENTS_CHANNEL)
@@ -0,0 +1,98 @@
+"""
+Бюджеты времени ответа маршрутов.
+
+Бюджет объявляется на роутере (route_class=budgeted_route(секунды)) и
+переопределяется на ручке декоратором @latency_budget(секунды), None - без
+бюджета. Он действует в двух местах:
+  - get_db ставит statement_timeout транзакций сессии запроса равным бюджету,
+    и медленный запрос отменяет сама база: 503;
+  - обработчик маршрута целиком, с зависимостями, ограничен бюджетом плюс
+    LATENCY_BUDGET_GRACE через asyncio.timeout: 504.
+Ответы 503/504 - исключения HTTPException, а не готовый ответ: так get_db
+откатывает недоделанную транзакцию, а не коммитит ее.
+Так админский запрос без фильтров не держит соединение пула дольше своего
+бюджета и не отнимает его у проверки токенов. Потоковые ответы ограничены
+только до начала ответа. Превышения считаются по маршрутам в памяти воркера.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Callable
+
+import asyncpg
+from fastapi import Request, HTTPException
+from fastapi.routing import APIRoute
+
+from core.config import settings
+
+TIMEOUT = "timeout"
+STATEMENT_TIMEOUT = "statement_timeout"
+
+# "МЕТОД /путь" -> вид превышения -> число
+violations: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def latency_budget(seconds: float | None):
+    """Бюджет ручки вместо бюджета роутера"""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.latency_budget = seconds
+        return endpoint
+    return decorator
+
+
+def is_statement_timeout(exc: BaseException | None) -> bool:
+    """Отменен ли запрос по statement_timeout, с учетом цепочки обернувших ошибку исключений"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, asyncpg.QueryCanceledError):
+            return True
+        if getattr(getattr(exc, "orig", None), "sqlstate", None) == asyncpg.QueryCanceledError.sqlstate:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def route_budget(request: Request) -> float | None:
+    if not settings.LATENCY_BUDGETS_ENABLED:
+        return None
+    return getattr(request.scope.get("route"), "latency_budget", None)
+
+
+class BudgetRoute(APIRoute):
+    default_budget: float | None = None
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # get_route_handler вызывается из конструктора APIRoute, бюджет нужен раньше
+        self.latency_budget = getattr(endpoint, "latency_budget", self.default_budget)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        budget = self.latency_budget
+        if budget is None or not settings.LATENCY_BUDGETS_ENABLED:
+            return handler
+        key = f"{','.join(sorted(self.methods))} {self.path}"
+
+        async def handler_with_budget(request: Request):
+            timeout = asyncio.timeout(budget + settings.LATENCY_BUDGET_GRACE)
+            try:
+                async with timeout:
+                    return await handler(request)
+            except TimeoutError:
+                if not timeout.expired():
+                    raise
+                violations[key][TIMEOUT] += 1
+                raise HTTPException(status_code=504, detail="Превышено время обработки запроса")
+            except Exception as e:
+                if not is_statement_timeout(e):
+                    raise
+                violations[key][STATEMENT_TIMEOUT] += 1
+                raise HTTPException(status_code=503, detail="Запрос к базе превысил бюджет времени",
+                                    headers={"Retry-After": "1"}) from e
+
+        return handler_with_budget
+
+
+def budgeted_route(seconds: float | None) -> type[BudgetRoute]:
+    """Класс маршрутов роутера с бюджетом по умолчанию"""
+    return type("BudgetRoute", (BudgetRoute,), {"default_budget": seconds})
@@ -0,0 +1,242 @@
+"""
+ASGI-мидлвари поверх стека FastAPI.
+
+ConcurrencyLimitMiddleware держит число запросов в работе в пределах
+адаптивного лимита и сразу отвечает 503 с Retry-After на лишние, не пуская
+их в очередь за соединениями пула.
+
+ResponseHeadersMiddleware добавляет к ответу заголовки, которые зависимости
+оставили в scope запроса (RateLimit-*, X-Auth-Degraded): ручки возвращают
+готовые Response, и заголовки из зависимостей в них не попадают.
+
+ForwardAuthMiddleware обслуживает /auth/verify для nginx auth_request и
+Traefik ForwardAuth. Прокси спрашивает его на каждый запрос к своим
+приложениям, поэтому ответ собирается без роутинга, дерева зависимостей,
+мидлвари ошибок и JSON: только заголовки и код 200/401/403. Сессия базы
+открывается лишь при промахе кеша вердиктов. Кеш живет FORWARD_AUTH_CACHE_TTL
+секунд, ключ - дайджест токена и требуемого права, одинаковые промахи,
+пришедшие одновременно, ждут один запрос в базу. Отзыв сессий, изменения
+пользователей и RBAC сбрасывают кеш по событиям шины.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.concurrency import concurrency_limiter, route_class
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from core.responses import dumps
+from database import db_breaker, is_db_unavailable
+from core.ttl_cache import TTLCache
+from exceptions.custom_exceptions import UnauthorizedException
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.session_repo import SessionRepository
+from repositories.user_repo import UserRepository
+from services.auth_service import AuthService
+from services.rbac_catalog import rbac_catalog
+from services.session_snapshot import session_snapshot
+
+logger = logging.getLogger(__name__)
+
+FORWARD_AUTH_PATH = "/auth/verify"
+# Права через запятую, нужны все
+PERMISSION_HEADER = b"x-required-permission"
+
+Verdict = tuple[int, list[tuple[bytes, bytes]]]
+
+_UNAUTHORIZED: Verdict = (401, [(b"www-authenticate", b"Bearer")])
+
+verdicts = TTLCache(ttl=settings.FORWARD_AUTH_CACHE_TTL, max_size=settings.FORWARD_AUTH_CACHE_MAX_SIZE)
+
+
+def _invalidate(event: Event):
+    # Ключи кеша - дайджесты токенов, по id пользователя их не найти
+    verdicts.invalidate()
+
+
+for _event_type in (EventType.SESSION_REVOKED, EventType.USER_UPDATED, EventType.USER_DELETED,
+                    EventType.RBAC_CHANGED, EventType.RESYNC):
+    event_bus.subscribe(_event_type, _invalidate)
+
+
+def _header(scope, name: bytes) -> bytes | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def _bearer_token(authorization: bytes | None) -> str | None:
+    if not authorization:
+        return None
+    parts = authorization.split(b" ")
+    if len(parts) != 2 or parts[0].lower() != b"bearer" or not parts[1]:
+        return None
+    return parts[1].decode("latin-1")
+
+
+class _LookupAborted(Exception):
+    """Ведущая проверка токена отменена, не дав вердикта"""
+
+
+class ForwardAuthMiddleware:
+    def __init__(self, app, session_factory: Callable[[], AsyncSession]):
+        self.app = app
+        self.session_factory = session_factory
+        self._inflight: dict[bytes, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != FORWARD_AUTH_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        # Метод не проверяется: nginx auth_request повторяет метод исходного запроса
+        status, headers = await self._verdict(_bearer_token(_header(scope, b"authorization")),
+                                              _header(scope, PERMISSION_HEADER) or b"")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": headers + [(b"content-length", b"0"), (b"cache-control", b"no-store")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _verdict(self, token: str | None, permissions: bytes) -> Verdict:
+        if token is None:
+            return _UNAUTHORIZED
+
+        key = hashlib.blake2b(token.encode() + b"\x1f" + permissions, digest_size=16).digest()
+        found, _ = verdicts.get_many((key,))
+        if key in found:
+            return found[key]
+
+        # Ведущую проверку могут отменить, если прокси закрыл соединение: тогда проверяет ожидающий
+        while (pending := self._inflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(pending)
+            except _LookupAborted:
+                pass
+
+        pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+        generation = verdicts.generation
+        verdict = None
+        try:
+            verdict = await self._check(token, [name.strip() for name in permissions.decode().split(",")
+                                                if name.strip()])
+        except Exception as e:
+            # Ошибка не кешируется, ожидающие того же ключа получают ее вердикт
+            if is_db_unavailable(e):
+                verdict = (503, [(b"retry-after", str(max(1, round(db_breaker.retry_after()))).encode())])
+            else:
+                logger.exception("Ошибка forward-auth")
+                verdict = (500, [])
+        else:
+            verdicts.put_many({key: verdict}, generation)
+        finally:
+            del self._inflight[key]
+            # Ожидающие не должны зависнуть, даже если этот запрос отменили
+            if not pending.done():
+                if verdict is not None:
+                    pending.set_result(verdict)
+                else:
+                    pending.set_exception(_LookupAborted())
+                    # Без ожидающих исключение никто не заберет, asyncio не должен о нем предупреждать
+                    pending.exception()
+        return verdict
+
+    async def _check(self, token: str, permission_names: list[str]) -> Verdict:
+        async with self.session_factory() as db:
+            auth = AuthService(SessionRepository(db), UserRepository(db))
+            try:
+                user, session = await auth.get_current_user(token)
+            except UnauthorizedException:
+                return _UNAUTHORIZED
+
+            if auth.degraded:
+                # База недоступна: права и роли из снимка сессий
+                if not all(session_snapshot.has_permission(user.id, rbac_catalog.grant_ids(name))
+                           for name in permission_names):
+                    return 403, [(b"x-auth-degraded", b"1")]
+                role_ids = session_snapshot.role_ids.get(user.id, [])
+            else:
+                role_perm_repo = RolePermissionRepository(db)
+                if permission_names:
+                    granted = await rbac_catalog.check_user(role_perm_repo, user.id, permission_names)
+                    if not all(granted.values()):
+                        return 403, []
+                else:
+                    await rbac_catalog.refresh(role_perm_repo)
+                role_ids = await role_perm_repo.get_user_role_ids(user.id)
+
+        roles = ",".join(sorted(rbac_catalog.roles_by_id[role_id].name
+                                for role_id in role_ids if role_id in rbac_catalog.roles_by_id))
+        return 200, [
+            (b"x-auth-user-id", str(user.id).encode()),
+            (b"x-auth-user-email", user.email.encode()),
+            (b"x-auth-session-id", str(session.id).encode()),
+            (b"x-auth-roles", roles.encode()),
+        ] + ([(b"x-auth-degraded", b"1")] if auth.degraded else [])
+
+
+class ResponseHeadersMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                extra = scope.get("response_headers")
+                if extra:
+                    present = {name for name, _ in message.get("headers", ())}
+                    message["headers"] = list(message.get("headers", ())) + [
+                        (name.lower().encode(), value.encode()) for name, value in extra.items()
+                        if name.lower().encode() not in present
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.CONCURRENCY_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not concurrency_limiter.try_acquire(name):
+            body = dumps({"detail": "Сервер перегружен, повторите запрос позже"})
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(settings.CONCURRENCY_RETRY_AFTER).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        started = time.monotonic()
+        sampled = False
+
+        async def send_sampled(message):
+            nonlocal sampled
+            if message["type"] == "http.response.start" and not sampled:
+                sampled = True
+                concurrency_limiter.sample(time.monotonic() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_sampled)
+        finally:
+            if not sampled:
+                concurrency_limiter.sample(time.monotonic() - started)
+            concurrency_limiter.release()
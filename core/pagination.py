@@ -0,0 +1,43 @@
+"""
+Непрозрачные курсоры для keyset-пагинации.
+
+Курсор хранит ключ последней отданной строки, например (created_at, id), следующая
+страница читается условием "ключ > курсора" по индексу, поэтому глубокие страницы
+стоят столько же, сколько первая.
+"""
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+
+def encode_cursor(*values) -> str:
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append(["dt", value.isoformat()])
+        elif isinstance(value, UUID):
+            payload.append(["uuid", str(value)])
+        else:
+            payload.append(["raw", value])
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = []
+        for kind, value in payload:
+            if kind == "dt":
+                values.append(datetime.fromisoformat(value))
+            elif kind == "uuid":
+                values.append(UUID(value))
+            else:
+                values.append(value)
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор")
+    if len(values) != size:
+        raise ValueError("Некорректный курсор")
+    return tuple(values)
@@ -0,0 +1,57 @@
+"""
+Сопоставление имен прав с шаблонами.
+
+Имя права разбивается на сегменты по "." и ":", например "user.add_role:start"
+дает user / .add_role / :start. Сегмент "*" в выданном праве совпадает с любым
+одним сегментом с тем же разделителем: "user:*" покрывает "user:get" и
+"user:get_all", "user.*:start" покрывает "user.add_role:start".
+
+Шаблоны компилируются в префиксное дерево, поиск идет по сегментам проверяемого
+имени и на каждом уровне смотрит не больше двух веток: точную и "*".
+"""
+import re
+from typing import Iterable
+
+WILDCARD = "*"
+
+_SEGMENT = re.compile(r"([.:]?)([^.:]*)")
+
+
+def split_permission(name: str) -> list[str]:
+    """Сегменты имени права вместе с разделителем перед ними"""
+    return [separator + word for separator, word in _SEGMENT.findall(name) if separator or word]
+
+
+class PermissionTrie:
+    __slots__ = ("_root",)
+
+    def __init__(self, grants: Iterable[tuple[str, object]] = ()):
+        # Узел: {сегмент: узел}, значения листа лежат под ключом None
+        self._root: dict = {}
+        for name, value in grants:
+            self.add(name, value)
+
+    def add(self, name: str, value=True):
+        node = self._root
+        for segment in split_permission(name):
+            node = node.setdefault(segment, {})
+        node.setdefault(None, []).append(value)
+
+    def match(self, name: str) -> list:
+        """Значения всех выданных прав и шаблонов, покрывающих name"""
+        nodes = [self._root]
+        for segment in split_permission(name):
+            wildcard = (segment[0] if segment[0] in ".:" else "") + WILDCARD
+            next_nodes = []
+            for node in nodes:
+                if segment in node:
+                    next_nodes.append(node[segment])
+                if wildcard != segment and wildcard in node:
+                    next_nodes.append(node[wildcard])
+            if not next_nodes:
+                return []
+            nodes = next_nodes
+        return [value for node in nodes for value in node.get(None, ())]
+
+    def covers(self, name: str) -> bool:
+        return bool(self.match(name))
@@ -0,0 +1,202 @@
+"""
+Ограничение частоты запросов по GCRA в общей памяти воркеров хоста.
+
+Состояние ключа - одно число, TAT (theoretical arrival time): момент, когда
+корзина ключа снова будет полной. Запрос стоимостью cost сдвигает TAT на
+cost * window / limit и разрешен, если TAT опережает текущее время не больше
+чем на window. Время целое, в наносекундах, а интервал округляется вниз: limit
+интервалов не превышают window, и полная пачка из limit запросов проходит без
+погрешностей float на абсолютном времени. Таблица ключей лежит в файле, отображенном в память
+(по умолчанию в /dev/shm), и общая для всех процессов uvicorn на хосте:
+открытая адресация с короткой цепочкой проб, ключ - 8 байт хеша. Ключ с TAT
+в прошлом равен новому ключу, поэтому его слот можно отдать другому, а при
+переполнении цепочки вытесняется слот с самым ранним TAT. Операция целиком
+выполняется под fcntl-блокировкой файла, без await внутри.
+
+Блокировка берется на цикле событий, поэтому без ожидания: внутри нее только
+до _PROBES чтений слотов на ключ и запись в память, без системных вызовов, и
+держатель отпускает ее за микросекунды. Если блокировку не удалось взять за
+_LOCK_ATTEMPTS попыток (держателя вытеснил планировщик), запрос пропускается
+без лимита, а не ждет.
+
+В заголовке файла - счетчики отклоненных запросов по видам ключей, общие для хоста.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+
+from core.config import settings
+
+_MAGIC = b"GCRA0002"
+_HEADER = struct.Struct("<8sQ")
+_COUNTERS_OFFSET = 16
+_HEADER_SIZE = 64
+_SLOT = struct.Struct("<Qq")
+_PROBES = 16
+_NS = 1_000_000_000
+_LOCK_ATTEMPTS = 8
+_LOCK_BACKOFF = 0.00005
+
+# Виды ключей, по которым ведутся счетчики отклоненных запросов
+KINDS = ("user", "session")
+_COUNTER = struct.Struct("<Q")
+
+
+class RateLimitCheck:
+    __slots__ = ("kind", "key", "limit", "window", "cost")
+
+    def __init__(self, kind: str, key: bytes, limit: int, window: float, cost: int = 1):
+        self.kind = kind
+        self.key = key
+        self.limit = limit
+        self.window = window
+        self.cost = cost
+
+
+class RateLimitDecision:
+    __slots__ = ("allowed", "limit", "window", "remaining", "reset", "retry_after", "kind")
+
+    def __init__(self, allowed: bool, limit: int, window: float, remaining: int, reset: float,
+                 retry_after: float = 0.0, kind: str | None = None):
+        self.allowed = allowed
+        self.limit = limit
+        self.window = window
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+        self.kind = kind
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+            "RateLimit-Policy": f"{self.limit};w={math.ceil(self.window)}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _key_hash(key: bytes) -> int:
+    # 0 - пустой слот
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") | 1
+
+
+class SharedRateLimiter:
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._fd: int | None = None
+        self._map: mmap.mmap | None = None
+        self._pid: int | None = None
+
+    def _open(self):
+        """Открыть таблицу в текущем процессе; после fork - заново"""
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Раз на процесс; ждет только процесс, который в этот момент создает таблицу
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size >= _HEADER_SIZE:
+                    magic, slots = _HEADER.unpack(os.pread(fd, _HEADER.size, 0))
+                else:
+                    magic, slots = None, 0
+                if magic != _MAGIC:
+                    # Первый процесс на хосте создает таблицу, остальные берут ее размер из заголовка
+                    slots = self.slots
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, _HEADER_SIZE + slots * _SLOT.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, slots), 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            table = mmap.mmap(fd, _HEADER_SIZE + slots * _SLOT.size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._map = table
+        self.slots = slots
+        self._pid = os.getpid()
+
+    def _find_slot(self, key_hash: int, now: int, taken) -> tuple[int, int]:
+        """Смещение слота ключа и его TAT; для нового ключа - свободный или вытесняемый слот"""
+        table = self._map
+        start = key_hash % self.slots
+        free_offset, oldest_offset, oldest_tat = None, None, math.inf
+        for probe in range(_PROBES):
+            offset = _HEADER_SIZE + (start + probe) % self.slots * _SLOT.size
+            slot_hash, tat = _SLOT.unpack_from(table, offset)
+            if slot_hash == key_hash:
+                return offset, tat
+            if offset in taken:
+                continue
+            if free_offset is None and (slot_hash == 0 or tat <= now):
+                free_offset = offset
+            if tat < oldest_tat:
+                oldest_offset, oldest_tat = offset, tat
+        return (free_offset if free_offset is not None else oldest_offset), 0
+
+    def _try_lock(self) -> bool:
+        for attempt in range(_LOCK_ATTEMPTS):
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except (BlockingIOError, PermissionError):
+                # Ожидание ограничено: в сумме меньше _LOCK_ATTEMPTS ** 2 * _LOCK_BACKOFF / 2
+                time.sleep(_LOCK_BACKOFF * attempt)
+        return False
+
+    def acquire(self, checks: list[RateLimitCheck]) -> RateLimitDecision | None:
+        """
+        Списать стоимость запроса со всех ключей или ни с одного.
+        Возвращает решение по самому строгому ключу; None, если таблица занята.
+        """
+        self._open()
+        now = time.time_ns()
+        if not self._try_lock():
+            return None
+        try:
+            updates, decision = {}, None
+            for check in checks:
+                key_hash = _key_hash(check.key)
+                offset, tat = self._find_slot(key_hash, now, updates.keys())
+                window = round(check.window * _NS)
+                interval = max(1, window // check.limit)
+                new_tat = max(tat, now) + interval * check.cost
+                ahead = new_tat - now
+                if ahead > window:
+                    self._count(check.kind)
+                    return RateLimitDecision(False, check.limit, check.window, 0, (max(tat, now) - now) / _NS,
+                                             retry_after=(ahead - window) / _NS, kind=check.kind)
+
+                remaining = (window - ahead) // interval
+                if decision is None or remaining < decision.remaining:
+                    decision = RateLimitDecision(True, check.limit, check.window, remaining, ahead / _NS,
+                                                 kind=check.kind)
+                updates[offset] = (key_hash, new_tat)
+
+            for offset, (key_hash, new_tat) in updates.items():
+                _SLOT.pack_into(self._map, offset, key_hash, new_tat)
+            return decision
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _count(self, kind: str):
+        offset = _COUNTERS_OFFSET + KINDS.index(kind) * _COUNTER.size
+        _COUNTER.pack_into(self._map, offset, _COUNTER.unpack_from(self._map, offset)[0] + 1)
+
+    def throttled(self) -> dict[str, int]:
+        """Отклоненные запросы по видам ключей, по всем воркерам хоста с создания таблицы"""
+        self._open()
+        return {kind: _COUNTER.unpack_from(self._map, _COUNTERS_OFFSET + i * _COUNTER.size)[0]
+                for i, kind in enumerate(KINDS)}
+
+
+rate_limiter = SharedRateLimiter(settings.RATE_LIMIT_PATH, settings.RATE_LIMIT_SLOTS)
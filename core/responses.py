@@ -0,0 +1,45 @@
+"""
+Сериализация ответов в байты без jsonable_encoder.
+
+Роуты возвращают FastJSONResponse с сущностями внутри, энкодер сам обходит вложенные
+сущности через их to_public. Используется orjson, если он установлен, иначе stdlib json.
+"""
+import json
+from datetime import date, datetime, time
+from enum import Enum
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+from entities.entities import EntityBase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, EntityBase):
+        return value.to_public()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(content) -> bytes:
+    """Сериализовать ответ в JSON-байты"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,52 @@
+"""
+Кеш в памяти процесса с TTL и ограничением размера.
+
+Значения живут не дольше ttl секунд, при переполнении вытесняются давно не
+читанные. Чтение, начатое до инвалидации, не должно положить в кеш старые
+данные после нее, поэтому запись принимает поколение, взятое до запроса в
+базу, и отбрасывается, если с тех пор была инвалидация.
+"""
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.generation = 0
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+
+    def get_many(self, keys: Iterable[Hashable]) -> tuple[dict, list]:
+        """Найденные значения и ключи, которых нет в кеше или которые устарели"""
+        now = time.monotonic()
+        found, misses = {}, []
+        for key in keys:
+            item = self._data.get(key, MISSING)
+            if item is not MISSING and item[0] > now:
+                found[key] = item[1]
+                self._data.move_to_end(key)
+            else:
+                misses.append(key)
+        return found, misses
+
+    def put_many(self, items: dict, generation: int):
+        if generation != self.generation or self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        for key, value in items.items():
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable] | None = None):
+        self.generation += 1
+        if keys is None:
+            self._data.clear()
+            return
+        for key in keys:
+            self._data.pop(key, None)
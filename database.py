@@ -1,15 +1,148 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+import logging
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import text, event
+from sqlalchemy.exc import DBAPIError, InterfaceError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncConnection
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from core.circuit_breaker import CircuitBreaker
 from core.config import settings
+from exceptions.custom_exceptions import DatabaseUnavailableError
+
+logger = logging.getLogger(__name__)
 
-engine = create_async_engine(settings.POSTGRES_URL, future=True, echo=True)
+engine = create_async_engine(settings.POSTGRES_URL, future=True, echo=True,
+                             connect_args={"timeout": settings.DB_CONNECT_TIMEOUT})
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
+# Предохранитель на подключения к базе: пока она лежит, новые соединения не
+# открываются, запросы сразу получают DatabaseUnavailableError
+db_breaker = CircuitBreaker(settings.DB_BREAKER_FAILURES, settings.DB_BREAKER_RESET_TIMEOUT)
+
+
+@event.listens_for(engine.sync_engine, "do_connect")
+def _connect_through_breaker(dialect, connection_record, cargs, cparams):
+    if not db_breaker.allow():
+        raise DatabaseUnavailableError("База данных недоступна")
+    try:
+        connection = dialect.connect(*cargs, **cparams)
+    except Exception:
+        db_breaker.failure()
+        raise
+    db_breaker.success()
+    return connection
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _count_disconnects(context):
+    # Оборванные соединения пула: база упала при открытых соединениях
+    if context.is_disconnect:
+        db_breaker.failure()
+
+
+async def invalidate_if_disconnected(connection: AsyncConnection, exc: BaseException):
+    """Для запросов на сыром соединении asyncpg: оборванное соединение убрать из пула и учесть в предохранителе"""
+    if is_db_unavailable(exc):
+        db_breaker.failure()
+        await connection.invalidate(exc)
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    # SET LOCAL действует до конца транзакции, поэтому ставится в начале каждой
+    timeout_ms = session.info.get("statement_timeout_ms")
+    if timeout_ms:
+        connection.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                           {"timeout": f"{timeout_ms}ms"})
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], None]):
+    """Вызвать callback после коммита транзакции сессии, при откате он отбрасывается"""
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session):
+    for callback in session.info.pop("after_commit", ()):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session):
+    session.info.pop("after_commit", None)
+
+
+def is_db_unavailable(exc: BaseException | None) -> bool:
+    """Вызвана ли ошибка недоступностью базы, с учетом цепочки обернувших ее исключений"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (DatabaseUnavailableError, OSError, InterfaceError, asyncpg.InterfaceError,
+                            asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError)):
+            return True
+        if isinstance(exc, DBAPIError) and exc.connection_invalidated:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+# Триграммные GIN-индексы для поиска подстроки через ILIKE, нужны расширению pg_trgm
+SEARCH_INDEXES = {
+    "ix_users_email_trgm": ("users", "email"),
+    "ix_users_first_name_trgm": ("users", "first_name"),
+    "ix_users_last_name_trgm": ("users", "last_name"),
+    "ix_users_patronymic_trgm": ("users", "patronymic"),
+}
+
+
+def sync_search_indexes(connection) -> bool:
+    """Включить pg_trgm и создать индексы поиска; без расширения поиск работает, но без индексов"""
+    available = connection.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar()
+    if not available:
+        return False
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, (table, column) in SEARCH_INDEXES.items():
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+                ))
+    except DBAPIError as e:
+        logger.warning("Индексы поиска не созданы: %s", e)
+        return False
+    return True
+
+
+def sync_schema(connection):
+    """Создать недостающие таблицы и индексы, в том числе индексы, добавленные в уже существующие таблицы"""
+    Base.metadata.create_all(connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    sync_search_indexes(connection)
+
 import inspect
 
-async def get_db():
+from fastapi import Request
+
+from core.latency_budget import route_budget
+
+# Методы без изменений: пока база лежит, их пробуют обслужить, например по снимку сессий
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+async def get_db(request: Request):
+    # Пишущие запросы при разомкнутом предохранителе отказывают сразу, не дожидаясь ошибки
+    if request.method not in SAFE_METHODS and db_breaker.is_open:
+        raise DatabaseUnavailableError("База данных недоступна")
     async with AsyncSessionLocal() as session:
+        budget = route_budget(request)
+        if budget is not None:
+            # Запросы сессии укладываются в бюджет маршрута, см. core/latency_budget.py
+            session.info["statement_timeout_ms"] = max(1, int(budget * 1000))
         print("DB called from:", inspect.stack()[1].function)
         try:
             yield session
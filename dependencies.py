@@ -1,15 +1,26 @@
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_db, db_breaker, is_db_unavailable
 from entities.entities import CurrentUser
 from services.auth_service import AuthService
 from repositories.user_repo import UserRepository
 from repositories.session_repo import SessionRepository
 from repositories.role_perm_repo import RolePermissionRepository
 from exceptions.custom_exceptions import UnauthorizedException, UserNotHaveRoles
-from services.role_service import RolePermissionService
-from services.user_service import UserService
+from services.rbac_catalog import rbac_catalog
+from services.rate_limit_service import RateLimitService
+from services.session_snapshot import session_snapshot
+
+
+def db_unavailable() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="База данных недоступна",
+                         headers={"Retry-After": str(max(1, round(db_breaker.retry_after())))})
+
+
+def add_response_headers(request: Request, headers: dict[str, str]):
+    """Заголовки, которые ResponseHeadersMiddleware добавит к ответу на запрос"""
+    request.scope.setdefault("response_headers", {}).update(headers)
 
 
 async def extract_token(authorization: str) -> str:
@@ -21,39 +32,61 @@ async def extract_token(authorization: str) -> str:
     return parts[1]
 
 
-async def get_current_user(authorization: str = Header(...), db: AsyncSession = Depends(get_db)):
+async def get_current_user(request: Request, authorization: str = Header(...), db: AsyncSession = Depends(get_db)):
     try:
         token = await extract_token(authorization)
         service = AuthService(SessionRepository(db), UserRepository(db))
 
         user , session = await service.get_current_user(token)
-        result = CurrentUser(user=user, session=session)
-        return result
+        result = CurrentUser(user=user, session=session, degraded=service.degraded)
     except UnauthorizedException as e:
         raise HTTPException(status_code=401, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_db_unavailable(e):
+            raise db_unavailable()
         raise HTTPException(status_code=500, detail=str(e))
 
+    if result.degraded:
+        add_response_headers(request, {"X-Auth-Degraded": "1"})
+
+    await enforce_rate_limit(request, result, db)
+    return result
+
+
+async def enforce_rate_limit(request: Request, current: CurrentUser, db: AsyncSession):
+    """Лимит запросов на пользователя и сессию: 429 или заголовки RateLimit-* в ответ"""
+    route = request.scope.get("route")
+    route_key = f"{request.method} {route.path if route is not None else request.url.path}"
+    decision = await RateLimitService(RolePermissionRepository(db)).check(current.user, current.session, route_key,
+                                                                         degraded=current.degraded)
+    if decision is None:
+        return
+    if not decision.allowed:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Слишком много запросов", headers=decision.headers())
+    add_response_headers(request, decision.headers())
+
+
 def get_permission_user(permission_name: str):
     async def dependency(
-            authorization: str = Header(...),
+            current: CurrentUser = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
             ):
-        token = await extract_token(authorization)
-        auth_service = AuthService(SessionRepository(db), UserRepository(db))
-        user , session = await auth_service.get_current_user(token)
-
-        user_service = UserService(UserRepository(db), RolePermissionRepository(db))
-        user_with_roles = await user_service.get_user_roles(user)
-
-        permission_service = RolePermissionService(RolePermissionRepository(db))
-        roles_with_permissions = await permission_service.get_roles(
-            ids=[role.id for role in user_with_roles.roles]
-        )
-
-        user_permissions = {p.name for r in roles_with_permissions for p in r.permissions}
+        # get_current_user кешируется на запрос: токен проверяется и лимит списывается один раз
+        user = current.user
+        if current.degraded:
+            # База недоступна: каталог и права из памяти, без сверки версии
+            grant_ids = rbac_catalog.grant_ids(permission_name)
+            allowed = bool(grant_ids) and session_snapshot.has_permission(user.id, grant_ids)
+        else:
+            role_perm_repo = RolePermissionRepository(db)
+            await rbac_catalog.refresh(role_perm_repo)
+            grant_ids = rbac_catalog.grant_ids(permission_name)
+            allowed = bool(grant_ids) and await role_perm_repo.has_permission(user.id, grant_ids)
 
-        if permission_name not in user_permissions:
+        if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Недостаточно прав"
@@ -1,28 +1,110 @@
 from datetime import datetime
+from types import UnionType
 from uuid import UUID
-from typing import Any
+from typing import Any, Union, get_args, get_origin
+
+
+def _dump_datetime(value: datetime | None):
+    return value.isoformat() if value is not None else None
+
+
+def _dump_entity(value: "EntityBase | None"):
+    return value.to_dict() if value is not None else None
+
+
+def _dump_entity_list(value: list | None):
+    return [item.to_dict() for item in value] if value is not None else None
+
+
+def _dump_datetime_list(value: list | None):
+    return [_dump_datetime(item) for item in value] if value is not None else None
+
+
+def _field_dumper(annotation: Any) -> str | None:
+    """Имя функции-конвертера для поля по аннотации конструктора"""
+    if get_origin(annotation) in (Union, UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return _field_dumper(args[0])
+        return None
+    if isinstance(annotation, type):
+        if issubclass(annotation, datetime):
+            return "_dump_datetime"
+        if issubclass(annotation, EntityBase):
+            return "_dump_entity"
+        return None
+    if get_origin(annotation) is list and get_args(annotation):
+        item = get_args(annotation)[0]
+        if isinstance(item, type) and issubclass(item, EntityBase):
+            return "_dump_entity_list"
+        if isinstance(item, type) and issubclass(item, datetime):
+            return "_dump_datetime_list"
+    return None
+
+
+def _compile(source: str, name: str):
+    namespace = {
+        "_dump_datetime": _dump_datetime,
+        "_dump_entity": _dump_entity,
+        "_dump_entity_list": _dump_entity_list,
+        "_dump_datetime_list": _dump_datetime_list,
+    }
+    exec(source, namespace)
+    return namespace[name]
 
 
 class EntityBase:
+    """
+    Базовый класс сущностей.
+
+    Поля объявляются через __slots__ в порядке аргументов конструктора. При объявлении
+    подкласса для него один раз генерируются конструкторы from_row/from_orm и
+    сериализаторы to_dict/to_public, поэтому на горячем пути нет рефлексии по атрибутам.
+
+    from_row принимает строку результата (asyncpg Record или RowMapping).
+
+    __public__ - белый список полей, которые уходят клиенту через to_public.
+    Секреты (хеш пароля) в него просто не входят. to_public не конвертирует
+    значения, вложенные сущности сериализует энкодер ответа.
+    """
+    __slots__ = ()
+    __public__: tuple = ()
+    _fields: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(cls.__slots__)
+        cls._orm_constructors = {}
+
+        annotations = cls.__init__.__annotations__
+        items = []
+        for name in cls._fields:
+            dumper = _field_dumper(annotations.get(name))
+            items.append(f"{name!r}: {dumper}(self.{name})" if dumper else f"{name!r}: self.{name}")
+        cls.to_dict = _compile(f"def to_dict(self):\n    return {{{', '.join(items)}}}\n", "to_dict")
 
-    def to_dict(self) -> dict:
-        def convert(value: Any):
-            if isinstance(value, EntityBase):
-                return value.to_dict()
-            elif isinstance(value, list):
-                return [convert(v) for v in value]
-            elif isinstance(value, dict):
-                return {k: convert(v) for k, v in value.items()}
-            elif isinstance(value, datetime):
-                return value.isoformat()
-            else:
-                return value
+        public = cls.__dict__.get("__public__", cls._fields)
+        cls.__public__ = tuple(public)
+        items = ", ".join(f"{name!r}: self.{name}" for name in public)
+        cls.to_public = _compile(f"def to_public(self):\n    return {{{items}}}\n", "to_public")
 
-        return {k: convert(v) for k, v in self.__dict__.items() if not k.startswith("_")}
+        args = ", ".join(f"row[{name!r}]" for name in cls._fields)
+        cls.from_row = classmethod(_compile(f"def from_row(cls, row):\n    return cls({args})\n", "from_row"))
 
+    @classmethod
+    def from_orm(cls, obj, exclude: tuple = ()):
+        """Собрать сущность из ORM-объекта, поля из exclude остаются None"""
+        constructor = cls._orm_constructors.get(exclude)
+        if constructor is None:
+            args = ", ".join(f"{name}=obj.{name}" for name in cls._fields if name not in exclude)
+            constructor = _compile(f"def from_orm(cls, obj):\n    return cls({args})\n", "from_orm")
+            cls._orm_constructors[exclude] = constructor
+        return constructor(cls, obj)
 
 
 class SessionEntity(EntityBase):
+    __slots__ = ("id", "user_id", "is_active", "created_at", "expire_at", "device")
+
     def __init__(self, id: UUID=None,
                  user_id: UUID=None,
                  is_active: bool=None,
@@ -39,6 +121,11 @@ class SessionEntity(EntityBase):
 
 
 class UserEntity(EntityBase):
+    __slots__ = ("id", "email", "first_name", "last_name", "patronymic", "is_active",
+                 "created_at", "updated_at", "hash_password", "deleted_at")
+    __public__ = ("id", "email", "first_name", "last_name", "patronymic", "is_active",
+                  "created_at", "updated_at", "deleted_at")
+
     def __init__(self, id: UUID=None,
                  email: str=None,
                  first_name: str=None,
@@ -63,13 +150,31 @@ class UserEntity(EntityBase):
 
 
 
+class UserProfileEntity(EntityBase):
+    """Публичный профиль пользователя для других сервисов"""
+    __slots__ = ("id", "email", "first_name", "last_name", "patronymic")
+
+    def __init__(self, id: UUID, email: str, first_name: str, last_name: str, patronymic: str | None):
+        self.id = id
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+        self.patronymic = patronymic
+
+
 class CurrentUser(EntityBase):
-    def __init__(self, user: UserEntity, session: SessionEntity):
+    __slots__ = ("user", "session", "degraded")
+
+    def __init__(self, user: UserEntity, session: SessionEntity, degraded: bool = False):
         self.user = user
         self.session = session
+        # Проверено по снимку сессий, база недоступна
+        self.degraded = degraded
 
 
 class RoleEntity(EntityBase):
+    __slots__ = ("id", "name", "created_at", "updated_at")
+
     def __init__(self, id: UUID=None,
                  name: str=None,
                  created_at: datetime=None,
@@ -81,17 +186,114 @@ class RoleEntity(EntityBase):
         self.updated_at = updated_at
 
 class PermissionEntity(EntityBase):
+    __slots__ = ("id", "name")
+
     def __init__(self, id: UUID=None, name: str=None):
         self.id = id
         self.name = name
 
 
 class UserWithRolesEntity(EntityBase):
+    __slots__ = ("user", "roles")
+
     def __init__(self, user: UserEntity, roles: list[RoleEntity]):
         self.user = user
         self.roles = roles
 
 class RolesWithPermissionsEntity(EntityBase):
+    __slots__ = ("role", "permissions")
+
     def __init__(self, role: RoleEntity, permissions: list[PermissionEntity]):
         self.role = role
-        self.permissions = permissions
\ No newline at end of file
+        self.permissions = permissions
+
+
+class RoleWithParentsEntity(EntityBase):
+    __slots__ = ("role", "parents")
+
+    def __init__(self, role: RoleEntity, parents: list[RoleEntity]):
+        self.role = role
+        self.parents = parents
+
+
+class PageEntity(EntityBase):
+    __slots__ = ("items", "next_cursor")
+
+    def __init__(self, items: list[EntityBase], next_cursor: str | None = None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+
+class ImportErrorEntity(EntityBase):
+    __slots__ = ("line", "email", "detail")
+
+    def __init__(self, line: int, email: str | None, detail: str):
+        self.line = line
+        self.email = email
+        self.detail = detail
+
+
+class ImportReportEntity(EntityBase):
+    __slots__ = ("total", "created", "skipped", "errors")
+
+    def __init__(self, total: int = 0, created: int = 0, skipped: int = 0,
+                 errors: list[ImportErrorEntity] | None = None):
+        self.total = total
+        self.created = created
+        self.skipped = skipped
+        self.errors = errors if errors is not None else []
+
+
+class BulkDeleteReportEntity(EntityBase):
+    __slots__ = ("users", "sessions")
+
+    def __init__(self, users: int = 0, sessions: int = 0):
+        self.users = users
+        self.sessions = sessions
+
+
+class UserRoleLinkEntity(EntityBase):
+    __slots__ = ("user_id", "role_id")
+
+    def __init__(self, user_id: UUID, role_id: UUID):
+        self.user_id = user_id
+        self.role_id = role_id
+
+
+class RolePermissionLinkEntity(EntityBase):
+    __slots__ = ("role_id", "permission_id")
+
+    def __init__(self, role_id: UUID, permission_id: UUID):
+        self.role_id = role_id
+        self.permission_id = permission_id
+
+
+class StatsEntity(EntityBase):
+    __slots__ = ("active_users", "active_sessions", "users_per_role", "throttled", "budget_exceeded",
+                 "concurrency_limit", "shed")
+
+    def __init__(self, active_users: int, active_sessions: dict[str, int], users_per_role: dict[str, int],
+                 throttled: dict[str, int], budget_exceeded: dict[str, dict[str, int]],
+                 concurrency_limit: float, shed: dict[str, int]):
+        self.active_users = active_users
+        self.active_sessions = active_sessions
+        self.users_per_role = users_per_role
+        # Отклоненные лимитом запросы на этом хосте
+        self.throttled = throttled
+        # Превышения бюджета времени по маршрутам в этом воркере
+        self.budget_exceeded = budget_exceeded
+        # Текущий адаптивный лимит одновременных запросов и сброшенные им запросы по классам в этом воркере
+        self.concurrency_limit = concurrency_limit
+        self.shed = shed
+
+
+class ChangeEntity(EntityBase):
+    __slots__ = ("id", "entity", "entity_id", "op", "created_at")
+
+    def __init__(self, id: int, entity: str, entity_id: UUID, op: str, created_at: datetime):
+        self.id = id
+        self.entity = entity
+        self.entity_id = entity_id
+        self.op = op
+        self.created_at = created_at
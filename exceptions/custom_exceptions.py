@@ -44,4 +44,12 @@ class PermissionGetError(Exception):
     pass
 
 class UserNotHaveRoles(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class FastQueryError(Exception):
+    pass
+class RoleInheritanceError(Exception):
+    pass
+
+class DatabaseUnavailableError(Exception):
+    pass
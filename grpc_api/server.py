@@ -0,0 +1,132 @@
+"""
+gRPC-сервер проверки токенов для внутренних сервисов.
+
+Работает в процессе приложения (GRPC_ENABLED) или отдельным процессом через
+manage.py grpc-serve. Проверка та же, что у HTTP-зависимостей: AuthService,
+репозитории, загрузчики и каталог RBAC, но без разбора HTTP/JSON и без
+дерева зависимостей FastAPI. Все вызовы одного клиента идут по одному
+HTTP/2-соединению, а потоковые методы принимают и отдают проверки пачкой,
+обрабатывая до GRPC_STREAM_CONCURRENCY запросов потока одновременно.
+
+Модули auth_pb2 и auth_pb2_grpc генерируются из auth.proto при сборке.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+
+import grpc
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from database import AsyncSessionLocal, is_db_unavailable
+from entities.entities import UserEntity
+from exceptions.custom_exceptions import UnauthorizedException
+from grpc_api import auth_pb2, auth_pb2_grpc
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.session_repo import SessionRepository
+from repositories.user_repo import UserRepository
+from services.auth_service import AuthService
+from services.rbac_catalog import rbac_catalog
+from services.session_snapshot import session_snapshot
+
+
+def _user_message(user: UserEntity) -> auth_pb2.User:
+    return auth_pb2.User(id=str(user.id), email=user.email, first_name=user.first_name,
+                         last_name=user.last_name, patronymic=user.patronymic or "")
+
+
+class AuthServicer(auth_pb2_grpc.AuthServicer):
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def _verify(self, request: auth_pb2.VerifyTokenRequest) -> auth_pb2.VerifyTokenResponse:
+        async with self.session_factory() as db:
+            auth = AuthService(SessionRepository(db), UserRepository(db))
+            try:
+                user, session = await auth.get_current_user(request.token)
+            except UnauthorizedException as e:
+                return auth_pb2.VerifyTokenResponse(request_id=request.request_id, valid=False, error=str(e))
+        return auth_pb2.VerifyTokenResponse(request_id=request.request_id, valid=True, user=_user_message(user),
+                                            session_id=str(session.id), device=session.device,
+                                            degraded=auth.degraded)
+
+    async def _check(self, request: auth_pb2.CheckPermissionsRequest) -> auth_pb2.CheckPermissionsResponse:
+        async with self.session_factory() as db:
+            auth = AuthService(SessionRepository(db), UserRepository(db))
+            try:
+                user, _ = await auth.get_current_user(request.token)
+            except UnauthorizedException as e:
+                return auth_pb2.CheckPermissionsResponse(request_id=request.request_id, valid=False, error=str(e))
+            if auth.degraded:
+                granted = {name: session_snapshot.has_permission(user.id, rbac_catalog.grant_ids(name))
+                           for name in request.permissions}
+            else:
+                granted = await rbac_catalog.check_user(RolePermissionRepository(db), user.id, request.permissions)
+        return auth_pb2.CheckPermissionsResponse(request_id=request.request_id, valid=True,
+                                                 user_id=str(user.id), granted=granted, degraded=auth.degraded)
+
+    @staticmethod
+    async def _stream(requests: AsyncIterator, handler: Callable[[object], Awaitable], response_type) -> AsyncIterator:
+        """Обработать запросы потока параллельно и отдавать ответы по мере готовности"""
+        results: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(settings.GRPC_STREAM_CONCURRENCY)
+        tasks: set[asyncio.Task] = set()
+
+        async def run(request):
+            try:
+                results.put_nowait(await handler(request))
+            except Exception as e:
+                results.put_nowait(response_type(request_id=request.request_id, valid=False,
+                                                 error=f"Ошибка при проверке: {e}"))
+            finally:
+                slots.release()
+
+        async def feed():
+            async for request in requests:
+                await slots.acquire()
+                task = asyncio.create_task(run(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(set(tasks))
+            results.put_nowait(None)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while (response := await results.get()) is not None:
+                yield response
+            await feeder
+        finally:
+            feeder.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    @staticmethod
+    async def _unary(handler, request, context):
+        try:
+            return await handler(request)
+        except Exception as e:
+            if is_db_unavailable(e):
+                await context.abort(grpc.StatusCode.UNAVAILABLE, "База данных недоступна")
+            raise
+
+    async def VerifyToken(self, request, context):
+        return await self._unary(self._verify, request, context)
+
+    async def CheckPermissions(self, request, context):
+        return await self._unary(self._check, request, context)
+
+    async def VerifyTokenStream(self, request_iterator, context):
+        async for response in self._stream(request_iterator, self._verify, auth_pb2.VerifyTokenResponse):
+            yield response
+
+    async def CheckPermissionsStream(self, request_iterator, context):
+        async for response in self._stream(request_iterator, self._check, auth_pb2.CheckPermissionsResponse):
+            yield response
+
+
+async def start_server(address: str = settings.GRPC_ADDRESS) -> grpc.aio.Server:
+    server = grpc.aio.server()
+    auth_pb2_grpc.add_AuthServicer_to_server(AuthServicer(AsyncSessionLocal), server)
+    server.add_insecure_port(address)
+    await server.start()
+    return server
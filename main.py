@@ -1,32 +1,91 @@
+import asyncio
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.exc import NoResultFound, IntegrityError, DataError, OperationalError
 from contextlib import asynccontextmanager
-from database import Base, engine
-from routes import users, auth, roles_permissions, test_routs
+from database import engine, sync_schema, AsyncSessionLocal, db_breaker, is_db_unavailable
+from repositories.role_perm_repo import RolePermissionRepository
+from routes import users, auth, roles_permissions, stats, changes, test_routs
+from services.import_service import shutdown_hash_pool
+from services.rbac_catalog import rbac_catalog
+from core.events import event_bus
+from exceptions.custom_exceptions import DatabaseUnavailableError
+from core.config import settings
+from core.middleware import ForwardAuthMiddleware, ResponseHeadersMiddleware, ConcurrencyLimitMiddleware
+from services.archive_service import UserArchiveService
+from services.stats_service import StatsReconcileService
+from services.session_snapshot import SessionSnapshotService
 
 import models
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(sync_schema)
 
         # Заполнение тестовыми данными
+
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await RolePermissionRepository(session).ensure_rbac_materialized()
+        await rbac_catalog.refresh(RolePermissionRepository(session), force=True)
+    await event_bus.start()
+
+    tasks = []
+    if settings.ARCHIVE_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(
+            UserArchiveService(AsyncSessionLocal).run_periodically(settings.ARCHIVE_INTERVAL_SECONDS)
+        ))
+    if settings.STATS_RECONCILE_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(
+            StatsReconcileService(AsyncSessionLocal).run_periodically(settings.STATS_RECONCILE_INTERVAL_SECONDS)
+        ))
+
+    if settings.DEGRADED_MODE_ENABLED:
+        tasks.append(asyncio.create_task(
+            SessionSnapshotService(AsyncSessionLocal).run_periodically(settings.DEGRADED_SNAPSHOT_INTERVAL)
+        ))
+
+    grpc_server = None
+    if settings.GRPC_ENABLED:
+        from grpc_api.server import start_server
+        grpc_server = await start_server()
     yield
 
+    if grpc_server is not None:
+        await grpc_server.stop(grace=5)
+    for task in tasks:
+        task.cancel()
+    # Дождаться отмены: сверка посреди транзакции должна откатиться до остановки шины и движка
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await event_bus.stop()
+    shutdown_hash_pool()
+
 app = FastAPI(title="BestOfTheBestAuth", lifespan=lifespan)
 
 app.include_router(users.router)
 app.include_router(auth.router)
 app.include_router(roles_permissions.router)
+app.include_router(stats.router)
+app.include_router(changes.router)
 app.include_router(test_routs.router)
 
+def db_unavailable_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "База данных недоступна"},
+        headers={"Retry-After": str(max(1, round(db_breaker.retry_after())))}
+    )
+
+
 @app.middleware("http")
 async def error_handler_middleware(request: Request, call_next):
     try:
         response = await call_next(request)
         return response
+    except DatabaseUnavailableError:
+        return db_unavailable_response()
     except NoResultFound as exc:
         return JSONResponse(
             status_code=404,
@@ -43,12 +102,23 @@ async def error_handler_middleware(request: Request, call_next):
             content={"detail": str(getattr(exc, "orig", exc))}
         )
     except OperationalError as exc:
+        if is_db_unavailable(exc):
+            return db_unavailable_response()
         return JSONResponse(
             status_code=500,
             content={"detail": str(getattr(exc, "orig", exc))}
         )
     except Exception as exc:
+        if is_db_unavailable(exc):
+            return db_unavailable_response()
         return JSONResponse(
             status_code=500,
             content={"detail": f"Неизвестная ошибка: {str(exc)}"}
-        )
\ No newline at end of file
+        )
+
+
+app.add_middleware(ResponseHeadersMiddleware)
+# Добавленные позже оборачивают добавленные раньше: /auth/verify не проходит через
+# мидлвари ниже по стеку, но считается в лимите одновременных запросов
+app.add_middleware(ForwardAuthMiddleware, session_factory=AsyncSessionLocal)
+app.add_middleware(ConcurrencyLimitMiddleware)
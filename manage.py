@@ -0,0 +1,126 @@
+"""
+Служебные команды сервиса.
+
+    python manage.py import-users users.csv --format csv
+    python manage.py archive-users --retention-days 30
+    python manage.py reconcile-stats
+    python manage.py prune-changes --retention-days 7
+    python manage.py grpc-serve --address 0.0.0.0:50051
+"""
+import argparse
+import asyncio
+import sys
+
+from database import AsyncSessionLocal, engine
+from entities.entities import ImportReportEntity
+from services.import_service import UserImportService, parse_rows, iter_lines, shutdown_hash_pool
+from services.archive_service import UserArchiveService
+from services.stats_service import StatsReconcileService
+from services.change_service import ChangeFeedService
+from core.config import settings
+from core.events import event_bus
+from repositories.role_perm_repo import RolePermissionRepository
+from services.rbac_catalog import rbac_catalog
+
+
+async def _read_file(path: str):
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            yield chunk
+
+
+def _print_progress(report: ImportReportEntity):
+    print(f"обработано {report.total}, создано {report.created}, пропущено {report.skipped}", file=sys.stderr)
+
+
+async def import_users(args):
+    service = UserImportService(session_factory=AsyncSessionLocal)
+    try:
+        rows = parse_rows(iter_lines(_read_file(args.path)), args.format)
+        report = await service.import_users(rows, progress=_print_progress)
+    finally:
+        shutdown_hash_pool()
+        await engine.dispose()
+
+    for error in report.errors:
+        print(f"строка {error.line} ({error.email or '-'}): {error.detail}")
+    if report.skipped > len(report.errors):
+        print(f"... и еще {report.skipped - len(report.errors)} ошибок")
+
+
+async def archive_users(args):
+    service = UserArchiveService(session_factory=AsyncSessionLocal)
+    try:
+        archived = await service.archive_deleted(
+            retention_days=args.retention_days,
+            progress=lambda count: print(f"перенесено в архив {count}", file=sys.stderr)
+        )
+    finally:
+        await engine.dispose()
+    print(f"в архив перенесено пользователей: {archived}")
+
+
+async def reconcile_stats(args):
+    try:
+        drifted = await StatsReconcileService(session_factory=AsyncSessionLocal).reconcile()
+    finally:
+        await engine.dispose()
+    print(f"исправлено счетчиков: {drifted}")
+
+
+async def prune_changes(args):
+    try:
+        pruned = await ChangeFeedService(session_factory=AsyncSessionLocal).prune(args.retention_days)
+    finally:
+        await engine.dispose()
+    print(f"удалено записей журнала изменений: {pruned}")
+
+
+async def grpc_serve(args):
+    from grpc_api.server import start_server
+
+    async with AsyncSessionLocal() as session:
+        await rbac_catalog.refresh(RolePermissionRepository(session), force=True)
+    # Загрузчики и каталог сбрасываются по событиям шины, как в процессе приложения
+    await event_bus.start()
+    server = await start_server(args.address)
+    print(f"gRPC слушает {args.address}", file=sys.stderr)
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(grace=5)
+        await event_bus.stop()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды BestOfTheBestAuth")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-users", help="Массовый импорт пользователей из CSV или NDJSON")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    import_parser.set_defaults(handler=import_users)
+
+    archive_parser = commands.add_parser("archive-users", help="Перенести давно удаленных пользователей в архив")
+    archive_parser.add_argument("--retention-days", type=int, default=settings.ARCHIVE_RETENTION_DAYS)
+    archive_parser.set_defaults(handler=archive_users)
+
+    stats_parser = commands.add_parser("reconcile-stats", help="Пересчитать счетчики статистики по таблицам")
+    stats_parser.set_defaults(handler=reconcile_stats)
+
+    changes_parser = commands.add_parser("prune-changes", help="Удалить старые записи журнала изменений")
+    changes_parser.add_argument("--retention-days", type=int, default=settings.CHANGES_RETENTION_DAYS)
+    changes_parser.set_defaults(handler=prune_changes)
+
+    grpc_parser = commands.add_parser("grpc-serve", help="Запустить gRPC-сервер проверки токенов отдельным процессом")
+    grpc_parser.add_argument("--address", default=settings.GRPC_ADDRESS)
+    grpc_parser.set_defaults(handler=grpc_serve)
+
+    args = parser.parse_args()
+    engine.echo = False
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
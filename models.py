@@ -1,9 +1,18 @@
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Table, UUID
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Table, UUID, Index, BigInteger, SmallInteger, \
+    Identity, bindparam, func, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 import uuid
 
+UUID_ARRAY = ARRAY(UUID(as_uuid=True))
+
+
+def uuid_array(name: str, values):
+    """Параметр-массив uuid для сравнений "= ANY(...)", размер списка не ограничен лимитом параметров"""
+    return bindparam(name, list(values), type_=UUID_ARRAY, unique=True)
+
 roles_permissions = Table(
     "roles_permissions", Base.metadata,
     Column("role_id", ForeignKey("roles.id"), primary_key=True),
@@ -16,6 +25,27 @@ users_roles = Table(
     Column("role_id", ForeignKey("roles.id"), primary_key=True)
 )
 
+role_parents = Table(
+    "role_parents", Base.metadata,
+    Column("role_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Column("parent_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True, index=True)
+)
+
+# Транзитивное замыкание role_parents, включая строку (id, id) для каждой роли:
+# роль descendant_id получает все права роли ancestor_id
+role_closure = Table(
+    "role_closure", Base.metadata,
+    Column("ancestor_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Column("descendant_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True, index=True)
+)
+
+# Материализованные итоговые права пользователей с учетом наследования ролей
+user_effective_permissions = Table(
+    "user_effective_permissions", Base.metadata,
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("permission_id", ForeignKey("permissions.id", ondelete="CASCADE"), primary_key=True, index=True)
+)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -32,6 +62,30 @@ class User(Base):
     roles = relationship("Role", secondary=users_roles, back_populates="users")
     sessions = relationship("Session", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+
+class UserArchive(Base):
+    """Пользователи, удаленные дольше срока хранения, вместе со своими ролями"""
+    __tablename__ = "users_archive"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    first_name = Column(String, nullable=False)
+    last_name = Column(String, nullable=False)
+    patronymic = Column(String, nullable=True)
+    email = Column(String, index=True, nullable=False)
+    hash_password = Column(String, nullable=False)
+    is_active = Column(Boolean, default=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime)
+    role_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False, default=list)
+    archived_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_users_archive_created_at_id", "created_at", "id"),
+    )
+
 class Role(Base):
     __tablename__ = "roles"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -42,6 +96,10 @@ class Role(Base):
     users = relationship("User", secondary=users_roles, back_populates="roles")
     permissions = relationship("Permission", secondary=roles_permissions, back_populates="roles")
 
+    __table_args__ = (
+        Index("ix_roles_created_at_id", "created_at", "id"),
+    )
+
 class Permission(Base):
     __tablename__ = "permissions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -59,3 +117,31 @@ class Session(Base):
     device = Column(String, nullable=False)
 
     user = relationship("User", back_populates="sessions")
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions"
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class StatCounter(Base):
+    """Счетчики статистики, разбитые на шарды: значение счетчика - сумма value по всем его шардам"""
+    __tablename__ = "stats_counters"
+    name = Column(String, primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class ChangeLog(Base):
+    """Журнал изменений для ленты /changes, строки только добавляются"""
+    __tablename__ = "change_log"
+    id = Column(BigInteger, Identity(), primary_key=True)
+    # Номер транзакции записи: лента упорядочена по (txid, id) и отдает только завершенные транзакции
+    txid = Column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+    entity = Column(String, nullable=False)
+    entity_id = Column(UUID(as_uuid=True), nullable=False)
+    op = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_change_log_txid_id", "txid", "id"),
+    )
@@ -0,0 +1,32 @@
+"""
+Кеши репозиториев в памяти процесса.
+
+Публичные профили пользователей читаются другими сервисами пачками и часто,
+а меняются редко. Также кешируются роли пользователя, нужные на каждом
+запросе для лимитов. Кеш сбрасывается локально в момент записи и еще раз по
+событиям шины после коммита, в том числе от других воркеров; без шины
+устаревание ограничено PROFILE_CACHE_TTL и USER_ROLES_CACHE_TTL.
+"""
+from uuid import UUID
+
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from core.ttl_cache import TTLCache
+
+user_profiles = TTLCache(ttl=settings.PROFILE_CACHE_TTL, max_size=settings.PROFILE_CACHE_MAX_SIZE)
+# id ролей пользователя для лимитов запросов и forward-auth
+user_role_ids = TTLCache(ttl=settings.USER_ROLES_CACHE_TTL, max_size=settings.PROFILE_CACHE_MAX_SIZE)
+
+
+def _invalidate(cache: TTLCache):
+    def handler(event: Event):
+        cache.invalidate(None if event.ids is None else [UUID(object_id) for object_id in event.ids])
+    return handler
+
+
+event_bus.subscribe(EventType.USER_UPDATED, _invalidate(user_profiles))
+event_bus.subscribe(EventType.USER_DELETED, _invalidate(user_profiles))
+event_bus.subscribe(EventType.RESYNC, _invalidate(user_profiles))
+event_bus.subscribe(EventType.USER_UPDATED, _invalidate(user_role_ids))
+event_bus.subscribe(EventType.USER_DELETED, _invalidate(user_role_ids))
+event_bus.subscribe(EventType.RESYNC, _invalidate(user_role_ids))
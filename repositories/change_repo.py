@@ -0,0 +1,65 @@
+"""
+Журнал изменений пользователей, ролей, прав и сессий для ленты /changes.
+
+Репозитории пишут в change_log в той же транзакции, что и изменение, запись
+компактная: что за сущность, ее id и операция, само состояние потребитель
+читает обычными ручками. Порядок ленты - (txid, id). id из последовательности
+выдаются до коммита, поэтому транзакция с меньшим id может закоммититься позже
+уже прочитанной; лента отдает только строки транзакций старше xmin снимка,
+то есть гарантированно завершенных, и курсор (txid, id) не перепрыгивает
+через строки, которые появятся позже. Долгая пишущая транзакция задерживает
+ленту до своего завершения.
+"""
+import datetime
+from typing import Iterable, List
+
+from sqlalchemy import select, insert, delete, literal, literal_column, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from entities.entities import ChangeEntity
+from models import ChangeLog, uuid_array
+from core.events import publish, EventType
+
+USER = "user"
+ROLE = "role"
+PERMISSION = "permission"
+SESSION = "session"
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Транзакции с номером меньше xmin текущего снимка уже завершены
+VISIBLE_TXID = literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+class ChangeLogRepository:
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def record(self, entity: str, op: str, ids: Iterable):
+        ids = list(ids)
+        if not ids:
+            return
+        await self._db.execute(
+            insert(ChangeLog).from_select(
+                ["entity", "entity_id", "op"],
+                select(literal(entity), func.unnest(uuid_array("change_ids", ids)), literal(op))
+            )
+        )
+        await publish(self._db, EventType.CHANGES)
+
+    async def get(self, since: tuple[int, int] | None, limit: int) -> tuple[List[ChangeEntity], tuple[int, int] | None]:
+        """Изменения после курсора (txid, id) и курсор последнего из них"""
+        stmt = select(ChangeLog.txid, ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op,
+                      ChangeLog.created_at).where(ChangeLog.txid < VISIBLE_TXID)
+        if since is not None:
+            stmt = stmt.where(tuple_(ChangeLog.txid, ChangeLog.id) > tuple_(*since))
+        stmt = stmt.order_by(ChangeLog.txid, ChangeLog.id).limit(limit)
+
+        rows = (await self._db.execute(stmt)).mappings().all()
+        last = (rows[-1]["txid"], rows[-1]["id"]) if rows else since
+        return [ChangeEntity.from_row(row) for row in rows], last
+
+    async def prune(self, before: datetime.datetime) -> int:
+        result = await self._db.execute(delete(ChangeLog).where(ChangeLog.created_at < before))
+        return result.rowcount
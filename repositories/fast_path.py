@@ -0,0 +1,77 @@
+"""
+Быстрый путь для горячих запросов на чтение.
+
+Запросы заданы заранее готовым SQL и выполняются напрямую на соединении asyncpg,
+минуя построение select(...), компиляцию SQLAlchemy и identity map ORM.
+asyncpg хранит подготовленные выражения в кеше соединения, поэтому каждый запрос
+готовится один раз на соединение пула, а дальше только исполняется.
+
+Соединение берется у сессии запроса: так чтение видит незакоммиченные записи
+той же транзакции. Записи и админские запросы остаются на ORM. Ошибки сырого
+соединения проходят мимо обработки SQLAlchemy, поэтому оборванное соединение
+выбрасывается из пула здесь же.
+"""
+from asyncpg import PostgresError, InterfaceError
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from database import invalidate_if_disconnected
+from exceptions.custom_exceptions import FastQueryError
+
+ENABLED = settings.FAST_PATH_ENABLED and make_url(settings.POSTGRES_URL).get_driver_name() == "asyncpg"
+
+SESSION_COLUMNS = "id, user_id, is_active, created_at, expire_at, device"
+USER_COLUMNS = ("id, email, first_name, last_name, patronymic, is_active, "
+                "created_at, updated_at, hash_password, deleted_at")
+
+SESSION_ACTIVE_BY_ID = f"SELECT {SESSION_COLUMNS} FROM sessions WHERE id = $1 AND is_active = true"
+USER_ACTIVE_BY_ID = f"SELECT {USER_COLUMNS} FROM users WHERE id = $1 AND is_active = true"
+USER_ACTIVE_BY_EMAIL = f"SELECT {USER_COLUMNS} FROM users WHERE email = $1 AND is_active = true"
+SESSIONS_ACTIVE_BY_IDS = f"SELECT {SESSION_COLUMNS} FROM sessions WHERE id = ANY($1::uuid[]) AND is_active = true"
+USERS_ACTIVE_BY_IDS = f"SELECT {USER_COLUMNS} FROM users WHERE id = ANY($1::uuid[]) AND is_active = true"
+USER_HAS_PERMISSION = ("SELECT 1 FROM user_effective_permissions "
+                       "WHERE user_id = $1 AND permission_id = ANY($2::uuid[]) LIMIT 1")
+USER_PERMISSIONS_AMONG = ("SELECT permission_id FROM user_effective_permissions "
+                          "WHERE user_id = $1 AND permission_id = ANY($2::uuid[])")
+
+
+async def driver_connection(db: AsyncSession):
+    """Соединение asyncpg, на котором работает сессия"""
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+async def fetch_one(db: AsyncSession, query: str, *args):
+    """Выполнить запрос и вернуть первую строку или None"""
+    connection = await driver_connection(db)
+    try:
+        return await connection.fetchrow(query, *args)
+    except (PostgresError, InterfaceError) as e:
+        await invalidate_if_disconnected(await db.connection(), e)
+        raise FastQueryError(e) from e
+
+
+async def fetch_all(db: AsyncSession, query: str, *args) -> list:
+    """Выполнить запрос и вернуть все строки"""
+    connection = await driver_connection(db)
+    try:
+        return await connection.fetch(query, *args)
+    except (PostgresError, InterfaceError) as e:
+        await invalidate_if_disconnected(await db.connection(), e)
+        raise FastQueryError(e) from e
+
+
+async def copy_records(db: AsyncSession, table: str, columns: list[str], records: list[tuple]) -> None:
+    """Загрузить строки в таблицу через COPY в транзакции сессии"""
+    # Адаптер SQLAlchemy открывает транзакцию asyncpg лениво, на первом своем запросе.
+    # Без этого COPY на сыром соединении выполнился бы в autocommit.
+    await db.execute(text("SELECT 1"))
+    connection = await driver_connection(db)
+    try:
+        await connection.copy_records_to_table(table, columns=columns, records=records)
+    except (PostgresError, InterfaceError) as e:
+        await invalidate_if_disconnected(await db.connection(), e)
+        raise FastQueryError(e) from e
@@ -0,0 +1,111 @@
+"""
+Загрузчики горячих строк по первичному ключу с объединением запросов.
+
+Одинаковые ключи, которые запрашиваются одновременно, ждут один и тот же запрос.
+Разные ключи, пришедшие в пределах LOADER_BATCH_DELAY, уходят одним
+"WHERE id = ANY($1)" на отдельном соединении пула. Загрузчик отдает строки
+asyncpg, каждый ожидающий сам строит из строки свою сущность.
+
+Запрос на отдельном соединении не видит незакоммиченных записей сессии запроса,
+поэтому репозитории используют загрузчик, только пока их сессия не начала
+транзакцию. События шины о записях отвязывают ключи от уже отправленных
+запросов, чтобы пришедшие после коммита не получили старый результат.
+"""
+import asyncio
+from typing import Hashable
+from uuid import UUID
+
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from database import engine, invalidate_if_disconnected
+from exceptions.custom_exceptions import FastQueryError
+from repositories import fast_path
+
+ENABLED = fast_path.ENABLED and settings.LOADERS_ENABLED
+
+
+class BatchLoader:
+    def __init__(self, query: str, key: str = "id"):
+        self._query = query
+        self._key = key
+        self._pending: dict[Hashable, asyncio.Future] = {}
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: Hashable):
+        """Строка по ключу или None"""
+        future = self._pending.get(key) or self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= settings.LOADER_MAX_BATCH:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(settings.LOADER_BATCH_DELAY, self._dispatch)
+        # shield: отмена одного ожидающего не должна отменять результат для остальных
+        return await asyncio.shield(future)
+
+    def forget(self, keys=None):
+        """Следующие обращения к ключам пойдут новым запросом"""
+        if keys is None:
+            self._inflight.clear()
+            return
+        for key in keys:
+            self._inflight.pop(key, None)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight.update(batch)
+        task = asyncio.get_running_loop().create_task(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: dict[Hashable, asyncio.Future]):
+        try:
+            async with engine.connect() as connection:
+                raw_connection = await connection.get_raw_connection()
+                try:
+                    rows = await raw_connection.driver_connection.fetch(self._query, list(batch))
+                except Exception as e:
+                    await invalidate_if_disconnected(connection, e)
+                    raise
+        except Exception as e:
+            # Любая ошибка должна дойти до ожидающих, иначе они повиснут навсегда
+            error = FastQueryError(e)
+            error.__cause__ = e
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            by_key = {row[self._key]: row for row in rows}
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(by_key.get(key))
+        finally:
+            for key, future in batch.items():
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+
+active_sessions = BatchLoader(fast_path.SESSIONS_ACTIVE_BY_IDS)
+active_users = BatchLoader(fast_path.USERS_ACTIVE_BY_IDS)
+
+
+def _forget(loader: BatchLoader):
+    def handler(event: Event):
+        loader.forget(None if event.ids is None else [UUID(object_id) for object_id in event.ids])
+    return handler
+
+
+event_bus.subscribe(EventType.SESSION_REVOKED, _forget(active_sessions))
+event_bus.subscribe(EventType.USER_UPDATED, _forget(active_users))
+event_bus.subscribe(EventType.USER_DELETED, _forget(active_users))
+event_bus.subscribe(EventType.RESYNC, _forget(active_sessions))
+event_bus.subscribe(EventType.RESYNC, _forget(active_users))
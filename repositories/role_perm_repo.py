@@ -1,17 +1,35 @@
+import time
+from collections import defaultdict
 from typing import List, Dict, Any
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, any_, null, func, exists, and_, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
+from sqlalchemy import or_, tuple_
 from datetime import datetime
 from uuid import UUID
 
-from entities.entities import UserEntity, RoleEntity, PermissionEntity, UserWithRolesEntity, RolesWithPermissionsEntity
-from models import Role, User, Permission
+from entities.entities import UserEntity, RoleEntity, PermissionEntity, UserWithRolesEntity, RolesWithPermissionsEntity, \
+    PageEntity, UserRoleLinkEntity, RolePermissionLinkEntity, RoleWithParentsEntity
+from models import Role, User, Permission, CatalogVersion, users_roles, roles_permissions, role_parents, role_closure, \
+    user_effective_permissions, uuid_array
+from core.config import settings
+from core.pagination import encode_cursor, decode_cursor
+from database import after_commit
+from repositories import fast_path, caches
+from repositories.stats_repo import StatsRepository, role_counter
+from repositories import change_repo
+from repositories.change_repo import ChangeLogRepository
+from core.events import publish, EventType
 from exceptions.custom_exceptions import UserGetError, RoleGetError, RoleAlreadyExistsError, \
-    PermissionAlreadyExistsError, PermissionGetError
+    PermissionAlreadyExistsError, PermissionGetError, FastQueryError, RoleInheritanceError
+
+RBAC_CATALOG = "rbac"
+# Изменения графа ролей и их прав берут блокировку монопольно, изменения ролей
+# пользователей - разделяемо: пересчет итоговых прав видит согласованный граф
+RBAC_LOCK_KEY = 7_340_101
 
 
 class RolePermissionRepository:
@@ -26,6 +44,7 @@ class RolePermissionRepository:
 
             self._db.add(permission_orm)
             await self._db.flush()
+            await ChangeLogRepository(self._db).record(change_repo.PERMISSION, change_repo.UPSERT, [permission_orm.id])
 
             permission.id = permission_orm.id
 
@@ -41,6 +60,9 @@ class RolePermissionRepository:
 
             self._db.add(role_orm)
             await self._db.flush()
+            await self._db.execute(pg_insert(role_closure).values(ancestor_id=role_orm.id, descendant_id=role_orm.id)
+                                   .on_conflict_do_nothing())
+            await ChangeLogRepository(self._db).record(change_repo.ROLE, change_repo.UPSERT, [role_orm.id])
 
             role.id = role_orm.id
             role.created_at = role_orm.created_at
@@ -50,163 +72,179 @@ class RolePermissionRepository:
         except IntegrityError:
             raise RoleAlreadyExistsError(f"Роль с именем {role.name} уже существует")
 
-    async def add_permissions_to_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
-        stmt = select(Role).where(Role.id == role_id).options(selectinload(Role.permissions))
+    async def add_role_permissions(self, role_ids: List[UUID], permission_ids: List[UUID]) -> List[RolePermissionLinkEntity]:
+        """Выдать всем ролям все указанные права одним INSERT ... ON CONFLICT DO NOTHING, вернуть новые связи"""
+        await self._lock_rbac()
+        stmt = (
+            pg_insert(roles_permissions)
+            .from_select(
+                ["role_id", "permission_id"],
+                select(Role.id, Permission.id).where(
+                    Role.id == any_(uuid_array("role_ids", role_ids)),
+                    Permission.id == any_(uuid_array("permission_ids", permission_ids))
+                )
+            )
+            .on_conflict_do_nothing()
+            .returning(roles_permissions.c.role_id, roles_permissions.c.permission_id)
+        )
         result = await self._db.execute(stmt)
-        role_orm = result.scalar_one_or_none()
-        if not role_orm:
-            raise RoleGetError(f"Роль с id {role_id} не найдена")
-
-        stmt = select(Permission).where(Permission.id.in_(permission_ids))
+        links = [RolePermissionLinkEntity.from_row(row) for row in result.mappings()]
+        if links:
+            changed_roles = {link.role_id for link in links}
+            await self.refresh_effective_permissions(self._users_of_roles(changed_roles))
+            await ChangeLogRepository(self._db).record(change_repo.ROLE, change_repo.UPSERT, changed_roles)
+        return links
+
+    async def remove_role_permissions(self, role_ids: List[UUID], permission_ids: List[UUID]) -> List[RolePermissionLinkEntity]:
+        """Забрать у всех ролей все указанные права одним DELETE, вернуть удаленные связи"""
+        await self._lock_rbac()
+        stmt = (
+            delete(roles_permissions)
+            .where(
+                roles_permissions.c.role_id == any_(uuid_array("role_ids", role_ids)),
+                roles_permissions.c.permission_id == any_(uuid_array("permission_ids", permission_ids))
+            )
+            .returning(roles_permissions.c.role_id, roles_permissions.c.permission_id)
+        )
         result = await self._db.execute(stmt)
-        permissions_orm = result.scalars().all()
-        if not permissions_orm:
-            raise PermissionGetError(f"Указанные права не найдены")
-
-        for permission_orm in permissions_orm:
-            if permission_orm not in role_orm.permissions:
-                role_orm.permissions.append(permission_orm)
-
-        await self._db.flush()
-        await self._db.refresh(role_orm)
-
-        return RolesWithPermissionsEntity(
-            role=RoleEntity(
-                id=role_orm.id,
-                name=role_orm.name,
-                created_at=role_orm.created_at,
-                updated_at=role_orm.updated_at
-            ),
-            permissions=[PermissionEntity(
-                id=perm.id,
-                name=perm.name
-            ) for perm in role_orm.permissions]
+        links = [RolePermissionLinkEntity.from_row(row) for row in result.mappings()]
+        if links:
+            changed_roles = {link.role_id for link in links}
+            await self.refresh_effective_permissions(self._users_of_roles(changed_roles))
+            await ChangeLogRepository(self._db).record(change_repo.ROLE, change_repo.UPSERT, changed_roles)
+        return links
+
+    async def add_user_roles(self, user_ids: List[UUID], role_ids: List[UUID]) -> List[UserRoleLinkEntity]:
+        """Выдать всем пользователям все указанные роли одним INSERT ... ON CONFLICT DO NOTHING, вернуть новые связи"""
+        await self._lock_rbac(shared=True)
+        stmt = (
+            pg_insert(users_roles)
+            .from_select(
+                ["user_id", "role_id"],
+                select(User.id, Role.id).where(
+                    User.id == any_(uuid_array("user_ids", user_ids)),
+                    Role.id == any_(uuid_array("role_ids", role_ids))
+                )
+            )
+            .on_conflict_do_nothing()
+            .returning(users_roles.c.user_id, users_roles.c.role_id)
         )
-
-    async def delete_permissions_from_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
-        stmt = select(Role).where(Role.id == role_id).options(selectinload(Role.permissions))
         result = await self._db.execute(stmt)
-        role_orm = result.scalar_one_or_none()
-        if not role_orm:
-            raise RoleGetError(f"Роль с id {role_id} не найдена")
-
-        stmt = select(Permission).where(Permission.id.in_(permission_ids))
+        links = [UserRoleLinkEntity.from_row(row) for row in result.mappings()]
+        if links:
+            changed_users = {link.user_id for link in links}
+            await self.refresh_effective_permissions(list(changed_users))
+            await self._count_role_users(links, 1)
+            caches.user_role_ids.invalidate(changed_users)
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, changed_users)
+            await publish(self._db, EventType.USER_UPDATED, changed_users)
+        return links
+
+    async def remove_user_roles(self, user_ids: List[UUID], role_ids: List[UUID]) -> List[UserRoleLinkEntity]:
+        """Забрать у всех пользователей все указанные роли одним DELETE, вернуть удаленные связи"""
+        await self._lock_rbac(shared=True)
+        stmt = (
+            delete(users_roles)
+            .where(
+                users_roles.c.user_id == any_(uuid_array("user_ids", user_ids)),
+                users_roles.c.role_id == any_(uuid_array("role_ids", role_ids))
+            )
+            .returning(users_roles.c.user_id, users_roles.c.role_id)
+        )
         result = await self._db.execute(stmt)
-        permissions_orm = result.scalars().all()
-        if not permissions_orm:
-            raise PermissionGetError(f"Указанные права не найдены")
-
-        for permission_orm in permissions_orm:
-            if permission_orm not in role_orm.permissions:
-                role_orm.permissions.remove(permission_orm)
-
-        await self._db.flush()
-        await self._db.refresh(role_orm)
+        links = [UserRoleLinkEntity.from_row(row) for row in result.mappings()]
+        if links:
+            changed_users = {link.user_id for link in links}
+            await self.refresh_effective_permissions(list(changed_users))
+            await self._count_role_users(links, -1)
+            caches.user_role_ids.invalidate(changed_users)
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, changed_users)
+            await publish(self._db, EventType.USER_UPDATED, changed_users)
+        return links
+
+    async def _count_role_users(self, links: List[UserRoleLinkEntity], sign: int):
+        """Учесть связи в счетчиках пользователей ролей, удаленные пользователи в них не входят"""
+        result = await self._db.execute(
+            select(User.id).where(User.id == any_(uuid_array("user_ids", {link.user_id for link in links})),
+                                  User.is_active == True)
+        )
+        active_users = set(result.scalars())
+        deltas = defaultdict(int)
+        for link in links:
+            if link.user_id in active_users:
+                deltas[role_counter(link.role_id)] += sign
+        await StatsRepository(self._db).add(deltas)
+
+    async def _get_role_with_permissions(self, role_id: UUID) -> RolesWithPermissionsEntity | None:
+        result = await self._db.execute(select(*Role.__table__.c).where(Role.id == role_id))
+        row = result.mappings().one_or_none()
+        if row is None:
+            return None
 
+        result = await self._db.execute(
+            select(*Permission.__table__.c)
+            .join(roles_permissions, roles_permissions.c.permission_id == Permission.id)
+            .where(roles_permissions.c.role_id == role_id)
+        )
         return RolesWithPermissionsEntity(
-            role=RoleEntity(
-                id=role_orm.id,
-                name=role_orm.name,
-                created_at=role_orm.created_at,
-                updated_at=role_orm.updated_at
-            ),
-            permissions=[PermissionEntity(
-                id=perm.id,
-                name=perm.name
-            ) for perm in role_orm.permissions]
+            role=RoleEntity.from_row(row),
+            permissions=[PermissionEntity.from_row(permission) for permission in result.mappings()]
         )
 
-    async def set_user_roles(self, user: UserEntity, roles: List[RoleEntity]) -> UserWithRolesEntity:
+    async def _check_permissions_exist(self, permission_ids: List[UUID]):
         result = await self._db.execute(
-            select(User).options(selectinload(User.roles)).where(User.id == user.id)
+            select(Permission.id).where(Permission.id == any_(uuid_array("permission_ids", permission_ids))).limit(1)
         )
+        if result.scalar_one_or_none() is None:
+            raise PermissionGetError(f"Указанные права не найдены")
 
-        user_orm = result.scalar_one_or_none()
-        if not user_orm:
-            raise UserGetError(f"Пользователь {user.email} не найден")
+    async def add_permissions_to_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
+        links = await self.add_role_permissions([role_id], permission_ids)
 
-        stmt = select(Role).where(Role.id.in_([role.id for role in roles]))
-        result = await self._db.execute(stmt)
-        roles_orm = result.scalars().all()
-        if not roles_orm:
-            raise RoleGetError(f"Не удалось найти указанные роли в базе данных")
+        role = await self._get_role_with_permissions(role_id)
+        if role is None:
+            raise RoleGetError(f"Роль с id {role_id} не найдена")
+        if not links:
+            await self._check_permissions_exist(permission_ids)
+        return role
 
-        existing_role_ids = {r.id for r in user_orm.roles}
-        for role_orm in roles_orm:
-            if role_orm.id not in existing_role_ids:
-                user_orm.roles.append(role_orm)
-
-        await self._db.flush()
-        await self._db.refresh(user_orm)
-
-        return UserWithRolesEntity(
-            user=UserEntity(
-                id=user_orm.id,
-                first_name=user_orm.first_name,
-                last_name=user_orm.last_name,
-                patronymic=user_orm.patronymic,
-                email=user_orm.email,
-                created_at=user_orm.created_at,
-                updated_at=user_orm.updated_at,
-                is_active=user_orm.is_active,
-                deleted_at=user_orm.deleted_at
-            ),
-            roles=[RoleEntity(
-                id=role.id,
-                name=role.name,
-                created_at=role.created_at,
-                updated_at=role.updated_at
-            ) for role in user_orm.roles]
-        )
+    async def delete_permissions_from_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
+        links = await self.remove_role_permissions([role_id], permission_ids)
 
-    async def delete_user_roles(self, user: UserEntity, roles: List[RoleEntity]):
-        result = await self._db.execute(
-            select(User).options(selectinload(User.roles)).where(User.id == user.id)
-        )
+        role = await self._get_role_with_permissions(role_id)
+        if role is None:
+            raise RoleGetError(f"Роль с id {role_id} не найдена")
+        if not links:
+            await self._check_permissions_exist(permission_ids)
+        return role
+
+    async def set_user_roles(self, user: UserEntity, roles: List[RoleEntity]) -> UserWithRolesEntity:
+        if not roles:
+            raise RoleGetError(f"Не удалось найти указанные роли в базе данных")
 
-        user_orm = result.scalar_one_or_none()
-        if not user_orm:
+        await self.add_user_roles([user.id], [role.id for role in roles])
+
+        users_with_roles = await self.get_users_roles([user])
+        if not users_with_roles:
             raise UserGetError(f"Пользователь {user.email} не найден")
+        return users_with_roles[0]
 
-        stmt = select(Role).where(Role.id.in_([role.id for role in roles]))
-        result = await self._db.execute(stmt)
-        roles_orm = result.scalars().all()
-        if not roles_orm:
+    async def delete_user_roles(self, user: UserEntity, roles: List[RoleEntity]) -> UserWithRolesEntity:
+        if not roles:
             raise RoleGetError(f"Не удалось найти указанные роли в базе данных")
 
-        existing_role_ids = {r.id for r in user_orm.roles}
-        for role_orm in roles_orm:
-            if role_orm.id not in existing_role_ids:
-                user_orm.roles.remove(role_orm)
-
-        await self._db.flush()
-        await self._db.refresh(user_orm)
-
-        return UserWithRolesEntity(
-            user=UserEntity(
-                id=user_orm.id,
-                first_name=user_orm,
-                last_name=user_orm.last_name,
-                patronymic=user_orm.patronymic,
-                email=user_orm.email,
-                created_at=user_orm.created_at,
-                updated_at=user_orm.updated_at,
-                is_active=user_orm.is_active,
-                deleted_at=user_orm.deleted_at
-            ),
-            roles=[RoleEntity(
-                id=role.id,
-                name=role.name,
-                created_at=role.created_at,
-                updated_at=role.updated_at
-            ) for role in user_orm.roles]
-        )
+        await self.remove_user_roles([user.id], [role.id for role in roles])
 
-    async def get_roles(self,
-                        ids: list[UUID] | None = None,
-                        names: list[str] | None = None,
-                        date_from: datetime | None = None,
-                        date_to: datetime | None = None) -> List[RolesWithPermissionsEntity]:
+        users_with_roles = await self.get_users_roles([user])
+        if not users_with_roles:
+            raise UserGetError(f"Пользователь {user.email} не найден")
+        return users_with_roles[0]
+
+    @staticmethod
+    def _roles_stmt(ids: list[UUID] | None,
+                    names: list[str] | None,
+                    date_from: datetime | None,
+                    date_to: datetime | None):
         stmt = select(Role)
 
         if date_from:
@@ -235,23 +273,65 @@ class RolePermissionRepository:
                 Role.name.in_(names)
             )
 
-        stmt = stmt.options(selectinload(Role.permissions))
+        return stmt.options(selectinload(Role.permissions))
+
+    @staticmethod
+    def _roles_with_permissions(roles) -> List[RolesWithPermissionsEntity]:
+        return [RolesWithPermissionsEntity(
+            role=RoleEntity.from_orm(role),
+            permissions=[PermissionEntity.from_orm(permission) for permission in role.permissions]
+        ) for role in roles]
+
+    async def copy_user_roles(self, links: List[tuple[UUID, UUID]]) -> int:
+        """Массово создать связи (user_id, role_id) через COPY, для только что созданных пользователей"""
+        try:
+            await self._lock_rbac(shared=True)
+            await fast_path.copy_records(self._db, "users_roles", ["user_id", "role_id"], links)
+            await self.refresh_effective_permissions(list({user_id for user_id, _ in links}))
+            deltas = defaultdict(int)
+            for _, role_id in links:
+                deltas[role_counter(role_id)] += 1
+            await StatsRepository(self._db).add(deltas)
+            return len(links)
+        except FastQueryError as e:
+            raise RoleGetError(f"Не удалось выдать роли: {e}") from e
+
+    async def get_roles(self,
+                        ids: list[UUID] | None = None,
+                        names: list[str] | None = None,
+                        date_from: datetime | None = None,
+                        date_to: datetime | None = None) -> List[RolesWithPermissionsEntity]:
+        stmt = self._roles_stmt(ids=ids, names=names, date_from=date_from, date_to=date_to)
 
         result = await self._db.execute(stmt)
         roles = result.scalars().all()
 
-        return [RolesWithPermissionsEntity(
-            role=RoleEntity(
-                    id=role.id,
-                    name=role.name,
-                    created_at=role.created_at,
-                    updated_at=role.updated_at
-            ),
-            permissions=[PermissionEntity(
-                id=permission.id,
-                name=permission.name
-            ) for permission in role.permissions]
-        ) for role in roles]
+        return self._roles_with_permissions(roles)
+
+    async def get_roles_page(self,
+                             ids: list[UUID] | None = None,
+                             names: list[str] | None = None,
+                             date_from: datetime | None = None,
+                             date_to: datetime | None = None,
+                             cursor: str | None = None,
+                             limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
+        """Страница ролей с keyset-пагинацией по (created_at, id)"""
+        stmt = self._roles_stmt(ids=ids, names=names, date_from=date_from, date_to=date_to)
+
+        if cursor:
+            created_at, role_id = decode_cursor(cursor, 2)
+            stmt = stmt.where(tuple_(Role.created_at, Role.id) > tuple_(created_at, role_id))
+        stmt = stmt.order_by(Role.created_at, Role.id).limit(limit + 1)
+
+        result = await self._db.execute(stmt)
+        roles = result.scalars().all()
+
+        next_cursor = None
+        if len(roles) > limit:
+            roles = roles[:limit]
+            next_cursor = encode_cursor(roles[-1].created_at, roles[-1].id)
+
+        return PageEntity(items=self._roles_with_permissions(roles), next_cursor=next_cursor)
 
     async def get_permissions(self, ids: list[UUID] | None = None, names: list[str] | None = None) -> List[PermissionEntity]:
         stmt = select(Permission)
@@ -271,10 +351,7 @@ class RolePermissionRepository:
 
         result = await self._db.execute(stmt)
         permissions = result.scalars().all()
-        return [PermissionEntity(
-            id=permission.id,
-            name=permission.name
-        ) for permission in permissions]
+        return [PermissionEntity.from_orm(permission) for permission in permissions]
 
     async def get_users_roles(self, users: list[UserEntity]) -> list[UserWithRolesEntity]:
         user_ids = [user.id for user in users]
@@ -282,33 +359,253 @@ class RolePermissionRepository:
         if not user_ids:
             return []
 
-        stmt = (
-            select(User)
-            .options(selectinload(User.roles))
-            .where(User.id.in_(user_ids))
+        result = await self._db.execute(
+            select(*[column for column in User.__table__.c if column.key != "hash_password"],
+                   null().label("hash_password"))
+            .where(User.id == any_(uuid_array("user_ids", user_ids)))
         )
+        users_found = [UserEntity.from_row(row) for row in result.mappings()]
 
+        roles_by_user = defaultdict(list)
+        result = await self._db.execute(
+            select(users_roles.c.user_id, *Role.__table__.c)
+            .join(Role, Role.id == users_roles.c.role_id)
+            .where(users_roles.c.user_id == any_(uuid_array("user_ids", user_ids)))
+        )
+        for row in result.mappings():
+            roles_by_user[row["user_id"]].append(RoleEntity.from_row(row))
+
+        return [UserWithRolesEntity(user=user, roles=roles_by_user[user.id]) for user in users_found]
+
+    async def get_user_role_ids(self, user_id: UUID) -> List[UUID]:
+        """Прямые роли пользователя, имена берутся из каталога; читается через кеш"""
+        found, misses = caches.user_role_ids.get_many((user_id,))
+        if not misses:
+            return found[user_id]
+        generation = caches.user_role_ids.generation
+        result = await self._db.execute(select(users_roles.c.role_id).where(users_roles.c.user_id == user_id))
+        role_ids = list(result.scalars())
+        caches.user_role_ids.put_many({user_id: role_ids}, generation)
+        return role_ids
+
+    async def get_catalog_version(self) -> int:
+        result = await self._db.execute(select(CatalogVersion.version).where(CatalogVersion.name == RBAC_CATALOG))
+        return result.scalar_one_or_none() or 0
+
+    async def bump_catalog_version(self) -> int:
+        """
+        Поднять версию каталога ролей и прав.
+
+        Версия не меньше текущего времени в микросекундах, поэтому продолжает расти
+        и после пересоздания таблиц.
+        """
+        stmt = pg_insert(CatalogVersion).values(name=RBAC_CATALOG, version=int(time.time() * 1_000_000),
+                                                updated_at=datetime.now())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CatalogVersion.name],
+            set_={"version": func.greatest(CatalogVersion.version + 1, stmt.excluded.version),
+                  "updated_at": stmt.excluded.updated_at}
+        ).returning(CatalogVersion.version)
         result = await self._db.execute(stmt)
-        users_with_roles = result.scalars().unique().all()
-
-        return [
-            UserWithRolesEntity(
-                user=UserEntity(
-                    id=user.id,
-                    first_name=user.first_name,
-                    last_name=user.last_name,
-                    email=user.email,
-                    created_at=user.created_at,
-                    updated_at=user.updated_at,
-                    patronymic=user.patronymic
-                ),
-                roles=[RoleEntity(
-                    id=role.id,
-                    name=role.name,
-                    created_at=role.created_at,
-                    updated_at=role.updated_at
-                ) for role in user.roles]
+        await publish(self._db, EventType.RBAC_CHANGED)
+        return result.scalar_one()
+
+    def after_commit(self, callback):
+        after_commit(self._db, callback)
+
+    async def load_catalog(self) -> tuple[List[RoleEntity], List[PermissionEntity]]:
+        """Все роли и права для каталога в памяти"""
+        roles = await self._db.execute(select(*Role.__table__.c))
+        permissions = await self._db.execute(select(*Permission.__table__.c))
+        return ([RoleEntity.from_row(row) for row in roles.mappings()],
+                [PermissionEntity.from_row(row) for row in permissions.mappings()])
+
+    async def _lock_rbac(self, shared: bool = False):
+        lock = func.pg_advisory_xact_lock_shared if shared else func.pg_advisory_xact_lock
+        await self._db.execute(select(lock(RBAC_LOCK_KEY)))
+
+    @staticmethod
+    def _users_of_roles(role_ids):
+        """Пользователи, которым права ролей достаются напрямую или по наследованию"""
+        return (
+            select(users_roles.c.user_id)
+            .join(role_closure, role_closure.c.descendant_id == users_roles.c.role_id)
+            .where(role_closure.c.ancestor_id == any_(uuid_array("changed_role_ids", role_ids)))
+        )
+
+    async def refresh_effective_permissions(self, users=None):
+        """
+        Привести user_effective_permissions в соответствие с ролями для части пользователей:
+        users - список id, подзапрос с user_id или None для всех.
+        """
+        if users is None:
+            scoped = lambda column: true()
+        elif isinstance(users, list):
+            if not users:
+                return
+            scoped = lambda column: column == any_(uuid_array("effective_user_ids", users))
+        else:
+            scoped = lambda column: column.in_(users)
+
+        granted = (
+            select(users_roles.c.user_id, roles_permissions.c.permission_id)
+            .join(role_closure, role_closure.c.descendant_id == users_roles.c.role_id)
+            .join(roles_permissions, roles_permissions.c.role_id == role_closure.c.ancestor_id)
+        )
+
+        await self._db.execute(
+            delete(user_effective_permissions)
+            .where(
+                scoped(user_effective_permissions.c.user_id),
+                ~exists(granted.where(
+                    users_roles.c.user_id == user_effective_permissions.c.user_id,
+                    roles_permissions.c.permission_id == user_effective_permissions.c.permission_id
+                ))
             )
-         for user in users_with_roles]
+        )
+        await self._db.execute(
+            pg_insert(user_effective_permissions)
+            .from_select(["user_id", "permission_id"], granted.where(scoped(users_roles.c.user_id)).distinct())
+            .on_conflict_do_nothing()
+        )
 
+    async def _rebuild_closure(self, role_ids: List[UUID] | None = None):
+        """Пересчитать замыкание для указанных ролей (как потомков) или для всех"""
+        start = select(Role.id.label("ancestor_id"), Role.id.label("descendant_id"))
+        if role_ids is not None:
+            start = start.where(Role.id == any_(uuid_array("closure_role_ids", role_ids)))
+        closure = start.cte("closure", recursive=True)
+        closure = closure.union(
+            select(role_parents.c.parent_id, closure.c.descendant_id)
+            .join(closure, role_parents.c.role_id == closure.c.ancestor_id)
+        )
+
+        stale = delete(role_closure)
+        if role_ids is not None:
+            stale = stale.where(role_closure.c.descendant_id == any_(uuid_array("closure_role_ids", role_ids)))
+        await self._db.execute(stale)
+        await self._db.execute(
+            pg_insert(role_closure)
+            .from_select(["ancestor_id", "descendant_id"], select(closure.c.ancestor_id, closure.c.descendant_id))
+            .on_conflict_do_nothing()
+        )
 
+    async def rebuild_rbac(self):
+        """Полностью пересчитать замыкание ролей и итоговые права всех пользователей"""
+        await self._lock_rbac()
+        await self._rebuild_closure()
+        await self.refresh_effective_permissions()
+
+    async def ensure_rbac_materialized(self) -> bool:
+        """Пересчитать материализованные данные, если они пусты (первый запуск или после миграции)"""
+        result = await self._db.execute(select(
+            exists(select(Role.id)),
+            exists(select(role_closure.c.ancestor_id)),
+            exists(select(users_roles.c.user_id)),
+            exists(select(user_effective_permissions.c.user_id))
+        ))
+        has_roles, has_closure, has_links, has_effective = result.one()
+        if (has_roles and not has_closure) or (has_links and not has_effective):
+            await self.rebuild_rbac()
+            return True
+        return False
+
+    async def _descendants(self, role_id: UUID) -> List[UUID]:
+        result = await self._db.execute(
+            select(role_closure.c.descendant_id).where(role_closure.c.ancestor_id == role_id)
+        )
+        return list(result.scalars()) or [role_id]
+
+    async def _get_role_with_parents(self, role_id: UUID) -> RoleWithParentsEntity:
+        result = await self._db.execute(select(*Role.__table__.c).where(Role.id == role_id))
+        row = result.mappings().one_or_none()
+        if row is None:
+            raise RoleGetError(f"Роль с id {role_id} не найдена")
+
+        result = await self._db.execute(
+            select(*Role.__table__.c)
+            .join(role_parents, role_parents.c.parent_id == Role.id)
+            .where(role_parents.c.role_id == role_id)
+        )
+        return RoleWithParentsEntity(role=RoleEntity.from_row(row),
+                                     parents=[RoleEntity.from_row(parent) for parent in result.mappings()])
+
+    async def add_role_parent(self, role_id: UUID, parent_id: UUID) -> RoleWithParentsEntity:
+        """Унаследовать права родительской роли"""
+        await self._lock_rbac()
+
+        result = await self._db.execute(
+            select(func.count()).select_from(Role).where(Role.id == any_(uuid_array("role_ids", [role_id, parent_id])))
+        )
+        if result.scalar_one() < len({role_id, parent_id}):
+            raise RoleGetError(f"Роль не найдена")
+
+        result = await self._db.execute(
+            select(exists().where(and_(role_closure.c.ancestor_id == role_id,
+                                       role_closure.c.descendant_id == parent_id)))
+        )
+        if role_id == parent_id or result.scalar_one():
+            raise RoleInheritanceError(f"Наследование создаст цикл ролей")
+
+        result = await self._db.execute(
+            pg_insert(role_parents).values(role_id=role_id, parent_id=parent_id)
+            .on_conflict_do_nothing()
+            .returning(role_parents.c.role_id)
+        )
+        if result.scalar_one_or_none() is not None:
+            descendants = await self._descendants(role_id)
+            await self._rebuild_closure(descendants)
+            await self.refresh_effective_permissions(self._users_of_roles(descendants))
+            await ChangeLogRepository(self._db).record(change_repo.ROLE, change_repo.UPSERT, [role_id])
+
+        return await self._get_role_with_parents(role_id)
+
+    async def remove_role_parent(self, role_id: UUID, parent_id: UUID) -> RoleWithParentsEntity:
+        """Перестать наследовать права родительской роли"""
+        await self._lock_rbac()
+
+        result = await self._db.execute(
+            delete(role_parents)
+            .where(role_parents.c.role_id == role_id, role_parents.c.parent_id == parent_id)
+            .returning(role_parents.c.role_id)
+        )
+        if result.scalar_one_or_none() is not None:
+            descendants = await self._descendants(role_id)
+            await self._rebuild_closure(descendants)
+            await self.refresh_effective_permissions(self._users_of_roles(descendants))
+            await ChangeLogRepository(self._db).record(change_repo.ROLE, change_repo.UPSERT, [role_id])
+
+        return await self._get_role_with_parents(role_id)
+
+    async def has_permission(self, user_id: UUID, permission_ids: List[UUID]) -> bool:
+        """Есть ли у пользователя хотя бы одно из прав, по индексу (user_id, permission_id)"""
+        if fast_path.ENABLED:
+            try:
+                return await fast_path.fetch_one(self._db, fast_path.USER_HAS_PERMISSION, user_id, permission_ids) is not None
+            except FastQueryError as e:
+                raise PermissionGetError(f"Ошибка при проверке прав: {e}") from e
+
+        result = await self._db.execute(
+            select(exists().where(and_(
+                user_effective_permissions.c.user_id == user_id,
+                user_effective_permissions.c.permission_id == any_(uuid_array("permission_ids", permission_ids))
+            )))
+        )
+        return result.scalar_one()
+
+    async def granted_among(self, user_id: UUID, permission_ids: List[UUID]) -> set[UUID]:
+        """Какие из прав есть у пользователя, одним запросом"""
+        if fast_path.ENABLED:
+            try:
+                rows = await fast_path.fetch_all(self._db, fast_path.USER_PERMISSIONS_AMONG, user_id, permission_ids)
+            except FastQueryError as e:
+                raise PermissionGetError(f"Ошибка при проверке прав: {e}") from e
+            return {row["permission_id"] for row in rows}
+
+        result = await self._db.execute(
+            select(user_effective_permissions.c.permission_id).where(
+                user_effective_permissions.c.user_id == user_id,
+                user_effective_permissions.c.permission_id == any_(uuid_array("permission_ids", permission_ids))
+            )
+        )
+        return set(result.scalars())
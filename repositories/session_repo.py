@@ -8,7 +8,12 @@ from datetime import datetime
 from entities.entities import SessionEntity, UserEntity
 
 from models import Session as DBSess
-from exceptions.custom_exceptions import SessionCreateError, SessionGetError, SessionDeactivateError
+from repositories import fast_path, loaders
+from repositories.stats_repo import StatsRepository, session_counter
+from repositories import change_repo
+from repositories.change_repo import ChangeLogRepository
+from core.events import publish, EventType
+from exceptions.custom_exceptions import SessionCreateError, SessionGetError, SessionDeactivateError, FastQueryError
 
 class SessionRepository:
     def __init__(self, db: AsyncSession):
@@ -22,14 +27,9 @@ class SessionRepository:
         try:
             await self._db.flush()
             await self._db.refresh(session)
-            return SessionEntity(
-                id=session.id,
-                user_id=session.user_id,
-                is_active=session.is_active,
-                created_at=session.created_at,
-                expire_at=session.expire_at,
-                device=session.device,
-            )
+            await StatsRepository(self._db).add({session_counter(session.device): 1})
+            await ChangeLogRepository(self._db).record(change_repo.SESSION, change_repo.UPSERT, [session.id])
+            return SessionEntity.from_orm(session)
         except SQLAlchemyError as e:
             raise SessionCreateError(f"Не удалось создать сессию для user_id={user.id}: {e}") from e
 
@@ -50,14 +50,7 @@ class SessionRepository:
             if not session:
                 return []
             return [
-                SessionEntity(
-                    id=s.id,
-                    user_id=s.user_id,
-                    is_active=s.is_active,
-                    created_at=s.created_at,
-                    expire_at=s.expire_at,
-                    device=s.device,
-                ) for s in session
+                SessionEntity.from_orm(s) for s in session
             ]
         except SQLAlchemyError as e:
             raise SessionGetError(f"Ошибка при получении активной сессии: {e}") from e
@@ -66,6 +59,14 @@ class SessionRepository:
     async def get_active_by_id(self, session: SessionEntity) -> SessionEntity | None:
         """Получить активную сессию по ID"""
         try:
+            if loaders.ENABLED and not self._db.in_transaction():
+                row = await loaders.active_sessions.load(session.id)
+                return SessionEntity.from_row(row) if row else None
+
+            if fast_path.ENABLED:
+                row = await fast_path.fetch_one(self._db, fast_path.SESSION_ACTIVE_BY_ID, session.id)
+                return SessionEntity.from_row(row) if row else None
+
             session_orm = await self._db.execute(
                 select(DBSess).where(
                     and_(
@@ -78,15 +79,8 @@ class SessionRepository:
             if not session_orm:
                 return None
 
-            return SessionEntity(
-                id=session_orm.id,
-                user_id=session_orm.user_id,
-                is_active=session_orm.is_active,
-                created_at=session_orm.created_at,
-                expire_at=session_orm.expire_at,
-                device=session_orm.device,
-            )
-        except SQLAlchemyError as e:
+            return SessionEntity.from_orm(session_orm)
+        except (SQLAlchemyError, FastQueryError) as e:
             raise SessionGetError(f"Ошибка при получении сессии id={session.id}: {e}") from e
 
 
@@ -101,6 +95,9 @@ class SessionRepository:
                 orm_session.is_active = False
                 await self._db.flush()
                 await self._db.refresh(orm_session)
+                await StatsRepository(self._db).add({session_counter(orm_session.device): -1})
+                await ChangeLogRepository(self._db).record(change_repo.SESSION, change_repo.DELETE, [session.id])
+                await publish(self._db, EventType.SESSION_REVOKED, [session.id])
 
                 session_entity.is_active = False
 
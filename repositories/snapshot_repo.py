@@ -0,0 +1,61 @@
+from collections import defaultdict
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select, null
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from entities.entities import SessionEntity, UserEntity
+from models import Session as DBSess, User, users_roles, user_effective_permissions
+
+
+class SnapshotRepository:
+    """Чтение всего, что нужно для проверки токенов без базы: активные сессии, их пользователи, права и роли"""
+
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def load(self) -> tuple[dict[UUID, SessionEntity], dict[UUID, UserEntity],
+                                  dict[UUID, frozenset[UUID]], dict[UUID, list[UUID]]]:
+        # Один снимок базы на все запросы
+        await self._db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+        active_users = (
+            select(DBSess.user_id)
+            .join(User, User.id == DBSess.user_id)
+            .where(DBSess.is_active == True, DBSess.expire_at > datetime.now(), User.is_active == True)
+            .distinct()
+            .subquery()
+        )
+
+        result = await self._db.execute(
+            select(DBSess).join(User, User.id == DBSess.user_id)
+            .where(DBSess.is_active == True, DBSess.expire_at > datetime.now(), User.is_active == True)
+        )
+        sessions = {session.id: SessionEntity.from_orm(session) for session in result.scalars()}
+
+        result = await self._db.execute(
+            select(*[column for column in User.__table__.c if column.key != "hash_password"],
+                   null().label("hash_password"))
+            .where(User.id.in_(select(active_users.c.user_id)))
+        )
+        users = {row["id"]: UserEntity.from_row(row) for row in result.mappings()}
+
+        permissions = defaultdict(set)
+        result = await self._db.execute(
+            select(user_effective_permissions.c.user_id, user_effective_permissions.c.permission_id)
+            .where(user_effective_permissions.c.user_id.in_(select(active_users.c.user_id)))
+        )
+        for user_id, permission_id in result:
+            permissions[user_id].add(permission_id)
+
+        role_ids = defaultdict(list)
+        result = await self._db.execute(
+            select(users_roles.c.user_id, users_roles.c.role_id)
+            .where(users_roles.c.user_id.in_(select(active_users.c.user_id)))
+        )
+        for user_id, role_id in result:
+            role_ids[user_id].append(role_id)
+
+        return (sessions, users, {user_id: frozenset(ids) for user_id, ids in permissions.items()},
+                dict(role_ids))
@@ -0,0 +1,125 @@
+"""
+Счетчики статистики в таблице stats_counters.
+
+Репозитории меняют счетчики в той же транзакции, что и сами данные, поэтому
+откат откатывает и счетчик. Каждый счетчик разбит на STATS_SHARDS строк, запись
+прибавляет дельту к случайному шарду: параллельные транзакции реже ждут
+блокировку одной и той же строки. Чтение суммирует шарды, таблица маленькая и
+не растет вместе с users и sessions.
+
+Внутри одной транзакции счетчики меняются в порядке сессии -> пользователи -> роли,
+чтобы транзакции не брали блокировки шардов навстречу друг другу.
+
+Сверка не блокирует таблицу: точные значения и суммы шардов читаются одним
+запросом, то есть по одному снимку базы, и расхождение между ними не зависит от
+транзакций, закоммиченных позже. Оно прибавляется к счетчикам обычной дельтой,
+поэтому записи шардов не ждут полного подсчета по таблицам.
+"""
+import random
+from typing import Dict
+from uuid import UUID
+
+from sqlalchemy import select, delete, func, literal, cast, union_all, any_, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models import StatCounter, User, Session, users_roles, uuid_array
+
+ACTIVE_USERS = "users.active"
+ACTIVE_SESSIONS = "sessions.active:"
+ROLE_USERS = "roles.users:"
+# Сверки на разных воркерах не должны прибавить одно и то же расхождение дважды
+RECONCILE_LOCK_KEY = 7_340_102
+
+
+def session_counter(device) -> str:
+    return ACTIVE_SESSIONS + str(getattr(device, "value", device))
+
+
+def role_counter(role_id: UUID) -> str:
+    return ROLE_USERS + str(role_id)
+
+
+class StatsRepository:
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    @staticmethod
+    def _upsert(stmt):
+        return stmt.on_conflict_do_update(
+            index_elements=[StatCounter.name, StatCounter.shard],
+            set_={"value": StatCounter.value + stmt.excluded.value}
+        )
+
+    async def add(self, deltas: Dict[str, int]):
+        """Прибавить дельты к счетчикам"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        shard = random.randrange(settings.STATS_SHARDS)
+        await self._db.execute(self._upsert(pg_insert(StatCounter).values([
+            {"name": name, "shard": shard, "value": deltas[name]} for name in sorted(deltas)
+        ])))
+
+    async def add_role_users(self, user_ids, sign: int):
+        """Прибавить sign к счетчикам всех ролей указанных пользователей, подсчет идет в базе"""
+        if not user_ids:
+            return
+        name = literal(ROLE_USERS) + cast(users_roles.c.role_id, String)
+        counts = (
+            select(name.label("name"), literal(random.randrange(settings.STATS_SHARDS)).label("shard"),
+                   (func.count() * sign).label("value"))
+            .where(users_roles.c.user_id == any_(uuid_array("stats_user_ids", user_ids)))
+            .group_by(users_roles.c.role_id)
+            .order_by(name)
+        )
+        await self._db.execute(self._upsert(
+            pg_insert(StatCounter).from_select(["name", "shard", "value"], counts)
+        ))
+
+    async def totals(self) -> Dict[str, int]:
+        result = await self._db.execute(
+            select(StatCounter.name, func.sum(StatCounter.value)).group_by(StatCounter.name)
+        )
+        return {name: int(value) for name, value in result}
+
+    @staticmethod
+    def _exact_query():
+        """Точные значения счетчиков полным подсчетом по таблицам"""
+        active_users = select(literal(ACTIVE_USERS).label("name"), func.count().label("value")) \
+            .select_from(User).where(User.is_active == True)
+        active_sessions = select((literal(ACTIVE_SESSIONS) + Session.device).label("name"), func.count()) \
+            .where(Session.is_active == True).group_by(Session.device)
+        role_users = select((literal(ROLE_USERS) + cast(users_roles.c.role_id, String)).label("name"), func.count()) \
+            .join(User, User.id == users_roles.c.user_id).where(User.is_active == True) \
+            .group_by(users_roles.c.role_id)
+        return union_all(active_users, active_sessions, role_users)
+
+    async def reconcile(self, wait: bool = True) -> int:
+        """
+        Исправить разошедшиеся счетчики, вернуть их число.
+
+        Транзакция должна быть READ COMMITTED: запрос после advisory-блокировки видит
+        поправки предыдущей сверки. Если wait=False и другая сверка уже идет, возвращает 0.
+        """
+        if wait:
+            await self._db.execute(select(func.pg_advisory_xact_lock(RECONCILE_LOCK_KEY)))
+        elif not (await self._db.execute(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK_KEY)))).scalar():
+            return 0
+
+        exact = self._exact_query().subquery()
+        current = select(StatCounter.name, func.sum(StatCounter.value).label("value")) \
+            .group_by(StatCounter.name).subquery()
+        drift = func.coalesce(exact.c.value, 0) - func.coalesce(current.c.value, 0)
+        result = await self._db.execute(
+            select(func.coalesce(exact.c.name, current.c.name), drift)
+            .select_from(exact.join(current, exact.c.name == current.c.name, full=True))
+            .where(drift != 0)
+        )
+        deltas = {name: int(value) for name, value in result}
+
+        await self.add(deltas)
+        # Удалять можно только нулевые строки: сумма не меняется, даже если шард параллельно обновили
+        await self._db.execute(delete(StatCounter).where(StatCounter.value == 0))
+        return len(deltas)
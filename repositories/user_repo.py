@@ -1,18 +1,37 @@
 import datetime
-from typing import List
+from collections import defaultdict
+from typing import List, AsyncIterator
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, insert, delete, and_, or_, case, null, any_, bindparam, tuple_, union_all, func, \
+    String
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from uuid import UUID
 
 from sqlalchemy.orm import selectinload
 from sqlalchemy.testing.suite.test_reflection import users
 
-from models import User as DBUser, Role as DBRole
-from entities.entities import UserEntity, UserWithRolesEntity, RoleEntity
+from models import User as DBUser, Role as DBRole, Session as DBSession, UserArchive, users_roles, uuid_array
+from entities.entities import UserEntity, UserWithRolesEntity, RoleEntity, PageEntity, BulkDeleteReportEntity, \
+    UserProfileEntity
+from repositories import fast_path, loaders, caches
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.stats_repo import StatsRepository, ACTIVE_USERS, session_counter
+from repositories import change_repo
+from repositories.change_repo import ChangeLogRepository
+from core.events import publish, EventType
+from core.config import settings
+from core.pagination import encode_cursor, decode_cursor
 from exceptions.custom_exceptions import UserEmailExistsError, UserCreateError, UserGetError, UserDeleteError, \
-    UserUpdateError
+    UserUpdateError, FastQueryError
+
+USER_LIST_COLUMNS = [column for column in DBUser.__table__.c if column.key != "hash_password"]
+ARCHIVE_USER_COLUMNS = [column.key for column in DBUser.__table__.c]
+PROFILE_COLUMNS = [DBUser.__table__.c[name] for name in UserProfileEntity.__slots__]
+SEARCH_COLUMNS = (DBUser.email, DBUser.first_name, DBUser.last_name, DBUser.patronymic)
+COPY_USER_COLUMNS = ("id", "email", "first_name", "last_name", "patronymic", "hash_password",
+                     "is_active", "created_at", "updated_at")
 
 
 class UserRepository:
@@ -32,33 +51,22 @@ class UserRepository:
 
             user = result.scalar_one_or_none()
             if not user:
-                return None
+                return await self._restore_from_archive(email)
 
             user.is_active = True
             user.deleted_at = None
 
             await self._db.flush()
             await self._db.refresh(user)
+            stats = StatsRepository(self._db)
+            await stats.add({ACTIVE_USERS: 1})
+            await stats.add_role_users([user.id], 1)
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, [user.id])
+            await publish(self._db, EventType.USER_UPDATED, [user.id])
 
             return UserWithRolesEntity(
-                user=UserEntity(
-                    id=user.id,
-                    email=user.email,
-                    first_name=user.first_name,
-                    last_name=user.last_name,
-                    patronymic=user.patronymic,
-                    is_active=user.is_active,
-                    created_at=user.created_at,
-                    updated_at=user.updated_at,
-                    hash_password=user.hash_password,
-                    deleted_at=user.deleted_at
-                ),
-                roles=[RoleEntity(
-                    id=role.id,
-                    name=role.name,
-                    created_at=role.created_at,
-                    updated_at=role.updated_at
-                ) for role in user.roles]
+                user=UserEntity.from_orm(user),
+                roles=[RoleEntity.from_orm(role) for role in user.roles]
             )
 
         except IntegrityError as e:
@@ -66,6 +74,77 @@ class UserRepository:
         except SQLAlchemyError as e:
             raise UserUpdateError(e) from e
 
+    async def _restore_from_archive(self, email: str) -> UserWithRolesEntity | None:
+        """Вернуть последнюю архивную запись с этим email в рабочую таблицу вместе с ролями"""
+        latest = (
+            select(UserArchive.id)
+            .where(UserArchive.email == email)
+            .order_by(UserArchive.archived_at.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        result = await self._db.execute(
+            delete(UserArchive).where(UserArchive.id == latest).returning(*UserArchive.__table__.c)
+        )
+        row = result.mappings().one_or_none()
+        if row is None:
+            return None
+
+        now = datetime.datetime.now()
+        values = {column: row[column] for column in ARCHIVE_USER_COLUMNS}
+        values.update(is_active=True, deleted_at=None, updated_at=now)
+        await self._db.execute(insert(DBUser).values(**values))
+        await StatsRepository(self._db).add({ACTIVE_USERS: 1})
+
+        role_perm_repo = RolePermissionRepository(self._db)
+        if row["role_ids"]:
+            # Роли, удаленные за время хранения в архиве, пропускаются
+            await role_perm_repo.add_user_roles([row["id"]], list(row["role_ids"]))
+        await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, [row["id"]])
+        await publish(self._db, EventType.USER_UPDATED, [row["id"]])
+
+        user = UserEntity.from_row({**values, "hash_password": None})
+        return (await role_perm_repo.get_users_roles([user]))[0]
+
+    async def archive_deleted(self, deleted_before: datetime.datetime, limit: int) -> int:
+        """Перенести пачку давно удаленных пользователей и их связи с ролями в users_archive"""
+        try:
+            result = await self._db.execute(
+                select(DBUser.id)
+                .where(DBUser.is_active == False, DBUser.deleted_at < deleted_before)
+                .order_by(DBUser.deleted_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            user_ids = result.scalars().all()
+            if not user_ids:
+                return 0
+
+            role_ids = func.array(
+                select(users_roles.c.role_id).where(users_roles.c.user_id == DBUser.id).scalar_subquery()
+            )
+            await self._db.execute(
+                insert(UserArchive).from_select(
+                    [*ARCHIVE_USER_COLUMNS, "role_ids", "archived_at"],
+                    select(*DBUser.__table__.c, role_ids, func.now())
+                    .where(DBUser.id == any_(uuid_array("user_ids", user_ids)))
+                )
+            )
+            await self._db.execute(delete(users_roles).where(users_roles.c.user_id == any_(uuid_array("user_ids", user_ids))))
+
+            # Активные сессии удаленных пользователей уйдут каскадом вместе с ними
+            sessions = await self._db.execute(
+                select(DBSession.device, func.count())
+                .where(DBSession.user_id == any_(uuid_array("user_ids", user_ids)), DBSession.is_active == True)
+                .group_by(DBSession.device)
+            )
+            await StatsRepository(self._db).add({session_counter(device): -count for device, count in sessions})
+            # Сессии и итоговые права удаляются каскадом по внешним ключам
+            await self._db.execute(delete(DBUser).where(DBUser.id == any_(uuid_array("user_ids", user_ids))))
+            return len(user_ids)
+        except SQLAlchemyError as e:
+            raise UserDeleteError(f"Ошибка при архивации пользователей: {e}") from e
+
     async def update(self, user: UserEntity) -> UserWithRolesEntity:
         try:
             stmt = select(DBUser).options(selectinload(DBUser.roles)).where(
@@ -91,26 +170,13 @@ class UserRepository:
 
             await self._db.flush()
             await self._db.refresh(user_orm)
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, [user_orm.id])
+            await publish(self._db, EventType.USER_UPDATED, [user_orm.id])
+            caches.user_profiles.invalidate([user_orm.id])
 
             return UserWithRolesEntity(
-                user=UserEntity(
-                    id=user_orm.id,
-                    email=user_orm.email,
-                    first_name=user_orm.first_name,
-                    last_name=user_orm.last_name,
-                    patronymic=user_orm.patronymic,
-                    is_active=user_orm.is_active,
-                    created_at=user_orm.created_at,
-                    updated_at=user_orm.updated_at,
-                    hash_password=user_orm.hash_password,
-                    deleted_at=user_orm.deleted_at
-                ),
-                roles=[RoleEntity(
-                    id=role.id,
-                    name=role.name,
-                    created_at=role.created_at,
-                    updated_at=role.updated_at
-                ) for role in user_orm.roles]
+                user=UserEntity.from_orm(user_orm),
+                roles=[RoleEntity.from_orm(role) for role in user_orm.roles]
             )
 
         except IntegrityError as e:
@@ -120,6 +186,10 @@ class UserRepository:
 
     async def get_by_email(self, email: str) -> UserEntity | None:
         try:
+            if fast_path.ENABLED:
+                row = await fast_path.fetch_one(self._db, fast_path.USER_ACTIVE_BY_EMAIL, email)
+                return UserEntity.from_row(row) if row else None
+
             result = await self._db.execute(
                 select(DBUser).where(
                     and_(
@@ -132,18 +202,8 @@ class UserRepository:
             if user is None:
                 return None
             else:
-                return UserEntity(
-                    id=user.id,
-                    email=user.email,
-                    first_name=user.first_name,
-                    last_name=user.last_name,
-                    patronymic=user.patronymic,
-                    is_active=user.is_active,
-                    created_at=user.created_at,
-                    updated_at=user.updated_at,
-                    hash_password=user.hash_password
-                )
-        except SQLAlchemyError as e:
+                return UserEntity.from_orm(user)
+        except (SQLAlchemyError, FastQueryError) as e:
             raise UserGetError(f"Ошибка при получении пользователя с email={email}: {e}")
 
     async def create(self, user: UserEntity) -> UserEntity:
@@ -161,6 +221,10 @@ class UserRepository:
         try:
             await self._db.flush()
             await self._db.refresh(user_orm)
+            if user_orm.is_active:
+                await StatsRepository(self._db).add({ACTIVE_USERS: 1})
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, [user_orm.id])
+            await publish(self._db, EventType.USER_UPDATED, [user_orm.id])
 
             user.id = user_orm.id
             user.email = user_orm.email
@@ -176,8 +240,41 @@ class UserRepository:
         except SQLAlchemyError as e:
             raise UserCreateError(f"Не удалось создать пользователя {user.email}: {e}")
 
+    async def get_existing_emails(self, emails: List[str]) -> set[str]:
+        """Какие из email уже заняты, включая удаленных пользователей"""
+        if not emails:
+            return set()
+        try:
+            result = await self._db.execute(
+                select(DBUser.email).where(DBUser.email == any_(bindparam("emails", emails, type_=ARRAY(String))))
+            )
+            return set(result.scalars())
+        except SQLAlchemyError as e:
+            raise UserGetError(f"Ошибка при проверке email: {e}") from e
+
+    async def copy_create(self, users: List[UserEntity]) -> int:
+        """Массово создать пользователей через COPY, id и даты должны быть заполнены заранее"""
+        try:
+            await fast_path.copy_records(
+                self._db, "users", list(COPY_USER_COLUMNS),
+                [tuple(getattr(user, column) for column in COPY_USER_COLUMNS) for user in users]
+            )
+            await StatsRepository(self._db).add({ACTIVE_USERS: sum(1 for user in users if user.is_active)})
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.UPSERT, [user.id for user in users])
+            return len(users)
+        except FastQueryError as e:
+            raise UserCreateError(f"Не удалось загрузить пользователей: {e}") from e
+
     async def get_by_id(self, user_id: UUID) -> UserEntity | None:
         try:
+            if loaders.ENABLED and not self._db.in_transaction():
+                row = await loaders.active_users.load(user_id)
+                return UserEntity.from_row(row) if row else None
+
+            if fast_path.ENABLED:
+                row = await fast_path.fetch_one(self._db, fast_path.USER_ACTIVE_BY_ID, user_id)
+                return UserEntity.from_row(row) if row else None
+
             result = await self._db.execute(
                 select(DBUser).where(
                     and_(
@@ -189,97 +286,302 @@ class UserRepository:
             user = result.scalar_one_or_none()
             if not user:
                 return None
-            return UserEntity(
-                id=user.id,
-                email=user.email,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                patronymic=user.patronymic,
-                is_active=user.is_active,
-                created_at=user.created_at,
-                updated_at=user.updated_at,
-                hash_password=user.hash_password
-            )
-        except SQLAlchemyError as e:
+            return UserEntity.from_orm(user)
+        except (SQLAlchemyError, FastQueryError) as e:
             raise UserGetError(f"Ошибка при получении пользователя id={user_id}: {e}") from e
 
+    async def get_profiles(self, user_ids: List[UUID]) -> dict[UUID, UserProfileEntity]:
+        """Профили активных пользователей через кеш, промахи читаются одним запросом"""
+        found, misses = caches.user_profiles.get_many(user_ids)
+        if misses:
+            generation = caches.user_profiles.generation
+            try:
+                result = await self._db.execute(
+                    select(*PROFILE_COLUMNS)
+                    .where(DBUser.id == any_(uuid_array("user_ids", misses)), DBUser.is_active == True)
+                )
+            except SQLAlchemyError as e:
+                raise UserGetError(f"Ошибка при получении профилей: {e}") from e
+            loaded = {row["id"]: UserProfileEntity.from_row(row) for row in result.mappings()}
+            # Отсутствующие тоже кешируются: повторные запросы неизвестных id не идут в базу
+            loaded.update((user_id, None) for user_id in misses if user_id not in loaded)
+            caches.user_profiles.put_many(loaded, generation)
+            found.update(loaded)
+        return {user_id: profile for user_id, profile in found.items() if profile is not None}
+
     async def soft_delete(self, user: UserEntity):
         try:
             user = await self._db.get(DBUser, user.id)
             if not user:
                 raise ValueError(f"Пользователь id={user.id} не найден")
 
+            was_active = user.is_active
             user.is_active = False
             user.deleted_at = datetime.datetime.now()
 
             await self._db.flush()
+            if was_active:
+                stats = StatsRepository(self._db)
+                await stats.add({ACTIVE_USERS: -1})
+                await stats.add_role_users([user.id], -1)
+            await ChangeLogRepository(self._db).record(change_repo.USER, change_repo.DELETE, [user.id])
+            await publish(self._db, EventType.USER_DELETED, [user.id])
+            caches.user_profiles.invalidate([user.id])
         except SQLAlchemyError as e:
             raise UserDeleteError(f"Ошибка при деактивации пользователя id={user.id}: {e}") from e
 
-    async def get(self,
-                  ids: List[UUID] | None,
-                  emails: List[str] | None,
-                  created_from: datetime.datetime | None,
-                  created_to: datetime.datetime | None,
-                  updated_from: datetime.datetime | None,
-                  updated_to: datetime.datetime | None,
-                  is_active: bool | None,
-                  deleted_from: datetime.datetime | None,
-                  deleted_to: datetime.datetime | None,
-                  role_ids: List[UUID] | None):
-
-        stmt = select(DBUser).options(selectinload(DBUser.roles))
+    async def bulk_soft_delete(self,
+                               ids: List[UUID] | None,
+                               emails: List[str] | None,
+                               created_from: datetime.datetime | None,
+                               created_to: datetime.datetime | None,
+                               updated_from: datetime.datetime | None,
+                               updated_to: datetime.datetime | None,
+                               role_ids: List[UUID] | None,
+                               exclude_id: UUID | None = None) -> BulkDeleteReportEntity:
+        """Деактивировать всех подходящих под фильтры активных пользователей и их сессии двумя UPDATE"""
+        conditions = self._filters(ids=ids, emails=emails,
+                                   created_from=created_from, created_to=created_to,
+                                   updated_from=updated_from, updated_to=updated_to,
+                                   is_active=True, deleted_from=None, deleted_to=None,
+                                   role_ids=role_ids)
+        if exclude_id:
+            conditions.append(DBUser.id != exclude_id)
+
+        now = datetime.datetime.now()
+        try:
+            sessions = await self._db.execute(
+                update(DBSession)
+                .where(DBSession.user_id.in_(select(DBUser.id).where(*conditions)),
+                       DBSession.is_active == True)
+                .values(is_active=False)
+                .returning(DBSession.id, DBSession.device)
+                .execution_options(synchronize_session=False)
+            )
+            session_rows = sessions.all()
+            session_ids = [row.id for row in session_rows]
+            users = await self._db.execute(
+                update(DBUser)
+                .where(*conditions)
+                .values(is_active=False, deleted_at=now, updated_at=now)
+                .returning(DBUser.id)
+                .execution_options(synchronize_session=False)
+            )
+            user_ids = users.scalars().all()
+
+            stats = StatsRepository(self._db)
+            session_deltas = defaultdict(int)
+            for row in session_rows:
+                session_deltas[session_counter(row.device)] -= 1
+            await stats.add(session_deltas)
+            await stats.add({ACTIVE_USERS: -len(user_ids)})
+            await stats.add_role_users(user_ids, -1)
+
+            changes = ChangeLogRepository(self._db)
+            await changes.record(change_repo.SESSION, change_repo.DELETE, session_ids)
+            await changes.record(change_repo.USER, change_repo.DELETE, user_ids)
+
+            if session_ids:
+                await publish(self._db, EventType.SESSION_REVOKED, session_ids)
+            if user_ids:
+                await publish(self._db, EventType.USER_DELETED, user_ids)
+                caches.user_profiles.invalidate(user_ids)
+        except SQLAlchemyError as e:
+            raise UserDeleteError(f"Ошибка при массовой деактивации пользователей: {e}") from e
+
+        return BulkDeleteReportEntity(users=len(user_ids), sessions=len(session_ids))
+
+    @staticmethod
+    def _filters(ids: List[UUID] | None,
+                 emails: List[str] | None,
+                 created_from: datetime.datetime | None,
+                 created_to: datetime.datetime | None,
+                 updated_from: datetime.datetime | None,
+                 updated_to: datetime.datetime | None,
+                 is_active: bool | None,
+                 deleted_from: datetime.datetime | None,
+                 deleted_to: datetime.datetime | None,
+                 role_ids: List[UUID] | None,
+                 table=DBUser.__table__) -> list:
+        """Условия выборки пользователей по фильтрам UsersRead, для users или users_archive"""
+        conditions = []
+        columns = table.c
 
         if ids:
-            stmt = stmt.where(DBUser.id.in_(ids))
+            conditions.append(columns.id == any_(uuid_array("filter_ids", ids)))
         if emails:
-            stmt = stmt.where(DBUser.email.in_(emails))
+            conditions.append(columns.email == any_(bindparam("filter_emails", list(emails), type_=ARRAY(String), unique=True)))
 
         if created_from:
-            stmt = stmt.where(DBUser.created_at >= created_from)
+            conditions.append(columns.created_at >= created_from)
         if created_to:
-            stmt = stmt.where(DBUser.created_at <= created_to)
+            conditions.append(columns.created_at <= created_to)
 
         if updated_from:
-            stmt = stmt.where(DBUser.updated_at >= updated_from)
+            conditions.append(columns.updated_at >= updated_from)
         if updated_to:
-            stmt = stmt.where(DBUser.updated_at <= updated_to)
+            conditions.append(columns.updated_at <= updated_to)
 
         if is_active is not None:
-            stmt = stmt.where(DBUser.is_active == is_active)
+            conditions.append(columns.is_active == is_active)
 
         if is_active == False and deleted_from:
-            stmt = stmt.where(DBUser.deleted_at >= deleted_from)
+            conditions.append(columns.deleted_at >= deleted_from)
         if is_active == False and deleted_to:
-            stmt = stmt.where(DBUser.deleted_at <= deleted_to)
+            conditions.append(columns.deleted_at <= deleted_to)
+
+        if role_ids and table is UserArchive.__table__:
+            conditions.append(columns.role_ids.overlap(uuid_array("filter_role_ids", role_ids)))
+        elif role_ids:
+            conditions.append(columns.id.in_(
+                select(users_roles.c.user_id).where(users_roles.c.role_id == any_(uuid_array("filter_role_ids", role_ids)))
+            ))
+
+        return conditions
+
+    def _list_source(self, **filters):
+        """
+        Строки пользователей под фильтры без хеша пароля.
+        Удаленных (is_active=False) ищем и в рабочей таблице, и в архиве.
+        """
+        hot = select(*USER_LIST_COLUMNS, null().label("hash_password")).where(*self._filters(**filters))
+        if filters["is_active"] is not False:
+            return hot.subquery("users_list")
+
+        archive = UserArchive.__table__
+        cold = select(*[archive.c[column.key] for column in USER_LIST_COLUMNS], null().label("hash_password")).where(
+            *self._filters(**filters, table=archive)
+        )
+        return union_all(hot, cold).subquery("users_list")
 
-        if role_ids:
-            stmt = stmt.where(DBUser.roles.any(DBRole.id.in_(role_ids)))
+    async def _with_roles(self, users: List[UserEntity], include_archive: bool = False) -> List[UserWithRolesEntity]:
+        """Подгрузить роли для пачки пользователей одним запросом"""
+        if not users:
+            return []
 
-        results = await self._db.execute(stmt)
-        users_orm = results.scalars().all()
-
-        return [
-            UserWithRolesEntity(
-                user=UserEntity(
-                    id=user_orm.id,
-                    email=user_orm.email,
-                    first_name=user_orm.first_name,
-                    last_name=user_orm.last_name,
-                    patronymic=user_orm.patronymic,
-                    is_active=user_orm.is_active,
-                    created_at=user_orm.created_at,
-                    updated_at=user_orm.updated_at,
-                    deleted_at=user_orm.deleted_at,
-                ),
-                roles=[RoleEntity(
-                    id=role_orm.id,
-                    name=role_orm.name,
-                    created_at=role_orm.created_at,
-                    updated_at=role_orm.updated_at
-                ) for role_orm in user_orm.roles]
-            ) for user_orm in users_orm]
+        user_ids = [user.id for user in users]
+        links = select(users_roles.c.user_id, users_roles.c.role_id).where(
+            users_roles.c.user_id == any_(uuid_array("user_ids", user_ids))
+        )
+        if include_archive:
+            links = union_all(links, select(
+                UserArchive.id.label("user_id"), func.unnest(UserArchive.role_ids).label("role_id")
+            ).where(UserArchive.id == any_(uuid_array("user_ids", user_ids))))
+        links = links.subquery("links")
+
+        roles_by_user = defaultdict(list)
+        results = await self._db.execute(
+            select(links.c.user_id, *DBRole.__table__.c).join(DBRole, DBRole.id == links.c.role_id)
+        )
+        for row in results.mappings():
+            roles_by_user[row["user_id"]].append(RoleEntity.from_row(row))
 
+        return [UserWithRolesEntity(user=user, roles=roles_by_user[user.id]) for user in users]
 
+    async def get(self,
+                  ids: List[UUID] | None,
+                  emails: List[str] | None,
+                  created_from: datetime.datetime | None,
+                  created_to: datetime.datetime | None,
+                  updated_from: datetime.datetime | None,
+                  updated_to: datetime.datetime | None,
+                  is_active: bool | None,
+                  deleted_from: datetime.datetime | None,
+                  deleted_to: datetime.datetime | None,
+                  role_ids: List[UUID] | None,
+                  cursor: str | None = None,
+                  limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
+
+        # Хеш пароля в админской выборке не нужен, читаем строки без ORM
+        source = self._list_source(ids=ids, emails=emails,
+                                   created_from=created_from, created_to=created_to,
+                                   updated_from=updated_from, updated_to=updated_to,
+                                   is_active=is_active, deleted_from=deleted_from, deleted_to=deleted_to,
+                                   role_ids=role_ids)
+        stmt = select(source)
+
+        # Keyset по (created_at, id), индексы ix_users_created_at_id и ix_users_archive_created_at_id
+        if cursor:
+            created_at, user_id = decode_cursor(cursor, 2)
+            stmt = stmt.where(tuple_(source.c.created_at, source.c.id) > tuple_(created_at, user_id))
+        stmt = stmt.order_by(source.c.created_at, source.c.id).limit(limit + 1)
+
+        results = await self._db.execute(stmt)
+        users = [UserEntity.from_row(row) for row in results.mappings()]
+
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
+
+        return PageEntity(items=await self._with_roles(users, include_archive=is_active is False),
+                          next_cursor=next_cursor)
+
+    async def search(self, query: str, cursor: str | None = None,
+                     limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
+        """
+        Поиск активных пользователей по подстроке в email и ФИО.
+
+        Отбор идет через ILIKE по триграммным индексам, сначала точное совпадение email,
+        потом совпадения с начала поля, потом остальные. Keyset по (rank, created_at, id).
+        """
+        query = query.strip().lower()
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+        rank = case(
+            (DBUser.email == query, 0),
+            (or_(*(column.ilike(f"{escaped}%", escape="\\") for column in SEARCH_COLUMNS)), 1),
+            else_=2
+        ).label("rank")
+        found = (
+            select(*USER_LIST_COLUMNS, null().label("hash_password"), rank)
+            .where(DBUser.is_active == True,
+                   or_(*(column.ilike(f"%{escaped}%", escape="\\") for column in SEARCH_COLUMNS)))
+            .subquery("found")
+        )
+
+        stmt = select(found)
+        if cursor:
+            last_rank, created_at, user_id = decode_cursor(cursor, 3)
+            stmt = stmt.where(tuple_(found.c.rank, found.c.created_at, found.c.id) > tuple_(last_rank, created_at, user_id))
+        stmt = stmt.order_by(found.c.rank, found.c.created_at, found.c.id).limit(limit + 1)
 
+        results = await self._db.execute(stmt)
+        rows = results.mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["created_at"], rows[-1]["id"])
+
+        users = [UserEntity.from_row(row) for row in rows]
+        return PageEntity(items=await self._with_roles(users), next_cursor=next_cursor)
+
+    async def stream(self,
+                     ids: List[UUID] | None,
+                     emails: List[str] | None,
+                     created_from: datetime.datetime | None,
+                     created_to: datetime.datetime | None,
+                     updated_from: datetime.datetime | None,
+                     updated_to: datetime.datetime | None,
+                     is_active: bool | None,
+                     deleted_from: datetime.datetime | None,
+                     deleted_to: datetime.datetime | None,
+                     role_ids: List[UUID] | None,
+                     chunk_size: int = settings.EXPORT_CHUNK_SIZE) -> AsyncIterator[List[UserWithRolesEntity]]:
+        """Отдавать пользователей с ролями пачками через серверный курсор, не загружая всю таблицу в память"""
+        source = self._list_source(ids=ids, emails=emails,
+                                   created_from=created_from, created_to=created_to,
+                                   updated_from=updated_from, updated_to=updated_to,
+                                   is_active=is_active, deleted_from=deleted_from, deleted_to=deleted_to,
+                                   role_ids=role_ids)
+        stmt = (
+            select(source)
+            .order_by(source.c.created_at, source.c.id)
+            .execution_options(yield_per=chunk_size)
+        )
 
+        result = await self._db.stream(stmt)
+        async for partition in result.mappings().partitions(chunk_size):
+            users = [UserEntity.from_row(row) for row in partition]
+            yield await self._with_roles(users, include_archive=is_active is False)
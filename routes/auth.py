@@ -9,8 +9,12 @@ from repositories.session_repo import SessionRepository
 from services.auth_service import AuthService
 from exceptions.custom_exceptions import UnauthorizedException
 from dependencies import get_current_user
+from core.responses import FastJSONResponse
+from core.latency_budget import budgeted_route
+from core.config import settings
 
-router = APIRouter(prefix="/auth")
+router = APIRouter(prefix="/auth", default_response_class=FastJSONResponse,
+                   route_class=budgeted_route(settings.LATENCY_BUDGET_AUTH))
 
 
 @router.post("/login", response_model=TokenResponse)
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from schemas.change import ChangesRead
+
+from database import AsyncSessionLocal
+from dependencies import get_permission_user
+from core.responses import FastJSONResponse
+from core.latency_budget import budgeted_route, latency_budget
+from core.config import settings
+
+from services.change_service import ChangeFeedService
+
+router = APIRouter(prefix="/changes", default_response_class=FastJSONResponse,
+                   route_class=budgeted_route(settings.LATENCY_BUDGET_ADMIN))
+
+
+@router.get("", description="ADMIN")
+async def get_changes(filters: ChangesRead = Depends(),
+                      permission_user = Depends(get_permission_user(permission_name="changes:get"))):
+    try:
+        service = ChangeFeedService(session_factory=AsyncSessionLocal)
+        return FastJSONResponse(await service.get_changes(since=filters.since, limit=filters.limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stream", description="ADMIN")
+@latency_budget(None)
+async def stream_changes(since: str | None = None,
+                         last_event_id: str | None = Header(None),
+                         permission_user = Depends(get_permission_user(permission_name="changes:get"))):
+    # Переподключившийся EventSource присылает курсор последней пачки в Last-Event-ID
+    since = last_event_id or since
+    service = ChangeFeedService(session_factory=AsyncSessionLocal)
+    stream = service.stream(since)
+    try:
+        # Курсор проверяется до первой строки потока, чтобы ошибка ушла обычным 400
+        first = await anext(stream)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def content():
+        yield first
+        async for chunk in stream:
+            yield chunk
+
+    return StreamingResponse(content(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
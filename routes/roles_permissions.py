@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -8,15 +8,20 @@ from repositories.role_perm_repo import RolePermissionRepository
 
 from services.role_service import RolePermissionService
 
-from schemas.role import RoleCreate, RoleRead, RolePermissionCreate
+from schemas.role import RoleCreate, RoleRead, RolePermissionCreate, RolePermissionsBulk, RoleInherit
 from schemas.permission import PermissionCreate, PermissionRead
 
 from dependencies import get_db, get_current_user, get_permission_user
+from core.responses import FastJSONResponse
+from core.latency_budget import budgeted_route
+from core.config import settings
+from core.etag import make_etag, is_not_modified, not_modified, cache_headers
 
 from exceptions.custom_exceptions import RoleAlreadyExistsError, PermissionAlreadyExistsError, RoleGetError, \
-    PermissionGetError
+    PermissionGetError, RoleInheritanceError
 
-router = APIRouter(prefix="/roles")
+router = APIRouter(prefix="/roles", default_response_class=FastJSONResponse,
+                   route_class=budgeted_route(settings.LATENCY_BUDGET_ADMIN))
 
 # ADMIN ROUTERS
 
@@ -31,11 +36,10 @@ async def create_role(data: RoleCreate,
             name=data.name
         )
         role = await service.create_role(role=role)
-        role = role.to_dict()
-        return {
+        return FastJSONResponse({
             "detail": "Role created",
             "data": role
-        }
+        })
     except RoleAlreadyExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
 
@@ -47,12 +51,11 @@ async def create_permission(data: PermissionCreate,
     try:
         service = RolePermissionService(repo=RolePermissionRepository(db=db))
         new_permission = await service.create_permission(entity_name=data.entity_name, permission_type=data.permission_type.value, is_all_attr=data.is_all_attr)
-        permission = new_permission.to_dict()
 
-        return {
+        return FastJSONResponse({
             "detail": "Permission created",
-            "data": permission
-        }
+            "data": new_permission
+        })
     except PermissionAlreadyExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
@@ -66,7 +69,7 @@ async def add_permissions_to_role(data: RolePermissionCreate,
     try:
         service = RolePermissionService(repo=RolePermissionRepository(db=db))
         result = await service.add_permissions_to_role(role_id=data.role_id, permission_ids=data.permission_ids)
-        return result.to_dict()
+        return FastJSONResponse(result)
     except (RoleGetError, PermissionGetError) as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -78,30 +81,89 @@ async def delete_permissions_from_role(data: RolePermissionCreate,
     try:
         service = RolePermissionService(repo=RolePermissionRepository(db=db))
         result = await service.delete_permissions_from_role(role_id=data.role_id, permission_ids=data.permission_ids)
-        return result.to_dict()
+        return FastJSONResponse(result)
     except (RoleGetError, PermissionGetError) as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.post("/permissions/bulk", description="ADMIN")
+async def add_permissions_bulk(data: RolePermissionsBulk,
+                               data_user: CurrentUser = Depends(get_current_user),
+                               db: AsyncSession = Depends(get_db),
+                               permission_user = Depends(get_permission_user(permission_name="role.add_permissions:start"))):
+    service = RolePermissionService(repo=RolePermissionRepository(db=db))
+    links = await service.add_permissions_to_roles(role_ids=data.role_ids, permission_ids=data.permission_ids)
+    return FastJSONResponse({"affected": len(links), "links": links})
+
+@router.delete("/permissions/bulk", description="ADMIN")
+async def delete_permissions_bulk(data: RolePermissionsBulk,
+                                  data_user: CurrentUser = Depends(get_current_user),
+                                  db: AsyncSession = Depends(get_db),
+                                  permission_user = Depends(get_permission_user(permission_name="role.delete_permissions:start"))):
+    service = RolePermissionService(repo=RolePermissionRepository(db=db))
+    links = await service.delete_permissions_from_roles(role_ids=data.role_ids, permission_ids=data.permission_ids)
+    return FastJSONResponse({"affected": len(links), "links": links})
+
+@router.post("/inherit", description="ADMIN")
+async def add_role_parent(data: RoleInherit,
+                          data_user: CurrentUser = Depends(get_current_user),
+                          db: AsyncSession = Depends(get_db),
+                          permission_user = Depends(get_permission_user(permission_name="role:update"))):
+    try:
+        service = RolePermissionService(repo=RolePermissionRepository(db=db))
+        result = await service.add_role_parent(role_id=data.role_id, parent_id=data.parent_id)
+        return FastJSONResponse(result)
+    except RoleGetError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RoleInheritanceError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/inherit", description="ADMIN")
+async def remove_role_parent(data: RoleInherit,
+                             data_user: CurrentUser = Depends(get_current_user),
+                             db: AsyncSession = Depends(get_db),
+                             permission_user = Depends(get_permission_user(permission_name="role:update"))):
+    try:
+        service = RolePermissionService(repo=RolePermissionRepository(db=db))
+        result = await service.remove_role_parent(role_id=data.role_id, parent_id=data.parent_id)
+        return FastJSONResponse(result)
+    except RoleGetError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/permissions", description="ADMIN")
 async def get_permissions(perms: PermissionRead,
+                          request: Request,
                           data_user: CurrentUser = Depends(get_current_user),
                           db: AsyncSession = Depends(get_db),
                           permission_user = Depends(get_permission_user(permission_name="permission:get"))):
     service = RolePermissionService(repo=RolePermissionRepository(db=db))
+
+    etag = make_etag("permissions", await service.catalog_version(), perms.model_dump_json())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     permissions = await service.get_permissions(ids=perms.ids, names=perms.names)
-    response = [permission.to_dict() for permission in permissions]
-    return response
+    return FastJSONResponse(permissions, headers=cache_headers(etag))
 
 @router.get("/", description="ADMIN")
 async def get_roles(roles: RoleRead,
+                    request: Request,
                     data_user: CurrentUser = Depends(get_current_user),
                     db: AsyncSession = Depends(get_db),
                     permission_user = Depends(get_permission_user(permission_name="role:get"))):
     service = RolePermissionService(repo=RolePermissionRepository(db=db))
 
-    roles = await service.get_roles(ids=roles.ids if roles.ids else None,
-                                    names=roles.names if roles.names else None,
-                                    date_from=roles.date_from if roles.date_from else None,
-                                    date_to=roles.date_to if roles.date_to else None)
+    etag = make_etag("roles", await service.catalog_version(), roles.model_dump_json())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    try:
+        page = await service.get_roles_page(ids=roles.ids if roles.ids else None,
+                                            names=roles.names if roles.names else None,
+                                            date_from=roles.date_from if roles.date_from else None,
+                                            date_to=roles.date_to if roles.date_to else None,
+                                            cursor=roles.cursor,
+                                            limit=roles.limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return [role.to_dict() for role in roles]
\ No newline at end of file
+    return FastJSONResponse(page, headers=cache_headers(etag))
\ No newline at end of file
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.stats_repo import StatsRepository
+
+from services.stats_service import StatsService
+
+from dependencies import get_db, get_permission_user
+from core.responses import FastJSONResponse
+from core.latency_budget import budgeted_route
+from core.config import settings
+
+router = APIRouter(prefix="/stats", default_response_class=FastJSONResponse,
+                   route_class=budgeted_route(settings.LATENCY_BUDGET_ADMIN))
+
+
+@router.get("", description="ADMIN")
+async def get_stats(db: AsyncSession = Depends(get_db),
+                    permission_user = Depends(get_permission_user(permission_name="stats:get"))):
+    service = StatsService(StatsRepository(db=db), RolePermissionRepository(db=db))
+    return FastJSONResponse(await service.get_stats())
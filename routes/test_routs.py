@@ -5,8 +5,12 @@ from sqlalchemy import select
 from models import User, Role, Permission
 from database import engine, Base
 from services.auth_service import AuthService
+from services.rbac_catalog import rbac_catalog
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.stats_repo import StatsRepository
+from core.responses import FastJSONResponse
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
 
 async def recreate_all_async(engine: AsyncEngine):
@@ -26,8 +30,10 @@ async def test(db: AsyncSession = Depends(get_db)):
         "role:delete_all", "role:delete", "role:post_all", "role:post",
         "permission:get", "permission:update", "permission:update_all",
         "permission:delete_all", "permission:delete", "permission:post",
-        "user.remove_role:start:start", "user.add_role:start:start",
+        "user.remove_role:start", "user.add_role:start",
         "role.add_permissions:start", "role.delete_permissions:start",
+        "user.import:start", "stats:get", "changes:get",
+        "user:get_profiles",
     ]]
     db.add_all(perms)
     await db.flush()
@@ -50,9 +56,16 @@ async def test(db: AsyncSession = Depends(get_db)):
     )
     db.add(user)
 
+    await db.flush()
+    role_perm_repo = RolePermissionRepository(db)
+    await role_perm_repo.rebuild_rbac()
+    await role_perm_repo.bump_catalog_version()
+    # Сид пишет в таблицы в обход репозиториев, счетчики считаются заново
+    await StatsRepository(db).reconcile()
     await db.commit()
+    rbac_catalog.invalidate()
 
     return {"detail": "Admin created, Roles created, perms created.",
             "email": "admin@admin.com",
-            "password": "admin"}
+            "password": "admin123"}
 
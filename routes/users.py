@@ -1,6 +1,7 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from entities.entities import UserEntity, CurrentUser
@@ -9,20 +10,30 @@ from repositories.session_repo import SessionRepository
 from repositories.role_perm_repo import RolePermissionRepository
 from repositories.user_repo import UserRepository
 
-from schemas.user import UserCreate, UpdateUser, UsersRead, UpdateAllUsers
-from schemas.role import RoleAdd
+from schemas.user import UserCreate, UpdateUser, UsersRead, UpdateAllUsers, ExportFormat, ImportFormat, \
+    UsersBulkDelete, UsersSearch, UsersBatch
+from schemas.role import RoleAdd, UserRolesBulk
 
+from database import AsyncSessionLocal
 from dependencies import get_db, get_current_user, get_permission_user
+from core.responses import FastJSONResponse
+from core.latency_budget import budgeted_route, latency_budget
+from core.config import settings
+from core.etag import make_etag, is_not_modified, not_modified, cache_headers
 
 from services.auth_service import AuthService
 from services.user_service import UserService
+from services.role_service import RolePermissionService
+from services.import_service import UserImportService, parse_rows, iter_lines
 
 from exceptions.custom_exceptions import UserEmailExistsError, SessionDeactivateError, NotFoundError, RoleGetError, \
-    UserGetError
+    UserGetError, UserDeleteError
 
-router = APIRouter(prefix="/user")
+router = APIRouter(prefix="/user", default_response_class=FastJSONResponse,
+                   route_class=budgeted_route(settings.LATENCY_BUDGET_ADMIN))
 
 @router.post("/")
+@latency_budget(settings.LATENCY_BUDGET_AUTH)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     try:
         # В идеале пароль уже хешируется на клиенте, а мы видим только хеш, но для удобства будем находить хеш уже на бэке
@@ -37,13 +48,8 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
             hash_password=user.password
         )
         user =  await service.create_user(user=usr_ent)
-        user = user.to_dict()
-        user.pop("hash_password")
 
-        resp = {}
-        resp["detail"] = "User created"
-        resp['data'] = user
-        return resp
+        return FastJSONResponse({"detail": "User created", "data": user})
     except UserGetError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except RoleGetError as e:
@@ -53,6 +59,7 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
 
 
 @router.patch("/me")
+@latency_budget(settings.LATENCY_BUDGET_AUTH)
 async def update_user(data: UpdateUser,
                       info: CurrentUser = Depends(get_current_user),
                       db: AsyncSession = Depends(get_db),
@@ -68,36 +75,46 @@ async def update_user(data: UpdateUser,
             hash_password=data.password
         )
         user_w_r = await service.update_user(user=user)
-        user_w_r = user_w_r.to_dict()
-        user_w_r["user"].pop("hash_password")
 
-        return user_w_r
+        return FastJSONResponse(user_w_r)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
 
 @router.get("/me")
+@latency_budget(settings.LATENCY_BUDGET_USER)
 async def get_current_user_route(
+    request: Request,
     data: CurrentUser = Depends(get_current_user),
     permission_user = Depends(get_permission_user(permission_name="user:get"))
 ):
-    user = data.user.to_dict()
-    user.pop("hash_password")
-    return user
+    etag = make_etag("me", data.user.id, data.user.updated_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return FastJSONResponse(data.user, headers=cache_headers(etag))
 
 @router.get("/role")
+@latency_budget(settings.LATENCY_BUDGET_USER)
 async def get_current_user_route(
+    request: Request,
     data: CurrentUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     permission_user = Depends(get_permission_user(permission_name="user:get"))
 ):
+    # Выдача и отзыв ролей меняют набор id ролей, изменения самих ролей - версию каталога
+    role_perm_repo = RolePermissionRepository(db)
+    catalog_version = await RolePermissionService(repo=role_perm_repo).catalog_version()
+    role_ids = sorted(map(str, await role_perm_repo.get_user_role_ids(data.user.id)))
+    etag = make_etag("roles", data.user.id, data.user.updated_at, catalog_version, *role_ids)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     service = UserService(UserRepository(db), RolePermissionRepository(db))
     user = await service.get_user_roles(data.user)
-    user = user.to_dict()
-    user.get('user').pop("hash_password")
-    return user
+    return FastJSONResponse(user, headers=cache_headers(etag))
 
 
 @router.delete("/")
+@latency_budget(settings.LATENCY_BUDGET_AUTH)
 async def delete_user(data: CurrentUser = Depends(get_current_user),
                       db: AsyncSession = Depends(get_db),
                       permission_user = Depends(get_permission_user(permission_name="user:delete"))):
@@ -136,11 +153,109 @@ async def get_user(filters: UsersRead = Depends(),
             deleted_from=filters.deleted_from,
             deleted_to=filters.deleted_to,
             role_ids=filters.role_ids,
+            cursor=filters.cursor,
+            limit=filters.limit,
         )
-        return [user.to_dict() for user in users]
+        return FastJSONResponse(users)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except UserGetError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.post("/batch")
+@latency_budget(settings.LATENCY_BUDGET_USER)
+async def get_profiles(data: UsersBatch,
+                       db: AsyncSession = Depends(get_db),
+                       permission_user = Depends(get_permission_user(permission_name="user:get_profiles"))):
+    service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
+    return FastJSONResponse(await service.get_profiles(data.ids))
+
+@router.get("/search", description="ADMIN")
+async def search_users(filters: UsersSearch = Depends(),
+                       db: AsyncSession = Depends(get_db),
+                       permission_user = Depends(get_permission_user(permission_name="user:get_all"))):
+    try:
+        service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
+        users = await service.search_users(query=filters.q, cursor=filters.cursor, limit=filters.limit)
+        return FastJSONResponse(users)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/export", description="ADMIN")
+@latency_budget(None)
+async def export_users(filters: UsersRead = Depends(),
+                       export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+                       token_data: CurrentUser = Depends(get_current_user),
+                       permission_user = Depends(get_permission_user(permission_name="user:get_all"))):
+    del token_data
+    query = dict(
+        ids=filters.ids,
+        emails=[str(email) for email in filters.emails] if filters.emails else None,
+        created_from=filters.created_from,
+        created_to=filters.created_to,
+        updated_from=filters.updated_from,
+        updated_to=filters.updated_to,
+        is_active=filters.is_active,
+        deleted_from=filters.deleted_from,
+        deleted_to=filters.deleted_to,
+        role_ids=filters.role_ids,
+    )
+
+    # Выгрузка идет после ответа на запрос, поэтому у нее своя сессия, а не сессия из get_db
+    async def content():
+        async with AsyncSessionLocal() as session:
+            service = UserService(UserRepository(db=session), RolePermissionRepository(db=session))
+            async for chunk in service.export_users(export_format=export_format.value, **query):
+                yield chunk
+
+    media_type = "text/csv" if export_format == ExportFormat.csv else "application/x-ndjson"
+    return StreamingResponse(
+        content(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{export_format.value}"'}
+    )
+
+@router.post("/import", description="ADMIN")
+@latency_budget(None)
+async def import_users(request: Request,
+                       import_format: ImportFormat = Query(ImportFormat.csv, alias="format"),
+                       token_data: CurrentUser = Depends(get_current_user),
+                       permission_user = Depends(get_permission_user(permission_name="user.import:start"))):
+    del token_data
+    service = UserImportService(session_factory=AsyncSessionLocal)
+    try:
+        rows = parse_rows(iter_lines(request.stream()), import_format.value)
+        report = await service.import_users(rows)
+    except RoleGetError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Файл должен быть в кодировке UTF-8")
+    return FastJSONResponse(report)
+
+@router.post("/bulk-delete", description="ADMIN")
+@latency_budget(None)
+async def bulk_delete_users(filters: UsersBulkDelete,
+                            data: CurrentUser = Depends(get_current_user),
+                            db: AsyncSession = Depends(get_db),
+                            permission_user = Depends(get_permission_user(permission_name="user:delete_all"))
+                            ):
+    try:
+        service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
+
+        report = await service.bulk_delete_users(
+            ids=filters.ids,
+            emails=filters.emails,
+            created_from=filters.created_from,
+            created_to=filters.created_to,
+            updated_from=filters.updated_from,
+            updated_to=filters.updated_to,
+            role_ids=filters.role_ids,
+            exclude_id=data.user.id
+        )
+        return FastJSONResponse({"detail": "Users deleted", "data": report})
+    except UserDeleteError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/remove-role", description="ADMIN")
 async def remove_role(roles: RoleAdd,
                       data: CurrentUser = Depends(get_current_user),
@@ -151,7 +266,7 @@ async def remove_role(roles: RoleAdd,
         service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
 
         result = await service.remove_roles_from_user(user_id=roles.user_id, role_ids=roles.role_ids)
-        return result.to_dict()
+        return FastJSONResponse(result)
     except (RoleGetError, UserGetError) as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -165,10 +280,32 @@ async def add_role(roles: RoleAdd,
         service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
 
         result = await service.add_roles_to_user(user_id=roles.user_id, role_ids=roles.role_ids)
-        return result.to_dict()
+        return FastJSONResponse(result)
     except (RoleGetError, UserGetError) as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.post("/roles/bulk", description="ADMIN")
+async def add_roles_bulk(data: UserRolesBulk,
+                         data_user: CurrentUser = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_db),
+                         permission_user=Depends(get_permission_user(permission_name="user.add_role:start"))
+                         ):
+    service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
+
+    links = await service.add_roles_to_users(user_ids=data.user_ids, role_ids=data.role_ids)
+    return FastJSONResponse({"affected": len(links), "links": links})
+
+@router.delete("/roles/bulk", description="ADMIN")
+async def remove_roles_bulk(data: UserRolesBulk,
+                            data_user: CurrentUser = Depends(get_current_user),
+                            db: AsyncSession = Depends(get_db),
+                            permission_user=Depends(get_permission_user(permission_name="user.remove_role:start"))
+                            ):
+    service = UserService(UserRepository(db=db), RolePermissionRepository(db=db))
+
+    links = await service.remove_roles_from_users(user_ids=data.user_ids, role_ids=data.role_ids)
+    return FastJSONResponse({"affected": len(links), "links": links})
+
 
 @router.patch("/{user_id}", description="ADMIN")
 async def update_user(user_id: str,
@@ -188,10 +325,8 @@ async def update_user(user_id: str,
             hash_password=info_user.password
         )
         user_w_r = await service.update_user(user=user)
-        user_w_r = user_w_r.to_dict()
-        user_w_r["user"].pop("hash_password")
 
-        return user_w_r
+        return FastJSONResponse(user_w_r)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except UserGetError as e:
@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from core.config import settings
+
+
+class ChangesRead(BaseModel):
+    since: Optional[str] = None
+    limit: int = Field(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.CHANGES_PAGE_SIZE_MAX)
@@ -10,6 +10,7 @@ class EnumPermissionType(str, Enum):
     delete = "delete"
     create = "post"
     start = "start"
+    any = "*"
 
 class PermissionCreate(BaseModel):
     entity_name: str
@@ -21,6 +22,8 @@ class PermissionCreate(BaseModel):
     def check_entity_name(cls, v):
         if ":" in v:
             raise ValueError("Название сущности не может содержать символ ':'")
+        if any("*" in segment and segment != "*" for segment in v.split(".")):
+            raise ValueError("Символ '*' может занимать только весь сегмент названия")
         return v
 
 class PermissionRead(BaseModel):
@@ -1,9 +1,11 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
 from uuid import UUID
 from typing import Optional, List
 from fastapi import Query
 
+from core.config import settings
+
 
 class RoleCreate(BaseModel):
     name: str
@@ -16,6 +18,8 @@ class RoleRead(BaseModel):
     names: Optional[List[str]] = Query(None)
     date_from: Optional[datetime] = Query(None)
     date_to: Optional[datetime] = Query(None)
+    cursor: Optional[str] = Query(None)
+    limit: int = Field(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)
 
     @field_validator("names")
     def check_names(cls, v):
@@ -28,4 +32,19 @@ class RoleAdd(BaseModel):
 
 class RolePermissionCreate(BaseModel):
     role_id: UUID
-    permission_ids: List[UUID]
\ No newline at end of file
+    permission_ids: List[UUID]
+
+
+class RoleInherit(BaseModel):
+    role_id: UUID
+    parent_id: UUID
+
+
+class UserRolesBulk(BaseModel):
+    user_ids: List[UUID] = Field(min_length=1)
+    role_ids: List[UUID] = Field(min_length=1)
+
+
+class RolePermissionsBulk(BaseModel):
+    role_ids: List[UUID] = Field(min_length=1)
+    permission_ids: List[UUID] = Field(min_length=1)
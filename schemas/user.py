@@ -1,9 +1,12 @@
 from datetime import datetime
+from enum import Enum
 
 from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
 from typing import Optional, List
 from uuid import UUID
 
+from core.config import settings
+
 class UserCreate(BaseModel):
     first_name: str = Field(..., min_length=3, max_length=20)
     last_name: str = Field(..., min_length=3, max_length=20)
@@ -37,6 +40,9 @@ class UsersRead(BaseModel):
 
     role_ids: Optional[List[UUID]] = None
 
+    cursor: Optional[str] = None
+    limit: int = Field(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)
+
     @model_validator(mode="after")
     def validate_date_ranges(self) -> "UsersRead":
         date_pairs = [
@@ -58,6 +64,46 @@ class UsersRead(BaseModel):
         return self
 
 
+class UsersBatch(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=settings.PROFILE_BATCH_MAX)
+
+
+class UsersSearch(BaseModel):
+    # Короче трех символов триграммный индекс не помогает
+    q: str = Field(..., min_length=3, max_length=100)
+    cursor: Optional[str] = None
+    limit: int = Field(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)
+
+
+class UsersBulkDelete(BaseModel):
+    ids: Optional[List[UUID]] = None
+    emails: Optional[List[EmailStr]] = None
+
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+    updated_from: Optional[datetime] = None
+    updated_to: Optional[datetime] = None
+
+    role_ids: Optional[List[UUID]] = None
+
+    @model_validator(mode="after")
+    def validate_criteria(self) -> "UsersBulkDelete":
+        if not any(value for value in self.model_dump().values()):
+            raise ValueError("Нужно указать хотя бы один критерий отбора пользователей")
+        return self
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class ImportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class UpdateUser(BaseModel):
     first_name: Optional[str] = Field(None, min_length=3, max_length=20)
     last_name: Optional[str] = Field(None, min_length=3, max_length=20)
@@ -0,0 +1,107 @@
+"""
+Сравнение проверки токена через HTTP и gRPC.
+
+Запускается против работающего приложения с GRPC_ENABLED=true (или с
+отдельным manage.py grpc-serve), нужны зависимости из requirements-dev.txt:
+
+    python scripts/bench_auth.py --http http://localhost:8000 --grpc localhost:50051 \\
+        --email admin@admin.com --password admin123 --requests 5000 --concurrency 50
+
+HTTP - GET /user/me: get_current_user и проверка права user:get.
+gRPC - CheckPermissions с тем же правом, по одному вызову и потоком.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import grpc
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grpc_api import auth_pb2, auth_pb2_grpc  # noqa: E402
+
+
+def report(name: str, latencies: list[float], elapsed: float):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<22} {len(latencies) / elapsed:>9.0f} rps   "
+          f"p50 {statistics.median(latencies) * 1000:>7.2f} ms   p99 {p99 * 1000:>7.2f} ms")
+
+
+async def run_concurrently(requests: int, concurrency: int, call) -> tuple[list[float], float]:
+    latencies: list[float] = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for _ in queue:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def bench_http(args, token: str):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.http, limits=limits) as client:
+        async def call():
+            response = await client.get("/user/me", headers=headers)
+            response.raise_for_status()
+        report("HTTP GET /user/me", *await run_concurrently(args.requests, args.concurrency, call))
+
+
+async def bench_grpc(args, token: str):
+    async with grpc.aio.insecure_channel(args.grpc) as channel:
+        stub = auth_pb2_grpc.AuthStub(channel)
+        request = auth_pb2.CheckPermissionsRequest(token=token, permissions=["user:get"])
+
+        async def call():
+            response = await stub.CheckPermissions(request)
+            assert response.valid and response.granted["user:get"], response.error
+        report("gRPC CheckPermissions", *await run_concurrently(args.requests, args.concurrency, call))
+
+        sent: dict[str, float] = {}
+        latencies: list[float] = []
+
+        async def requests():
+            for _ in range(args.requests):
+                request_id = uuid.uuid4().hex
+                sent[request_id] = time.perf_counter()
+                yield auth_pb2.CheckPermissionsRequest(token=token, permissions=["user:get"], request_id=request_id)
+
+        started = time.perf_counter()
+        async for response in stub.CheckPermissionsStream(requests()):
+            latencies.append(time.perf_counter() - sent.pop(response.request_id))
+        report("gRPC stream", latencies, time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="HTTP против gRPC для проверки токена")
+    parser.add_argument("--http", default="http://localhost:8000")
+    parser.add_argument("--grpc", default="localhost:50051")
+    parser.add_argument("--email", default="admin@admin.com")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.http) as client:
+        response = await client.post("/auth/login", json={"email": args.email, "password": args.password,
+                                                          "device": "DESKTOP_APP"})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+    await bench_http(args, token)
+    await bench_grpc(args, token)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from repositories.user_repo import UserRepository
+
+logger = logging.getLogger(__name__)
+
+
+class UserArchiveService:
+    """
+    Перенос давно удаленных пользователей в users_archive.
+
+    Пользователи, удаленные раньше ARCHIVE_RETENTION_DAYS дней назад, переносятся пачками
+    по ARCHIVE_BATCH_SIZE, каждая пачка в своей транзакции. Строки берутся с SKIP LOCKED,
+    поэтому задачу можно запускать одновременно на нескольких воркерах.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def archive_deleted(self,
+                              retention_days: int = settings.ARCHIVE_RETENTION_DAYS,
+                              batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+                              progress: Callable[[int], None] | None = None) -> int:
+        deleted_before = datetime.now() - timedelta(days=retention_days)
+        archived = 0
+        while True:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    moved = await UserRepository(session).archive_deleted(deleted_before, batch_size)
+            archived += moved
+            if progress and moved:
+                progress(archived)
+            if moved < batch_size:
+                return archived
+
+    async def run_periodically(self, interval: float):
+        """Фоновая архивация раз в interval секунд, пока задачу не отменят"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.archive_deleted()
+            except Exception:
+                logger.exception("Ошибка фоновой архивации пользователей")
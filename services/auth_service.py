@@ -6,7 +6,8 @@ import bcrypt
 from uuid import UUID
 from datetime import datetime, timedelta
 
-from entities.entities import SessionEntity
+from database import db_breaker, is_db_unavailable
+from entities.entities import SessionEntity, UserEntity
 from repositories.user_repo import UserRepository
 from repositories.session_repo import SessionRepository
 from exceptions.custom_exceptions import (
@@ -14,14 +15,18 @@ from exceptions.custom_exceptions import (
     SessionCreateError,
     SessionGetError,
     SessionDeactivateError,
+    DatabaseUnavailableError,
 )
 from core.config import settings
+from services.session_snapshot import session_snapshot
 
 
 class AuthService:
     def __init__(self, repo: SessionRepository, user_repo: UserRepository):
         self.repo = repo
         self.user_repo = user_repo
+        # Пользователь последнего get_current_user взят из снимка сессий, а не из базы
+        self.degraded = False
 
     @staticmethod
     def create_jwt(session_id: UUID, scope: str, minutes: int = None, expire_at=None) -> str:
@@ -83,6 +88,16 @@ class AuthService:
         except Exception as e:
             raise UnauthorizedException(f"Неверный токен, {e}")
 
+        if db_breaker.is_open:
+            return self._from_snapshot(session_id)
+        try:
+            return await self._load_current(session_id)
+        except Exception as e:
+            if is_db_unavailable(e):
+                return self._from_snapshot(session_id)
+            raise
+
+    async def _load_current(self, session_id: str) -> tuple[UserEntity, SessionEntity]:
         try:
             session = SessionEntity(id=UUID(session_id))
             session = await self.repo.get_active_by_id(session)
@@ -102,6 +117,16 @@ class AuthService:
 
         return user, session
 
+    def _from_snapshot(self, session_id: str) -> tuple[UserEntity, SessionEntity]:
+        """Проверка сессии по снимку, пока база недоступна"""
+        if not settings.DEGRADED_MODE_ENABLED or not session_snapshot.usable:
+            raise DatabaseUnavailableError("База данных недоступна")
+        found = session_snapshot.get(UUID(session_id))
+        if found is None or found[1].expire_at < datetime.now():
+            raise UnauthorizedException("Сессия закрыта или истекла")
+        self.degraded = True
+        return found
+
 
     async def deactivate_session(self, session: SessionEntity):
         try:
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from core.pagination import encode_cursor, decode_cursor
+from core.responses import dumps
+from entities.entities import PageEntity
+from repositories.change_repo import ChangeLogRepository
+
+# Открытые SSE-потоки этого воркера, событие CHANGES будит их всех
+_waiters: set[asyncio.Event] = set()
+
+
+def _wake(event: Event):
+    for waiter in _waiters:
+        waiter.set()
+
+
+event_bus.subscribe(EventType.CHANGES, _wake)
+event_bus.subscribe(EventType.RESYNC, _wake)
+
+
+class ChangeFeedService:
+    """
+    Лента изменений по курсору.
+
+    Каждое чтение идет в своей короткой транзакции: поток не держит соединение
+    и снимок между опросами. Поток просыпается по событию CHANGES и, на случай
+    строк, которые еще не видны из-за незавершенных транзакций, раз в
+    CHANGES_POLL_INTERVAL секунд.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def get_changes(self, since: str | None, limit: int) -> PageEntity:
+        """Изменения после курсора; next_cursor - курсор для следующего запроса, даже если изменений нет"""
+        key = decode_cursor(since, 2) if since else None
+        async with self.session_factory() as session:
+            items, last = await ChangeLogRepository(session).get(key, limit)
+        return PageEntity(items=items, next_cursor=encode_cursor(*last) if last else None)
+
+    async def stream(self, since: str | None) -> AsyncIterator[bytes]:
+        """SSE: пачка изменений на событие, id события - курсор для Last-Event-ID"""
+        if since:
+            decode_cursor(since, 2)
+        yield b"retry: 3000\n\n"
+
+        waiter = asyncio.Event()
+        _waiters.add(waiter)
+        try:
+            while True:
+                waiter.clear()
+                page = await self.get_changes(since, settings.CHANGES_PAGE_SIZE_MAX)
+                if page.items:
+                    since = page.next_cursor
+                    yield b"id: " + since.encode() + b"\ndata: " + dumps({"items": page.items}) + b"\n\n"
+                    if len(page.items) == settings.CHANGES_PAGE_SIZE_MAX:
+                        continue
+
+                try:
+                    await asyncio.wait_for(waiter.wait(), timeout=settings.CHANGES_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                    yield b": ping\n\n"
+        finally:
+            _waiters.discard(waiter)
+
+    async def prune(self, retention_days: int = settings.CHANGES_RETENTION_DAYS) -> int:
+        async with self.session_factory() as session:
+            async with session.begin():
+                return await ChangeLogRepository(session).prune(datetime.now() - timedelta(days=retention_days))
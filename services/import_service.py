@@ -0,0 +1,233 @@
+import asyncio
+import codecs
+import csv
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Callable, List
+
+import bcrypt
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from entities.entities import UserEntity, ImportErrorEntity, ImportReportEntity
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.user_repo import UserRepository
+from schemas.user import UserCreate
+from services.rbac_catalog import rbac_catalog
+from exceptions.custom_exceptions import RoleGetError
+
+_hash_pool: ProcessPoolExecutor | None = None
+
+HASH_CHUNK_SIZE = 64
+
+
+def _hash_passwords(passwords: List[str]) -> List[str]:
+    return [bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode() for password in passwords]
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=settings.IMPORT_HASH_WORKERS or os.cpu_count())
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Посчитать bcrypt-хеши параллельно в пуле процессов"""
+    loop = asyncio.get_running_loop()
+    pool = get_hash_pool()
+    chunks = [passwords[i:i + HASH_CHUNK_SIZE] for i in range(0, len(passwords), HASH_CHUNK_SIZE)]
+    results = await asyncio.gather(*(loop.run_in_executor(pool, _hash_passwords, chunk) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Разбить поток байт на строки, не держа весь файл в памяти"""
+    # Символ UTF-8 может разойтись по границе кусков, декодер дожидается его окончания
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        tail += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, list[str] | None, str | None]]:
+    """
+    Строки CSV в (номер первой строки, значения, ошибка разбора).
+
+    Поле в кавычках может содержать перевод строки, поэтому запись собирается из
+    строк, пока число кавычек в ней нечетное: по RFC 4180 кавычки бывают только
+    в полях в кавычках, а экранированные удваиваются.
+    """
+    record, start, quotes = [], 0, 0
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not record:
+            if not line.strip():
+                continue
+            start = line_no
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        yield start, next(csv.reader(["\n".join(record)])), None
+        record, quotes = [], 0
+    if record:
+        yield start, None, "Кавычка поля не закрыта до конца файла"
+
+
+async def parse_rows(lines: AsyncIterator[str], import_format: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """Строки файла в (номер строки, данные, ошибка разбора)"""
+    if import_format == "csv":
+        header = None
+        async for line_no, values, error in _csv_records(lines):
+            if error:
+                yield line_no, None, error
+            elif header is None:
+                header = [value.strip() for value in values]
+            elif len(values) != len(header):
+                yield line_no, None, "Число колонок не совпадает с заголовком"
+            else:
+                yield line_no, {key: (value or None) for key, value in zip(header, values)}, None
+        return
+
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_no, None, "Некорректный JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "Ожидается JSON-объект"
+            continue
+        yield line_no, row, None
+
+
+class UserImportService:
+    """
+    Массовый импорт пользователей.
+
+    Строки обрабатываются пачками по IMPORT_BATCH_SIZE, каждая пачка в своей транзакции:
+    валидация, дедупликация по email внутри файла и одним запросом по базе, хеширование
+    паролей в пуле процессов и загрузка пользователей и их ролей через COPY.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def import_users(self,
+                           rows: AsyncIterator[tuple[int, dict | None, str | None]],
+                           progress: Callable[[ImportReportEntity], None] | None = None) -> ImportReportEntity:
+        report = ImportReportEntity()
+        seen_emails = set()
+
+        async with self.session_factory() as session:
+            await rbac_catalog.refresh(RolePermissionRepository(session))
+        default_role = rbac_catalog.role_by_name("user")
+        if default_role is None:
+            raise RoleGetError("Роль user не найдена")
+
+        batch = []
+        async for line_no, row, error in rows:
+            report.total += 1
+            if error:
+                self._add_error(report, line_no, None, error)
+                continue
+            try:
+                data = UserCreate.model_validate(row)
+            except ValidationError as e:
+                detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                self._add_error(report, line_no, row.get("email"), detail)
+                continue
+
+            email = str(data.email).strip().lower()
+            if email in seen_emails:
+                self._add_error(report, line_no, email, "Email повторяется в файле")
+                continue
+            seen_emails.add(email)
+            batch.append((line_no, email, data))
+
+            if len(batch) >= settings.IMPORT_BATCH_SIZE:
+                await self._load_batch(batch, default_role.id, report)
+                batch = []
+                if progress:
+                    progress(report)
+
+        if batch:
+            await self._load_batch(batch, default_role.id, report)
+        if progress:
+            progress(report)
+        return report
+
+    async def _load_batch(self, batch: list, role_id: uuid.UUID, report: ImportReportEntity):
+        async with self.session_factory() as session:
+            existing = await UserRepository(session).get_existing_emails([email for _, email, _ in batch])
+        batch = self._drop_existing(batch, existing, report)
+        if not batch:
+            return
+
+        # Хеширование занимает основное время, поэтому идет без открытой транзакции
+        hashes = await hash_passwords([data.password for _, _, data in batch])
+        now = datetime.now()
+        users = {email: UserEntity(
+            id=uuid.uuid4(),
+            email=email,
+            first_name=data.first_name,
+            last_name=data.last_name,
+            patronymic=data.patronymic,
+            is_active=True,
+            created_at=now,
+            updated_at=now,
+            hash_password=hashed
+        ) for (_, email, data), hashed in zip(batch, hashes)}
+
+        async with self.session_factory() as session:
+            async with session.begin():
+                repo = UserRepository(session)
+                # Повторная проверка уже в транзакции: за время хеширования email мог зарегистрироваться
+                existing = await repo.get_existing_emails(list(users))
+                batch = self._drop_existing(batch, existing, report)
+                if not batch:
+                    return
+                created = [users[email] for _, email, _ in batch]
+
+                await repo.copy_create(created)
+                await RolePermissionRepository(session).copy_user_roles([(user.id, role_id) for user in created])
+
+        report.created += len(created)
+
+    def _drop_existing(self, batch: list, existing: set[str], report: ImportReportEntity) -> list:
+        fresh = []
+        for line_no, email, data in batch:
+            if email in existing:
+                self._add_error(report, line_no, email, "Пользователь с таким email уже существует")
+            else:
+                fresh.append((line_no, email, data))
+        return fresh
+
+    @staticmethod
+    def _add_error(report: ImportReportEntity, line_no: int, email: str | None, detail: str):
+        report.skipped += 1
+        if len(report.errors) < settings.IMPORT_MAX_ERRORS:
+            report.errors.append(ImportErrorEntity(line=line_no, email=email, detail=detail))
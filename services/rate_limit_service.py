@@ -0,0 +1,80 @@
+import logging
+import time
+
+from core.config import settings
+from core.rate_limit import rate_limiter, RateLimitCheck, RateLimitDecision
+from entities.entities import UserEntity, SessionEntity
+from repositories.role_perm_repo import RolePermissionRepository
+from services.rbac_catalog import rbac_catalog
+from services.session_snapshot import session_snapshot
+
+logger = logging.getLogger(__name__)
+
+# До какого момента (time.monotonic) таблица лимитов считается недоступной после ошибки
+_disabled_until = 0.0
+
+
+def _available() -> bool:
+    return settings.RATE_LIMIT_ENABLED and time.monotonic() >= _disabled_until
+
+
+def _disable():
+    global _disabled_until
+    _disabled_until = time.monotonic() + settings.RATE_LIMIT_RETRY_SECONDS
+    logger.exception("Таблица лимитов недоступна, лимиты выключены на %s с", settings.RATE_LIMIT_RETRY_SECONDS)
+
+
+class RateLimitService:
+    """
+    Лимиты запросов к API на пользователя и на сессию.
+
+    Лимит пользователя - наибольший из RATE_LIMIT_ROLE_LIMITS для его ролей или
+    RATE_LIMIT_USER, лимит сессии - RATE_LIMIT_SESSION, оба за
+    RATE_LIMIT_WINDOW_SECONDS. Запрос списывает стоимость маршрута из
+    RATE_LIMIT_ROUTE_COSTS с обоих ключей. Если таблицу лимитов открыть не
+    удалось, запросы пропускаются без лимита RATE_LIMIT_RETRY_SECONDS секунд,
+    потом открыть ее пробуют снова.
+    """
+
+    def __init__(self, role_perm_repo: RolePermissionRepository):
+        self.role_perm_repo = role_perm_repo
+
+    async def _user_limit(self, user: UserEntity, degraded: bool) -> int:
+        if not settings.RATE_LIMIT_ROLE_LIMITS:
+            return settings.RATE_LIMIT_USER
+        if degraded:
+            role_ids = session_snapshot.role_ids.get(user.id, [])
+        else:
+            await rbac_catalog.refresh(self.role_perm_repo)
+            role_ids = await self.role_perm_repo.get_user_role_ids(user.id)
+        limits = [settings.RATE_LIMIT_ROLE_LIMITS[role.name]
+                  for role in (rbac_catalog.roles_by_id.get(role_id) for role_id in role_ids)
+                  if role is not None and role.name in settings.RATE_LIMIT_ROLE_LIMITS]
+        return max(limits, default=settings.RATE_LIMIT_USER)
+
+    async def check(self, user: UserEntity, session: SessionEntity, route: str,
+                    degraded: bool = False) -> RateLimitDecision | None:
+        """Списать запрос к маршруту "МЕТОД /путь"; None, если лимиты выключены или недоступны"""
+        if not _available():
+            return None
+        cost = settings.RATE_LIMIT_ROUTE_COSTS.get(route, 1)
+        window = settings.RATE_LIMIT_WINDOW_SECONDS
+        checks = [
+            RateLimitCheck("user", b"u" + user.id.bytes, await self._user_limit(user, degraded), window, cost),
+            RateLimitCheck("session", b"s" + session.id.bytes, settings.RATE_LIMIT_SESSION, window, cost),
+        ]
+        try:
+            return rate_limiter.acquire(checks)
+        except OSError:
+            _disable()
+            return None
+
+    @staticmethod
+    def throttled() -> dict[str, int]:
+        if not _available():
+            return {}
+        try:
+            return rate_limiter.throttled()
+        except OSError:
+            _disable()
+            return {}
@@ -0,0 +1,91 @@
+"""
+Каталог ролей и прав в памяти процесса.
+
+Роли, права и их связи меняются редко, а читаются на каждой проверке прав и
+регистрации, поэтому процесс держит их копию. Копия помечена версией из таблицы
+catalog_versions: изменения через RolePermissionService поднимают версию, а
+читатели не чаще раза в RBAC_CATALOG_TTL секунд сверяют ее с базой и
+перечитывают каталог только если она изменилась. Имена прав, включая шаблоны
+вида "user:*", компилируются в префиксное дерево: по нему проверка находит ID
+всех выдач, покрывающих право. События RBAC_CHANGED с других воркеров
+заставляют сверить версию сразу, не дожидаясь TTL.
+"""
+import asyncio
+import time
+from typing import Iterable
+from uuid import UUID
+
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from core.permission_trie import PermissionTrie
+from entities.entities import RoleEntity, PermissionEntity
+from repositories.role_perm_repo import RolePermissionRepository
+
+
+class RbacCatalog:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version: int | None = None
+        self.roles_by_id: dict[UUID, RoleEntity] = {}
+        self.roles_by_name: dict[str, RoleEntity] = {}
+        self.permissions_by_id: dict[UUID, PermissionEntity] = {}
+        self._grants = PermissionTrie()
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def refresh(self, repo: RolePermissionRepository, force: bool = False):
+        """Сверить версию с базой и при расхождении перечитать каталог"""
+        if not force and self._is_fresh():
+            return
+
+        async with self._lock:
+            if not force and self._is_fresh():
+                return
+
+            # Версия читается до данных: запись, попавшая между запросами, поднимет ее еще раз
+            version = await repo.get_catalog_version()
+            if force or version != self.version:
+                roles, permissions = await repo.load_catalog()
+                self._load(version, roles, permissions)
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Сверить версию при следующем обращении, не дожидаясь TTL"""
+        self._checked_at = 0.0
+
+    def _load(self, version: int, roles, permissions):
+        self.roles_by_id = {role.id: role for role in roles}
+        self.roles_by_name = {role.name: role for role in roles}
+        self.permissions_by_id = {permission.id: permission for permission in permissions}
+        self._grants = PermissionTrie((permission.name, permission.id) for permission in permissions)
+        self.version = version
+
+    def role_by_name(self, name: str) -> RoleEntity | None:
+        return self.roles_by_name.get(name)
+
+    def grant_ids(self, permission_name: str) -> list[UUID]:
+        """ID прав, выдача любого из которых дает permission_name: само право и подходящие шаблоны"""
+        return self._grants.match(permission_name)
+
+    async def check_user(self, repo: RolePermissionRepository, user_id: UUID,
+                         permission_names: Iterable[str]) -> dict[str, bool]:
+        """Проверить у пользователя сразу несколько прав одним запросом к итоговым правам"""
+        await self.refresh(repo)
+        grants = {name: self.grant_ids(name) for name in permission_names}
+        candidates = list({grant_id for grant_ids in grants.values() for grant_id in grant_ids})
+        held = await repo.granted_among(user_id, candidates) if candidates else set()
+        return {name: any(grant_id in held for grant_id in grant_ids) for name, grant_ids in grants.items()}
+
+
+rbac_catalog = RbacCatalog(ttl=settings.RBAC_CATALOG_TTL)
+
+
+def _on_rbac_changed(event: Event):
+    rbac_catalog.invalidate()
+
+
+event_bus.subscribe(EventType.RBAC_CHANGED, _on_rbac_changed)
+event_bus.subscribe(EventType.RESYNC, _on_rbac_changed)
@@ -2,23 +2,42 @@ from uuid import UUID
 from datetime import datetime
 from typing import List
 
+from core.config import settings
 from repositories.role_perm_repo import RolePermissionRepository
-from entities.entities import RoleEntity, PermissionEntity, RolesWithPermissionsEntity
+from services.rbac_catalog import rbac_catalog
+from entities.entities import RoleEntity, PermissionEntity, RolesWithPermissionsEntity, PageEntity, \
+    RolePermissionLinkEntity, RoleWithParentsEntity
 
 class RolePermissionService:
     def __init__(self, repo: RolePermissionRepository):
         self.repo = repo
 
+    async def _catalog_changed(self):
+        await self.repo.bump_catalog_version()
+        # До коммита refresh прочитал бы старую версию и оставил старый каталог на весь TTL
+        self.repo.after_commit(rbac_catalog.invalidate)
+
+    async def catalog_version(self) -> int:
+        """Версия каталога ролей и прав, меняется при любой его записи"""
+        await rbac_catalog.refresh(self.repo)
+        return rbac_catalog.version
+
     async def create_role(self, role: RoleEntity) -> RoleEntity:
         role.name = role.name.strip().lower()
-        return await self.repo.create_role(role=role)
+        role = await self.repo.create_role(role=role)
+        await self._catalog_changed()
+        return role
 
     async def create_permission(self, entity_name: str, permission_type: str, is_all_attr: bool):
+        if permission_type == "*" and is_all_attr:
+            raise ValueError("Шаблон '*' уже покрывает права с суффиксом _all")
         permission_name = f"{entity_name}:{permission_type}" + ("_all" if is_all_attr else "")
 
         permission = PermissionEntity(name=permission_name)
         permission.name = permission.name.strip().lower()
-        return await self.repo.create_permission(permission=permission)
+        permission = await self.repo.create_permission(permission=permission)
+        await self._catalog_changed()
+        return permission
 
     async def get_roles(self,
                         ids: list[UUID] | None = None,
@@ -29,11 +48,49 @@ class RolePermissionService:
         names = [name.strip().lower() for name in names] if names else None
         return await self.repo.get_roles(ids=ids, names=names, date_from=date_from, date_to=date_to)
 
+    async def get_roles_page(self,
+                             ids: list[UUID] | None = None,
+                             names: list[str] | None = None,
+                             date_from: datetime | None = None,
+                             date_to: datetime | None = None,
+                             cursor: str | None = None,
+                             limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
+
+        names = [name.strip().lower() for name in names] if names else None
+        return await self.repo.get_roles_page(ids=ids, names=names, date_from=date_from, date_to=date_to,
+                                              cursor=cursor, limit=limit)
+
     async def get_permissions(self, ids: List[UUID] | None, names: List[str] | None):
         return await self.repo.get_permissions(ids=ids, names=names)
 
     async def add_permissions_to_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
-        return await self.repo.add_permissions_to_role(role_id=role_id, permission_ids=permission_ids)
+        role = await self.repo.add_permissions_to_role(role_id=role_id, permission_ids=permission_ids)
+        await self._catalog_changed()
+        return role
 
     async def delete_permissions_from_role(self, role_id: UUID, permission_ids: List[UUID]) -> RolesWithPermissionsEntity:
-        return await self.repo.delete_permissions_from_role(role_id=role_id, permission_ids=permission_ids)
+        role = await self.repo.delete_permissions_from_role(role_id=role_id, permission_ids=permission_ids)
+        await self._catalog_changed()
+        return role
+
+    async def add_permissions_to_roles(self, role_ids: List[UUID], permission_ids: List[UUID]) -> List[RolePermissionLinkEntity]:
+        links = await self.repo.add_role_permissions(role_ids=list(set(role_ids)), permission_ids=list(set(permission_ids)))
+        if links:
+            await self._catalog_changed()
+        return links
+
+    async def delete_permissions_from_roles(self, role_ids: List[UUID], permission_ids: List[UUID]) -> List[RolePermissionLinkEntity]:
+        links = await self.repo.remove_role_permissions(role_ids=list(set(role_ids)), permission_ids=list(set(permission_ids)))
+        if links:
+            await self._catalog_changed()
+        return links
+
+    async def add_role_parent(self, role_id: UUID, parent_id: UUID) -> RoleWithParentsEntity:
+        role = await self.repo.add_role_parent(role_id=role_id, parent_id=parent_id)
+        await self._catalog_changed()
+        return role
+
+    async def remove_role_parent(self, role_id: UUID, parent_id: UUID) -> RoleWithParentsEntity:
+        role = await self.repo.remove_role_parent(role_id=role_id, parent_id=parent_id)
+        await self._catalog_changed()
+        return role
@@ -0,0 +1,100 @@
+"""
+Снимок активных сессий для проверки токенов, пока база недоступна.
+
+Раз в DEGRADED_SNAPSHOT_INTERVAL секунд воркер читает активные сессии, их
+пользователей, итоговые права и роли. Если база легла, AuthService проверяет
+access-токен по снимку, а ответ помечается заголовком X-Auth-Degraded.
+Снимок годится не дольше DEGRADED_MAX_STALENESS секунд после последнего
+успешного обновления, дальше проверка честно отвечает 503. Отзыв сессий и
+удаление пользователей, пришедшие по шине, применяются к снимку сразу.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.events import event_bus, Event, EventType
+from entities.entities import SessionEntity, UserEntity
+from repositories.snapshot_repo import SnapshotRepository
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSnapshot:
+    def __init__(self, max_staleness: float):
+        self.max_staleness = max_staleness
+        self.sessions: dict[UUID, SessionEntity] = {}
+        self.users: dict[UUID, UserEntity] = {}
+        self.permissions: dict[UUID, frozenset[UUID]] = {}
+        self.role_ids: dict[UUID, list[UUID]] = {}
+        self.loaded_at: float | None = None
+
+    def load(self, sessions, users, permissions, role_ids):
+        self.sessions, self.users, self.permissions, self.role_ids = sessions, users, permissions, role_ids
+        self.loaded_at = time.monotonic()
+
+    @property
+    def usable(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at <= self.max_staleness
+
+    def get(self, session_id: UUID) -> tuple[UserEntity, SessionEntity] | None:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        user = self.users.get(session.user_id)
+        return (user, session) if user is not None else None
+
+    def has_permission(self, user_id: UUID, permission_ids: Iterable[UUID]) -> bool:
+        held = self.permissions.get(user_id, frozenset())
+        return any(permission_id in held for permission_id in permission_ids)
+
+    def forget_sessions(self, session_ids: Iterable[UUID]):
+        for session_id in session_ids:
+            self.sessions.pop(session_id, None)
+
+    def forget_users(self, user_ids: Iterable[UUID]):
+        user_ids = set(user_ids)
+        for user_id in user_ids:
+            self.users.pop(user_id, None)
+        self.sessions = {session_id: session for session_id, session in self.sessions.items()
+                         if session.user_id not in user_ids}
+
+
+session_snapshot = SessionSnapshot(max_staleness=settings.DEGRADED_MAX_STALENESS)
+
+
+def _on_session_revoked(event: Event):
+    if event.ids is not None:
+        session_snapshot.forget_sessions(UUID(session_id) for session_id in event.ids)
+
+
+def _on_user_deleted(event: Event):
+    if event.ids is not None:
+        session_snapshot.forget_users(UUID(user_id) for user_id in event.ids)
+
+
+event_bus.subscribe(EventType.SESSION_REVOKED, _on_session_revoked)
+event_bus.subscribe(EventType.USER_DELETED, _on_user_deleted)
+
+
+class SessionSnapshotService:
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def refresh(self):
+        async with self.session_factory() as session:
+            async with session.begin():
+                session_snapshot.load(*await SnapshotRepository(session).load())
+
+    async def run_periodically(self, interval: float):
+        """Обновлять снимок раз в interval секунд, пока задачу не отменят"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Не удалось обновить снимок сессий")
+            await asyncio.sleep(interval)
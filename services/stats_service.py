@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Callable
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import latency_budget
+from core.concurrency import concurrency_limiter
+from entities.entities import StatsEntity
+from repositories.role_perm_repo import RolePermissionRepository
+from repositories.stats_repo import StatsRepository, ACTIVE_USERS, ACTIVE_SESSIONS, ROLE_USERS
+from services.rbac_catalog import rbac_catalog
+from services.rate_limit_service import RateLimitService
+
+logger = logging.getLogger(__name__)
+
+
+class StatsService:
+    def __init__(self, repo: StatsRepository, role_perm_repo: RolePermissionRepository):
+        self.repo = repo
+        self.role_perm_repo = role_perm_repo
+
+    async def get_stats(self) -> StatsEntity:
+        """Сводная статистика из счетчиков, без подсчета по таблицам"""
+        totals = await self.repo.totals()
+        await rbac_catalog.refresh(self.role_perm_repo)
+
+        users_per_role = {role.name: 0 for role in rbac_catalog.roles_by_id.values()}
+        active_sessions = {}
+        for name, value in totals.items():
+            if name.startswith(ACTIVE_SESSIONS):
+                active_sessions[name[len(ACTIVE_SESSIONS):]] = value
+            elif name.startswith(ROLE_USERS):
+                role = rbac_catalog.roles_by_id.get(UUID(name[len(ROLE_USERS):]))
+                if role is not None:
+                    users_per_role[role.name] = value
+
+        return StatsEntity(active_users=totals.get(ACTIVE_USERS, 0),
+                           active_sessions=active_sessions,
+                           users_per_role=users_per_role,
+                           throttled=RateLimitService.throttled(),
+                           budget_exceeded={route: dict(kinds) for route, kinds in latency_budget.violations.items()},
+                           concurrency_limit=round(concurrency_limiter.limit, 1),
+                           shed=dict(concurrency_limiter.shed))
+
+
+class StatsReconcileService:
+    """
+    Сверка счетчиков статистики с точными значениями.
+
+    Счетчики расходятся с таблицами при изменениях в обход репозиториев (ручные
+    правки, сид тестовых данных), сверка прибавляет к ним расхождение с полным
+    подсчетом по таблицам. Фоновая сверка пропускает запуск, если другой воркер уже сверяет.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self.session_factory = session_factory
+
+    async def reconcile(self, wait: bool = True) -> int:
+        async with self.session_factory() as session:
+            async with session.begin():
+                return await StatsRepository(session).reconcile(wait=wait)
+
+    async def run_periodically(self, interval: float):
+        """Фоновая сверка раз в interval секунд, пока задачу не отменят"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                drifted = await self.reconcile(wait=False)
+                if drifted:
+                    logger.warning("Исправлено счетчиков статистики: %d", drifted)
+            except Exception:
+                logger.exception("Ошибка сверки счетчиков статистики")
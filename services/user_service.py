@@ -1,11 +1,17 @@
+import csv
+import io
 from datetime import datetime
-from typing import List
+from typing import List, AsyncIterator
 from uuid import UUID
 
 from sqlalchemy.util import await_only
 
-from entities.entities import UserEntity, RoleEntity, UserWithRolesEntity
+from core.config import settings
+from core.responses import dumps
+from entities.entities import UserEntity, RoleEntity, UserWithRolesEntity, PageEntity, UserRoleLinkEntity, \
+    BulkDeleteReportEntity, UserProfileEntity
 from services.auth_service import AuthService
+from services.rbac_catalog import rbac_catalog
 from repositories.role_perm_repo import RolePermissionRepository
 from repositories.user_repo import UserRepository
 from exceptions.custom_exceptions import (
@@ -17,6 +23,9 @@ from exceptions.custom_exceptions import (
     RoleGetError, UserNotHaveRoles
 )
 
+EXPORT_CSV_COLUMNS = ("id", "email", "first_name", "last_name", "patronymic", "is_active",
+                      "created_at", "updated_at", "deleted_at")
+
 
 class UserService:
     def __init__(self, repo: UserRepository, role_perm_repo: RolePermissionRepository):
@@ -65,11 +74,11 @@ class UserService:
 
             new_user = await self.repo.create(user=user)
 
-            user_role = await self.role_perm_repo.get_roles(names=["user"])
-            if not user_role:
+            await rbac_catalog.refresh(self.role_perm_repo)
+            user_role = rbac_catalog.role_by_name("user")
+            if user_role is None:
                 raise RoleGetError("Роль user не найдена")
 
-            user_role = user_role[0].role
             usr = await self.role_perm_repo.set_user_roles(user, [user_role])
 
             return usr
@@ -111,6 +120,21 @@ class UserService:
         except UserDeleteError as e:
             raise Exception(f"Ошибка при удалении пользователя id={user.id}: {e}") from e
 
+    async def bulk_delete_users(self,
+                                ids: List[UUID] | None,
+                                emails: List[str] | None,
+                                created_from: datetime | None,
+                                created_to: datetime | None,
+                                updated_from: datetime | None,
+                                updated_to: datetime | None,
+                                role_ids: List[UUID] | None,
+                                exclude_id: UUID | None = None) -> BulkDeleteReportEntity:
+        emails = [email.strip().lower() for email in emails] if emails else None
+        return await self.repo.bulk_soft_delete(ids=ids, emails=emails,
+                                                created_from=created_from, created_to=created_to,
+                                                updated_from=updated_from, updated_to=updated_to,
+                                                role_ids=role_ids, exclude_id=exclude_id)
+
     async def add_roles_to_user(self, user_id: UUID, role_ids: List[UUID]) -> UserWithRolesEntity:
         usr = await self.repo.get_by_id(user_id)
         if usr is None:
@@ -138,6 +162,12 @@ class UserService:
 
         return await self.role_perm_repo.delete_user_roles(user=usr, roles=[r.role for r in roles])
 
+    async def add_roles_to_users(self, user_ids: List[UUID], role_ids: List[UUID]) -> List[UserRoleLinkEntity]:
+        return await self.role_perm_repo.add_user_roles(user_ids=list(set(user_ids)), role_ids=list(set(role_ids)))
+
+    async def remove_roles_from_users(self, user_ids: List[UUID], role_ids: List[UUID]) -> List[UserRoleLinkEntity]:
+        return await self.role_perm_repo.remove_user_roles(user_ids=list(set(user_ids)), role_ids=list(set(role_ids)))
+
     async def get_all_users(self,
                             ids: List[UUID] | None,
                             emails: List[str] | None,
@@ -148,7 +178,9 @@ class UserService:
                             is_active: bool | None,
                             deleted_from: datetime | None,
                             deleted_to: datetime | None,
-                            role_ids: List[UUID] | None) -> List[UserWithRolesEntity]:
+                            role_ids: List[UUID] | None,
+                            cursor: str | None = None,
+                            limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
         return await self.repo.get(ids=ids,
                                    emails=emails,
                                    created_from=created_from,
@@ -158,5 +190,63 @@ class UserService:
                                    is_active=is_active,
                                    deleted_from=deleted_from,
                                    deleted_to=deleted_to,
-                                   role_ids=role_ids)
-
+                                   role_ids=role_ids,
+                                   cursor=cursor,
+                                   limit=limit)
+
+    async def get_profiles(self, user_ids: List[UUID]) -> List[UserProfileEntity]:
+        """Профили в порядке запроса, неизвестные и удаленные пользователи пропускаются"""
+        user_ids = list(dict.fromkeys(user_ids))
+        profiles = await self.repo.get_profiles(user_ids)
+        return [profiles[user_id] for user_id in user_ids if user_id in profiles]
+
+    async def search_users(self, query: str, cursor: str | None = None,
+                           limit: int = settings.PAGE_SIZE_DEFAULT) -> PageEntity:
+        return await self.repo.search(query=query, cursor=cursor, limit=limit)
+
+    async def export_users(self,
+                           export_format: str,
+                           ids: List[UUID] | None,
+                           emails: List[str] | None,
+                           created_from: datetime | None,
+                           created_to: datetime | None,
+                           updated_from: datetime | None,
+                           updated_to: datetime | None,
+                           is_active: bool | None,
+                           deleted_from: datetime | None,
+                           deleted_to: datetime | None,
+                           role_ids: List[UUID] | None) -> AsyncIterator[bytes]:
+        """Выгрузка пользователей с ролями в NDJSON или CSV, по одному блоку байт на пачку строк"""
+        chunks = self.repo.stream(ids=ids,
+                                  emails=emails,
+                                  created_from=created_from,
+                                  created_to=created_to,
+                                  updated_from=updated_from,
+                                  updated_to=updated_to,
+                                  is_active=is_active,
+                                  deleted_from=deleted_from,
+                                  deleted_to=deleted_to,
+                                  role_ids=role_ids)
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_CSV_COLUMNS + ("roles",))
+            async for users in chunks:
+                for item in users:
+                    user = item.user
+                    writer.writerow([
+                        user.id, user.email, user.first_name, user.last_name, user.patronymic, user.is_active,
+                        user.created_at.isoformat() if user.created_at else None,
+                        user.updated_at.isoformat() if user.updated_at else None,
+                        user.deleted_at.isoformat() if user.deleted_at else None,
+                        ";".join(role.name for role in item.roles),
+                    ])
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            async for users in chunks:
+                yield b"".join(dumps(item) + b"\n" for item in users)
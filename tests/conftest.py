@@ -0,0 +1,50 @@
+"""
+Общие фикстуры тестов.
+
+Юнит-тесты не требуют базы. Тесты через HTTP поднимают приложение целиком на
+отдельной базе из TEST_POSTGRES_URL и пропускаются, если она не задана: маршрут
+/test пересоздает все таблицы, поэтому рабочую базу указывать нельзя.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+if TEST_POSTGRES_URL:
+    os.environ["POSTGRES_URL"] = TEST_POSTGRES_URL
+# Таблица лимитов общая для процессов хоста, тесты не должны делить ее с запущенным сервисом
+os.environ.setdefault("RATE_LIMIT_PATH", os.path.join(tempfile.mkdtemp(), "rate_limit"))
+os.environ.setdefault("GRPC_ENABLED", "false")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def client():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL не задан")
+    from fastapi.testclient import TestClient
+    import main
+
+    main.engine.echo = False
+    with TestClient(main.app) as client:
+        seeded = client.get("/test")
+        assert seeded.status_code == 200, seeded.text
+        client.admin_credentials = {"email": seeded.json()["email"], "password": seeded.json()["password"]}
+        yield client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    response = client.post("/auth/login", json={**client.admin_credentials, "device": "WEB"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,87 @@
+import uuid
+
+from core.pagination import decode_cursor
+
+
+def read_all(client, headers, since: str | None, limit: int = 3) -> tuple[list[dict], list[tuple], str]:
+    """Пройти ленту от since до конца, вернуть изменения, курсоры непустых страниц и последний курсор"""
+    items, cursors = [], []
+    while True:
+        response = client.get("/changes", params={"limit": limit} | ({"since": since} if since else {}),
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        if page["items"]:
+            since = page["next_cursor"]
+            cursors.append(decode_cursor(since, 2))
+        else:
+            # Пустая страница возвращает тот же курсор
+            assert page["next_cursor"] == since
+        items += page["items"]
+        if len(page["items"]) < limit:
+            return items, cursors, since
+
+
+def create_user(client) -> str:
+    response = client.post("/user/", json={"first_name": "Лента", "last_name": "Изменений",
+                                           "email": f"feed-{uuid.uuid4().hex[:8]}@example.com",
+                                           "password": "secret123"})
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["user"]["id"]
+
+
+def test_cursors_only_move_forward(client, admin_headers):
+    create_user(client)
+    items, cursors, _ = read_all(client, admin_headers, None)
+    assert items
+    assert all(earlier < later for earlier, later in zip(cursors, cursors[1:]))
+    assert len({item["id"] for item in items}) == len(items)
+
+
+def test_feed_resumes_from_cursor(client, admin_headers):
+    _, _, since = read_all(client, admin_headers, None)
+
+    empty = client.get("/changes", params={"since": since}, headers=admin_headers).json()
+    assert empty["items"] == []
+    assert empty["next_cursor"] == since
+
+    user_id = create_user(client)
+    items, cursors, last = read_all(client, admin_headers, since)
+    assert user_id in {item["entity_id"] for item in items if item["entity"] == "user"}
+    assert decode_cursor(last, 2) > decode_cursor(since, 2)
+    assert all(cursor > decode_cursor(since, 2) for cursor in cursors)
+
+
+def test_late_commit_is_not_skipped(client, admin_headers):
+    """Транзакция, начавшая запись раньше, но закоммиченная позже, не теряется за курсором"""
+    from database import AsyncSessionLocal
+    from repositories.change_repo import ChangeLogRepository, USER, UPSERT
+
+    _, _, since = read_all(client, admin_headers, None)
+    early_id, late_id = uuid.uuid4(), uuid.uuid4()
+    early = AsyncSessionLocal()
+
+    async def begin_early():
+        await early.begin()
+        await ChangeLogRepository(early).record(USER, UPSERT, [early_id])
+
+    async def commit_late():
+        async with AsyncSessionLocal() as session, session.begin():
+            await ChangeLogRepository(session).record(USER, UPSERT, [late_id])
+
+    async def finish_early():
+        await early.commit()
+        await early.close()
+
+    client.portal.call(begin_early)
+    try:
+        client.portal.call(commit_late)
+        items, _, cursor = read_all(client, admin_headers, since)
+        # Пока ранняя транзакция открыта, поздняя запись не отдается: курсор не перескочит раннюю
+        assert str(late_id) not in {item["entity_id"] for item in items}
+    finally:
+        client.portal.call(finish_early)
+
+    items, _, _ = read_all(client, admin_headers, cursor)
+    assert [item["entity_id"] for item in items if item["entity_id"] in (str(early_id), str(late_id))] \
+        == [str(early_id), str(late_id)]
@@ -0,0 +1,88 @@
+import pytest
+
+from core import circuit_breaker
+from core.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=10.0)
+
+
+def test_opens_after_threshold(breaker):
+    for _ in range(2):
+        breaker.failure()
+        assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count(breaker):
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_retry_after_counts_down(breaker, clock):
+    assert breaker.retry_after() == 0.0
+    for _ in range(3):
+        breaker.failure()
+    assert breaker.retry_after() == 10.0
+    clock[0] += 4
+    assert breaker.retry_after() == 6.0
+
+
+def test_half_open_allows_single_probe(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Пока проба идет, остальные запросы отказываются сразу
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_probe_success_closes(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 10.0
+    clock[0] += 10
+    assert breaker.state == HALF_OPEN
+
+
+def test_stuck_probe_expires(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    assert breaker.allow()
+    clock[0] += 9
+    assert not breaker.allow()
+    # Проба не ответила за reset_timeout: пропускается следующая
+    clock[0] += 1
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
@@ -0,0 +1,87 @@
+import pytest
+
+from core import concurrency
+from core.concurrency import AdaptiveConcurrencyLimiter, route_class
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_limiter(initial: float = 10, shares: dict[str, float] | None = None) -> AdaptiveConcurrencyLimiter:
+    return AdaptiveConcurrencyLimiter(initial=initial, minimum=4, maximum=20, latency_target=0.5,
+                                      backoff=0.5, shares=shares or {"auth": 1.0, "admin": 0.5})
+
+
+def test_slow_response_decreases_limit_once_per_target(clock):
+    limiter = make_limiter()
+    limiter.sample(1.0)
+    assert limiter.limit == 5
+    # Пачка медленных ответов одной перегрузки режет лимит один раз
+    limiter.sample(1.0)
+    assert limiter.limit == 5
+    clock[0] += 0.5
+    limiter.sample(1.0)
+    assert limiter.limit == 4
+
+
+def test_limit_does_not_fall_below_minimum(clock):
+    limiter = make_limiter(initial=5)
+    for _ in range(3):
+        limiter.sample(1.0)
+        clock[0] += 1
+    assert limiter.limit == 4
+
+
+def test_fast_response_increases_limit_only_under_load(clock):
+    limiter = make_limiter()
+    limiter.sample(0.1)
+    assert limiter.limit == 10
+    for _ in range(5):
+        assert limiter.try_acquire("auth")
+    limiter.sample(0.1)
+    assert limiter.limit == pytest.approx(10.1)
+
+
+def test_limit_does_not_grow_above_maximum(clock):
+    limiter = make_limiter(initial=20)
+    for _ in range(20):
+        limiter.try_acquire("auth")
+    limiter.sample(0.1)
+    assert limiter.limit == 20
+
+
+def test_classes_are_shed_by_share():
+    limiter = make_limiter()
+    for _ in range(5):
+        assert limiter.try_acquire("admin")
+    assert not limiter.try_acquire("admin")
+    # Вход еще принимается, пока не занят весь лимит
+    for _ in range(5):
+        assert limiter.try_acquire("auth")
+    assert not limiter.try_acquire("auth")
+    assert limiter.shed == {"admin": 1, "auth": 1}
+
+    limiter.release()
+    assert limiter.in_flight == 9
+    assert limiter.try_acquire("auth")
+
+
+def test_route_class():
+    assert route_class("/auth/login") == "auth"
+    assert route_class("/user/me") == "user"
+    assert route_class("/user/me/sessions") == "admin"
+    assert route_class("/changes/stream") is None
+    assert route_class("/roles/") == "admin"
+
+
+def test_stats_expose_limit_and_shed(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(concurrency.concurrency_limiter, "shed", {"admin": 3})
+    response = client.get("/stats", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    stats = response.json()
+    assert stats["concurrency_limit"] == round(concurrency.concurrency_limiter.limit, 1)
+    assert stats["shed"] == {"admin": 3}
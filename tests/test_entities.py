@@ -0,0 +1,37 @@
+import json
+import uuid
+from datetime import datetime
+
+from core.responses import dumps
+from entities.entities import UserEntity, UserWithRolesEntity, RoleEntity
+
+
+def make_user() -> UserEntity:
+    return UserEntity(id=uuid.uuid4(), email="user@example.com", first_name="Иван", last_name="Иванов",
+                      patronymic=None, is_active=True, created_at=datetime(2024, 1, 1),
+                      updated_at=datetime(2024, 1, 2), hash_password="$2b$12$secret", deleted_at=None)
+
+
+def test_to_public_excludes_hash_password():
+    public = make_user().to_public()
+    assert "hash_password" not in public
+    assert set(public) == set(UserEntity.__public__)
+
+
+def test_to_dict_keeps_all_fields():
+    assert make_user().to_dict()["hash_password"] == "$2b$12$secret"
+
+
+def test_nested_entities_are_serialized_through_to_public():
+    user = make_user()
+    role = RoleEntity.from_row({name: None for name in RoleEntity._fields} | {"name": "admin"})
+    body = json.loads(dumps({"data": UserWithRolesEntity(user=user, roles=[role])}))
+    assert "hash_password" not in body["data"]["user"]
+    assert body["data"]["user"]["id"] == str(user.id)
+    assert body["data"]["roles"][0]["name"] == "admin"
+
+
+def test_from_row_follows_slots_order():
+    row = {name: f"value-{name}" for name in UserEntity._fields}
+    user = UserEntity.from_row(row)
+    assert [getattr(user, name) for name in UserEntity._fields] == list(row.values())
@@ -0,0 +1,78 @@
+from starlette.requests import Request
+
+from core.etag import make_etag, is_not_modified, not_modified
+
+
+def request_with(if_none_match: str | None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_make_etag_is_stable_and_quoted():
+    etag = make_etag("me", 1, "2024-01-01")
+    assert etag == make_etag("me", 1, "2024-01-01")
+    assert etag != make_etag("me", 1, "2024-01-02")
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+def test_if_none_match_comparison():
+    etag = make_etag("x")
+    assert not is_not_modified(request_with(None), etag)
+    assert is_not_modified(request_with(etag), etag)
+    assert is_not_modified(request_with(f'"other", W/{etag}'), etag)
+    assert is_not_modified(request_with("*"), etag)
+    assert not is_not_modified(request_with('"other"'), etag)
+
+
+def test_not_modified_has_no_body_and_keeps_validators():
+    response = not_modified('"abc"')
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"abc"'
+    assert response.headers["vary"] == "Authorization"
+
+
+def test_profile_conditional_get(client, admin_headers):
+    response = client.get("/user/me", headers=admin_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/user/me", headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_role_grant_changes_roles_etag_only(client, admin_headers):
+    me = client.get("/user/me", headers=admin_headers)
+    roles = client.get("/user/role", headers=admin_headers)
+    assert roles.status_code == 200
+    catalog = client.request("GET", "/roles/", headers=admin_headers, json={}).json()["items"]
+    seller = next(item["role"]["id"] for item in catalog if item["role"]["name"] == "seller")
+    user_id = me.json()["id"]
+
+    granted = client.post("/user/roles/bulk", headers=admin_headers,
+                          json={"user_ids": [user_id], "role_ids": [seller]})
+    assert granted.status_code == 200, granted.text
+    try:
+        after = client.get("/user/role", headers={**admin_headers, "If-None-Match": roles.headers["etag"]})
+        assert after.status_code == 200
+        assert seller in {role["id"] for role in after.json()["roles"]}
+        # Профиль не зависит от ролей, выдача роли не трогает строку пользователя
+        profile = client.get("/user/me", headers={**admin_headers, "If-None-Match": me.headers["etag"]})
+        assert profile.status_code == 304
+    finally:
+        client.request("DELETE", "/user/roles/bulk", headers=admin_headers,
+                       json={"user_ids": [user_id], "role_ids": [seller]})
+
+    restored = client.get("/user/role", headers={**admin_headers, "If-None-Match": roles.headers["etag"]})
+    assert restored.status_code == 304
+
+
+def test_catalog_conditional_get(client, admin_headers):
+    response = client.request("GET", "/roles/", headers=admin_headers, json={})
+    etag = response.headers["etag"]
+    assert client.request("GET", "/roles/", headers={**admin_headers, "If-None-Match": etag},
+                          json={}).status_code == 304
+    # Другие параметры - другой ответ
+    assert client.request("GET", "/roles/", headers={**admin_headers, "If-None-Match": etag},
+                          json={"limit": 1}).status_code == 200
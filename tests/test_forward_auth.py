@@ -0,0 +1,115 @@
+import asyncio
+import uuid
+
+import pytest
+
+from core.middleware import ForwardAuthMiddleware, FORWARD_AUTH_PATH
+
+
+class StubForwardAuth(ForwardAuthMiddleware):
+    """Проверка токена без базы: ждет release и отвечает 200 с токеном в заголовке"""
+
+    def __init__(self):
+        super().__init__(app=None, session_factory=None)
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error: Exception | None = None
+
+    async def _check(self, token: str, permission_names: list[str]):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return 200, [(b"x-auth-user-id", token.encode())]
+
+
+def token() -> str:
+    return uuid.uuid4().hex
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_share_one_check():
+    auth, value = StubForwardAuth(), token()
+    tasks = [asyncio.create_task(auth._verdict(value, b"user:get")) for _ in range(3)]
+    await settle()
+    auth.release.set()
+    results = await asyncio.gather(*tasks)
+    assert results == [(200, [(b"x-auth-user-id", value.encode())])] * 3
+    assert auth.calls == 1
+    # Вердикт закеширован
+    assert await auth._verdict(value, b"user:get") == results[0]
+    assert auth.calls == 1 and not auth._inflight
+
+
+@pytest.mark.anyio
+async def test_follower_retries_when_leader_is_cancelled():
+    auth, value = StubForwardAuth(), token()
+    leader = asyncio.create_task(auth._verdict(value, b""))
+    await settle()
+    followers = [asyncio.create_task(auth._verdict(value, b"")) for _ in range(2)]
+    await settle()
+
+    leader.cancel()
+    await settle()
+    # Один из ожидающих повел проверку сам, второй ждет его
+    assert auth.calls == 2 and len(auth._inflight) == 1
+    auth.release.set()
+
+    assert [await follower for follower in followers] == [(200, [(b"x-auth-user-id", value.encode())])] * 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert auth.calls == 2 and not auth._inflight
+
+
+@pytest.mark.anyio
+async def test_cancelled_follower_does_not_cancel_leader():
+    auth, value = StubForwardAuth(), token()
+    leader = asyncio.create_task(auth._verdict(value, b""))
+    await settle()
+    follower = asyncio.create_task(auth._verdict(value, b""))
+    await settle()
+    follower.cancel()
+    await settle()
+    auth.release.set()
+    assert (await leader)[0] == 200
+    assert auth.calls == 1
+
+
+@pytest.mark.anyio
+async def test_error_is_shared_but_not_cached():
+    auth, value = StubForwardAuth(), token()
+    auth.error = RuntimeError("сбой")
+    tasks = [asyncio.create_task(auth._verdict(value, b"")) for _ in range(2)]
+    await settle()
+    auth.release.set()
+    assert await asyncio.gather(*tasks) == [(500, [])] * 2
+    assert auth.calls == 1
+
+    auth.error = None
+    assert (await auth._verdict(value, b""))[0] == 200
+    assert auth.calls == 2
+
+
+@pytest.mark.anyio
+async def test_asgi_response():
+    auth, value = StubForwardAuth(), token()
+    auth.release.set()
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": FORWARD_AUTH_PATH, "method": "GET",
+             "headers": [(b"authorization", f"Bearer {value}".encode())]}
+    await auth(scope, None, send)
+    assert sent[0]["status"] == 200
+    assert (b"x-auth-user-id", value.encode()) in sent[0]["headers"]
+
+    sent.clear()
+    await auth({**scope, "headers": []}, None, send)
+    assert sent[0]["status"] == 401
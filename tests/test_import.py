@@ -0,0 +1,73 @@
+import pytest
+
+from services.import_service import iter_lines, parse_rows
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("size", [1, 3, 7, 1 << 16])
+async def test_multibyte_character_split_across_chunks(size):
+    data = "email,first_name\r\nivan@example.com,Иван\r\npetr@example.com,Пётр".encode()
+    assert await collect(iter_lines(chunked(data, size))) == [
+        "email,first_name", "ivan@example.com,Иван", "petr@example.com,Пётр"]
+
+
+@pytest.mark.anyio
+async def test_invalid_utf8_is_rejected():
+    with pytest.raises(UnicodeDecodeError):
+        await collect(iter_lines(chunked("Иван".encode("cp1251"), 2)))
+
+
+@pytest.mark.anyio
+async def test_truncated_character_at_end_is_rejected():
+    with pytest.raises(UnicodeDecodeError):
+        await collect(iter_lines(chunked("Иван".encode()[:-1], 3)))
+
+
+async def csv_rows(text: str) -> list:
+    return await collect(parse_rows(iter_lines(chunked(text.encode(), 5)), "csv"))
+
+
+@pytest.mark.anyio
+async def test_quoted_field_spans_lines():
+    rows = await csv_rows('email,first_name,last_name\n'
+                          'a@example.com,"Анна\nМария","О""Нил"\n'
+                          '\n'
+                          'b@example.com,Борис,Петров\n')
+    assert rows == [
+        (2, {"email": "a@example.com", "first_name": "Анна\nМария", "last_name": 'О"Нил'}, None),
+        (5, {"email": "b@example.com", "first_name": "Борис", "last_name": "Петров"}, None),
+    ]
+
+
+@pytest.mark.anyio
+async def test_quoted_field_keeps_blank_lines():
+    rows = await csv_rows('email,note\na@example.com,"первая\n\nтретья"\n')
+    assert rows == [(2, {"email": "a@example.com", "note": "первая\n\nтретья"}, None)]
+
+
+@pytest.mark.anyio
+async def test_csv_row_errors():
+    rows = await csv_rows('email,first_name\na@example.com\nb@example.com,"Борис\n')
+    assert rows == [
+        (2, None, "Число колонок не совпадает с заголовком"),
+        (3, None, "Кавычка поля не закрыта до конца файла"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_json_lines():
+    lines = iter_lines(chunked('{"email": "a@example.com"}\n\n[1]\nnot json\n'.encode(), 4))
+    assert await collect(parse_rows(lines, "json")) == [
+        (1, {"email": "a@example.com"}, None),
+        (3, None, "Ожидается JSON-объект"),
+        (4, None, "Некорректный JSON"),
+    ]
@@ -0,0 +1,125 @@
+import asyncio
+import uuid
+
+import asyncpg
+import httpx
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
+
+from core import latency_budget
+from core.latency_budget import budgeted_route, latency_budget as budget, is_statement_timeout
+
+
+def make_app(outcomes: list[str], dependency=None) -> FastAPI:
+    async def transaction():
+        try:
+            yield
+            outcomes.append("commit")
+        except Exception:
+            outcomes.append("rollback")
+            raise
+
+    router = APIRouter(route_class=budgeted_route(0.05))
+
+    @router.get("/slow", dependencies=[Depends(dependency or transaction)])
+    async def slow():
+        await asyncio.sleep(0.5)
+        return {"ok": True}
+
+    @router.get("/fast", dependencies=[Depends(dependency or transaction)])
+    async def fast():
+        return {"ok": True}
+
+    @router.get("/unbudgeted", dependencies=[Depends(dependency or transaction)])
+    @budget(None)
+    async def unbudgeted():
+        await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+async def call(app: FastAPI, path: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path)
+
+
+@pytest.mark.anyio
+async def test_timeout_rolls_back():
+    outcomes = []
+    before = latency_budget.violations["GET /slow"][latency_budget.TIMEOUT]
+    response = await call(make_app(outcomes), "/slow")
+    assert response.status_code == 504
+    assert outcomes == ["rollback"]
+    assert latency_budget.violations["GET /slow"][latency_budget.TIMEOUT] == before + 1
+
+
+@pytest.mark.anyio
+async def test_within_budget_commits():
+    outcomes = []
+    response = await call(make_app(outcomes), "/fast")
+    assert response.status_code == 200
+    assert outcomes == ["commit"]
+
+
+@pytest.mark.anyio
+async def test_endpoint_without_budget():
+    outcomes = []
+    response = await call(make_app(outcomes), "/unbudgeted")
+    assert response.status_code == 200
+    assert outcomes == ["commit"]
+
+
+def test_is_statement_timeout_follows_cause_chain():
+    canceled = asyncpg.QueryCanceledError("canceling statement due to statement timeout")
+    try:
+        try:
+            raise canceled
+        except asyncpg.QueryCanceledError as e:
+            raise RuntimeError("обертка") from e
+    except RuntimeError as e:
+        wrapped = e
+    assert is_statement_timeout(canceled)
+    assert is_statement_timeout(wrapped)
+    assert is_statement_timeout(DBAPIError("SELECT 1", {}, canceled))
+    assert not is_statement_timeout(RuntimeError("другое"))
+    assert not is_statement_timeout(None)
+
+
+@pytest.mark.parametrize("path, status", [("/timeout", 504), ("/statement", 503)])
+def test_budget_violation_rolls_back_db_transaction(client, path, status):
+    """Настоящий get_db: запись, сделанная до превышения бюджета, не коммитится"""
+    from database import get_db, AsyncSessionLocal
+    from models import Role
+
+    name = f"budget-{uuid.uuid4().hex[:8]}"
+    router = APIRouter(route_class=budgeted_route(0.2))
+
+    @router.get("/timeout")
+    async def timeout(db=Depends(get_db)):
+        db.add(Role(name=name))
+        await db.flush()
+        await asyncio.sleep(1)
+
+    @router.get("/statement")
+    async def statement(db=Depends(get_db)):
+        db.add(Role(name=name))
+        await db.flush()
+        await db.execute(text("SELECT pg_sleep(1)"))
+
+    app = FastAPI()
+    app.include_router(router)
+
+    async def scenario():
+        response = await call(app, path)
+        async with AsyncSessionLocal() as session:
+            saved = await session.scalar(select(Role).where(Role.name == name))
+        return response, saved
+
+    response, saved = client.portal.call(scenario)
+    assert response.status_code == status
+    assert saved is None
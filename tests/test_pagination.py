@@ -0,0 +1,58 @@
+import base64
+import uuid
+from datetime import datetime
+
+import pytest
+
+from core.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip_keeps_types():
+    created_at, user_id = datetime(2024, 5, 1, 12, 30, 15, 123456), uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, user_id), 2) == (created_at, user_id)
+    assert decode_cursor(encode_cursor(0.75, created_at, user_id), 3) == (0.75, created_at, user_id)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 5, 1), uuid.uuid4())
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", encode_cursor(1, 2, 3), encode_cursor("x")[:-3]])
+def test_bad_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
+
+
+def test_bad_cursor_value_raises_value_error():
+    cursor = base64.urlsafe_b64encode(b'[["dt","not-a-date"],["uuid","not-a-uuid"]]').decode()
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
+
+
+def test_user_pages_cover_all_users_once(client, admin_headers):
+    for number in range(5):
+        response = client.post("/user/", json={"first_name": "Тест", "last_name": "Страницы",
+                                               "email": f"page{number}-{uuid.uuid4().hex[:8]}@example.com",
+                                               "password": "secret123"})
+        assert response.status_code == 200, response.text
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        response = client.get("/user/all", params=params, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen += [item["user"]["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen)) >= 6
+
+
+def test_user_page_with_bad_cursor_is_400(client, admin_headers):
+    response = client.get("/user/all", params={"cursor": "garbage"}, headers=admin_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Некорректный курсор"
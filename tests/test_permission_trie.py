@@ -0,0 +1,36 @@
+import pytest
+
+from core.permission_trie import PermissionTrie, split_permission
+
+
+def test_split_keeps_separators():
+    assert split_permission("user.add_role:start") == ["user", ".add_role", ":start"]
+    assert split_permission("user:*") == ["user", ":*"]
+
+
+@pytest.mark.parametrize("grant, name, covered", [
+    ("user:get", "user:get", True),
+    ("user:get", "user:get_all", False),
+    ("user:*", "user:get", True),
+    ("user:*", "user:get_all", True),
+    ("user:*", "role:get", False),
+    ("user.*:start", "user.add_role:start", True),
+    ("user.*:start", "user.add_role:stop", False),
+    # "*" совпадает ровно с одним сегментом с тем же разделителем
+    ("user:*", "user.add_role:start", False),
+    ("user.*:start", "user:start", False),
+    ("*:get", "role:get", True),
+])
+def test_wildcard_matching(grant, name, covered):
+    assert PermissionTrie([(grant, True)]).covers(name) is covered
+
+
+def test_match_returns_values_of_every_covering_grant():
+    trie = PermissionTrie([("user:get", 1), ("user:*", 2), ("*:get", 3), ("role:*", 4)])
+    assert sorted(trie.match("user:get")) == [1, 2, 3]
+    assert trie.match("product:delete") == []
+
+
+def test_same_name_keeps_all_values():
+    trie = PermissionTrie([("user:*", "a"), ("user:*", "b")])
+    assert trie.match("user:get") == ["a", "b"]
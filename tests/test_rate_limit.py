@@ -0,0 +1,107 @@
+import fcntl
+import os
+
+import pytest
+
+from core import rate_limit
+from core.rate_limit import SharedRateLimiter, RateLimitCheck
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return SharedRateLimiter(str(tmp_path / "table"), slots=64)
+
+
+SECOND = 1_000_000_000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_760_000_000_123_456_789]
+    monkeypatch.setattr(rate_limit.time, "time_ns", lambda: now[0])
+    return now
+
+
+def check(key: bytes, limit: int = 5, window: float = 10.0, cost: int = 1, kind: str = "user"):
+    return RateLimitCheck(kind, key, limit, window, cost)
+
+
+def test_burst_up_to_limit_then_deny(limiter, clock):
+    decisions = [limiter.acquire([check(b"a")]) for _ in range(6)]
+    assert [decision.allowed for decision in decisions] == [True] * 5 + [False]
+    assert [decision.remaining for decision in decisions[:5]] == [4, 3, 2, 1, 0]
+    # Одна единица возвращается через window / limit
+    assert decisions[-1].retry_after == pytest.approx(2.0)
+    assert decisions[-1].headers()["Retry-After"] == "2"
+
+
+@pytest.mark.parametrize("limit, window", [(3, 10.0), (7, 60.0), (300, 60.0)])
+def test_full_burst_with_inexact_interval(limiter, clock, limit, window):
+    decisions = [limiter.acquire([check(b"a", limit=limit, window=window)]) for _ in range(limit + 1)]
+    assert [decision.allowed for decision in decisions] == [True] * limit + [False]
+    assert [decision.remaining for decision in decisions[:-1]] == list(range(limit - 1, -1, -1))
+
+
+def test_capacity_recovers_over_time(limiter, clock):
+    for _ in range(5):
+        assert limiter.acquire([check(b"a")]).allowed
+    clock[0] += 2 * SECOND
+    assert limiter.acquire([check(b"a")]).allowed
+    assert not limiter.acquire([check(b"a")]).allowed
+    clock[0] += 10 * SECOND
+    assert limiter.acquire([check(b"a")]).remaining == 4
+
+
+def test_keys_are_independent(limiter, clock):
+    for _ in range(5):
+        limiter.acquire([check(b"a")])
+    assert not limiter.acquire([check(b"a")]).allowed
+    assert limiter.acquire([check(b"b")]).allowed
+
+
+def test_cost_is_charged(limiter, clock):
+    assert limiter.acquire([check(b"a", cost=4)]).remaining == 1
+    assert not limiter.acquire([check(b"a", cost=2)]).allowed
+
+
+def test_all_or_nothing(limiter, clock):
+    for _ in range(2):
+        limiter.acquire([check(b"session", limit=2, kind="session")])
+    denied = limiter.acquire([check(b"user"), check(b"session", limit=2, kind="session")])
+    assert not denied.allowed and denied.kind == "session"
+    # Отказ по сессии не списал запрос с пользователя
+    assert limiter.acquire([check(b"user")]).remaining == 4
+    assert limiter.throttled() == {"user": 0, "session": 1}
+
+
+def test_strictest_key_decides(limiter, clock):
+    decision = limiter.acquire([check(b"user", limit=10), check(b"session", limit=3, kind="session")])
+    assert decision.allowed and decision.kind == "session" and decision.remaining == 2
+
+
+def test_table_is_shared_between_instances(limiter, clock):
+    other = SharedRateLimiter(limiter.path, slots=1024)
+    for _ in range(5):
+        limiter.acquire([check(b"a")])
+    assert not other.acquire([check(b"a")]).allowed
+    # Размер берется из заголовка уже созданной таблицы
+    assert other.slots == 64
+
+
+def test_busy_table_skips_limit(limiter, clock, monkeypatch):
+    limiter.acquire([check(b"a")])
+
+    def busy(fd, operation):
+        if operation & fcntl.LOCK_NB:
+            raise BlockingIOError
+        return real_lockf(fd, operation)
+
+    real_lockf = fcntl.lockf
+    monkeypatch.setattr(rate_limit.fcntl, "lockf", busy)
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda seconds: None)
+    assert limiter.acquire([check(b"a")]) is None
+
+
+def test_missing_directory_raises_os_error(tmp_path):
+    with pytest.raises(OSError):
+        SharedRateLimiter(os.path.join(tmp_path, "missing", "table"), slots=64).acquire([check(b"a")])